@@ -1,25 +1,38 @@
 import csv
-import os
-import sys
 import glob
+import os
 import json
 import uuid
+import itertools
 import threading
-import subprocess
 import requests
-import docker
 import time
+from collections import defaultdict, deque
 from datetime import datetime
 
+import numpy as np
 from flask import (
     Flask, render_template, request,
-    send_from_directory, jsonify
+    send_from_directory, jsonify, Response
+)
+
+from compare import compare
+from downsample import METHODS, select_indices, window
+from flows import build_simulation, deploy_tabs, simulation_stats
+from jobstore import JobStore
+from regression import TESTS, compare_samples, compare_values
+from monitoring import MonitoringService
+from recorder import COLUMNS, iter_csv, read_records, to_parquet
+from results_cache import ResultsCache, read_csv_lines
+from step_pool import StepPool
+from series_store import (
+    PARQUET, is_parquet, parquet_available, read_metrics, read_series, series_path, to_csv
 )
 
 app = Flask(__name__)
 
 # Node-RED Admin API URL
-NODE_RED_URL = 'http://localhost:1880'
+NODE_RED_URL = os.environ.get('NODE_RED_URL', 'http://localhost:1880')
 
 # Broker container IDs
 BROKER_IDS = {
@@ -32,439 +45,401 @@ BROKER_IDS = {
     'vernemq': '637ccaec617e7b403f984ec4f8c6961aebb995f024db451a1de94eb94c3723ea'
 }
 
+# evaluation_scripts/reference_broker.py, started by hand on the job's port;
+# it has no container, so its runs are not resource-monitored
+REFERENCE_BROKER = 'reference'
+
+# Where the evaluation scripts find the brokers
+BROKER_HOST = os.environ.get('BROKER_HOST', 'localhost')
+
 # Directories
 RESULTS_DIR = os.path.join(app.root_path, 'results')
 LOGS_DIR = os.path.join(app.root_path, 'logs')
 os.makedirs(RESULTS_DIR, exist_ok=True)
 os.makedirs(LOGS_DIR, exist_ok=True)
 
-# Job tracking
-job_status = {}  # job_id -> {'step1':..., 'step2':..., 'step3':..., 'monitoring':...}
+# Live state of running jobs: job_id -> {'step1':..., ..., 'step5':..., 'monitoring':...}.
+# Finished jobs are dropped after JOB_RETENTION seconds and served from job_store.
+job_status = {}
+JOB_RETENTION = 600
 
-def new_id():
-    return uuid.uuid4().hex[:8]
+# Every job's parameters, step timings and result files, kept across restarts
+job_store = JobStore(os.path.join(RESULTS_DIR, 'jobs.db'))
 
-def monitor_container_stats(container_id, csv_path, stop_event):
-    """Monitor Docker container stats and write to CSV until stop_event is set"""
-    try:
-        client = docker.from_env()
-        container = client.containers.get(container_id)
-        
-        with open(csv_path, 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(['timestamp', 'cpu_percent', 'mem_usage', 'mem_limit',
-                           'net_rx', 'net_tx', 'block_read', 'block_write'])
-            
-            stats_gen = container.stats(stream=True, decode=True)
-            
-            while not stop_event.is_set():
-                try:
-                    stats = next(stats_gen)
-                    
-                    # Calculate CPU percentage with error handling
-                    cpu_stats = stats.get('cpu_stats', {})
-                    precpu_stats = stats.get('precpu_stats', {})
-                    
-                    cpu_delta = cpu_stats.get('cpu_usage', {}).get('total_usage', 0) - \
-                              precpu_stats.get('cpu_usage', {}).get('total_usage', 0)
-                    system_delta = cpu_stats.get('system_cpu_usage', 0) - \
-                                 precpu_stats.get('system_cpu_usage', 0)
-                    
-                    cpu_percent = (cpu_delta / system_delta) * 100 if system_delta != 0 else 0
-                    
-                    # Memory metrics with error handling
-                    memory_stats = stats.get('memory_stats', {})
-                    mem_usage = memory_stats.get('usage', 0)
-                    mem_limit = memory_stats.get('limit', 0)
-                    
-                    # Network metrics with error handling
-                    networks = stats.get('networks', {})
-                    net_rx = sum(net.get('rx_bytes', 0) for net in networks.values())
-                    net_tx = sum(net.get('tx_bytes', 0) for net in networks.values())
-                    
-                    # Block I/O metrics with error handling
-                    blkio_stats = stats.get('blkio_stats', {}).get('io_service_bytes_recursive', [])
-                    block_read = sum(blk.get('value', 0) for blk in blkio_stats if blk.get('op') == 'Read')
-                    block_write = sum(blk.get('value', 0) for blk in blkio_stats if blk.get('op') == 'Write')
-                    
-                    # Write metrics
-                    timestamp = datetime.now().isoformat()
-                    writer.writerow([
-                        timestamp,
-                        round(cpu_percent, 2),
-                        mem_usage,
-                        mem_limit,
-                        net_rx,
-                        net_tx,
-                        block_read,
-                        block_write
-                    ])
-                    csvfile.flush()
-                except (StopIteration, KeyError, ZeroDivisionError) as e:
-                    print(f"Error processing stats: {str(e)}")
-                    time.sleep(1)
-                    continue
-                except Exception as e:
-                    print(f"Critical error: {str(e)}")
-                    break
-    except Exception as e:
-        print(f"Monitoring setup failed: {str(e)}")
-    finally:
-        stop_event.set()
+# One sampler thread for every monitored container, whichever job it belongs to
+monitor_service = MonitoringService()
+
+# Held while a job is loading a broker, so two jobs never load the same one
+broker_locks = defaultdict(threading.Lock)
+
+# Evaluation scripts run in these pre-imported worker processes
+step_pool = StepPool(os.path.join(app.root_path, 'evaluation_scripts'), int(os.environ.get('STEP_WORKERS', 2)))
+
+# Running steps per job, so /abort can stop them
+job_procs = defaultdict(set)
+job_procs_lock = threading.Lock()
+
+# Exit status of a script whose load generator saturated (see evaluation_scripts/harness.py)
+SATURATED_EXIT = 3
+
+# Parsed result files, shared by all results-page requests
+results_cache = ResultsCache()
+
+def resource_paths(broker_name, job_id):
+    """(binary recording, compacted Parquet, legacy/exported CSV) paths for a job's resource samples"""
+    base = os.path.join(RESULTS_DIR, f'resource_usage_{broker_name}_{job_id}')
+    return base + '.bin', base + PARQUET, base + '.csv'
+
+def compact_recording(bin_path, broker_name):
+    """
+    Rewrite a finished resource recording as Parquet when pyarrow is
+    installed, removing the binary file; returns the path that was kept.
+    """
+    if not parquet_available() or not os.path.exists(bin_path):
+        return bin_path
+    out = to_parquet(bin_path, bin_path[:-len('.bin')] + PARQUET, broker_name)
+    os.remove(bin_path)
+    return out
+
+def load_resource_samples(broker_name, job_id):
+    """
+    Resource samples for a job as dicts keyed like the CSV columns, with
+    epoch-second timestamps.  Reads the binary recording, falling back to
+    the per-row CSV written by older runs.
+    """
+    bin_path, _, csv_path = resource_paths(broker_name, job_id)
+    if os.path.exists(bin_path):
+        # The recording may still be growing; only its new tail is parsed
+        records = results_cache.load_appended(bin_path, read_records, [])
+    else:
+        records = results_cache.load(csv_path, parse_resource_csv, [])
+    return [dict(zip(COLUMNS, r)) for r in records]
+
+def parse_resource_csv(path):
+    """Records (in recorder column order) from a resource CSV written by older runs"""
+    records = []
+    with open(path) as f:
+        for row in csv.DictReader(f):
+            try:
+                records.append((
+                    datetime.fromisoformat(row['timestamp']).timestamp(),
+                    *(float(row[k]) for k in COLUMNS[1:-1]),
+                    float(row['open_fds']) if row.get('open_fds') else None
+                ))
+            except (KeyError, ValueError):
+                continue
+    return records
 
 @app.route('/deploy_simulation', methods=['POST'])
 def deploy_simulation():
     spec = request.get_json()
+    try:
+        tabs = build_simulation(spec)
+    except ValueError as e:
+        return str(e), 400
+    estimate = simulation_stats(spec, tabs)
+    if spec.get('dry_run'):
+        return jsonify(ok=True, **estimate)
 
-    broker_host = spec.get('broker_name', 'localhost')
-    broker_port = str(spec.get('broker_port', 1883))
-    broker_config_id = new_id()  # Generate new ID for each deployment
+    # Push only the Sim-* tabs whose generated content changed
+    try:
+        summary = deploy_tabs(NODE_RED_URL, tabs)
+    except requests.HTTPError as e:
+        return e.response.text, 500
+    except requests.RequestException as e:
+        return str(e), 500
 
-    # 1) Fetch all existing flows
-    all_nodes = requests.get(f'{NODE_RED_URL}/flows').json()
+    return jsonify(ok=True, **estimate, **summary)
 
-    # 2) Identify components to remove
-    sim_tabs = {
-        n['id'] for n in all_nodes
-        if n.get('type') == 'tab' and n.get('label','').startswith('Sim-')
-    }
+def annotate_hold_plateaus(hold_csv, resource_samples):
+    """
+    Add per-session memory and file-descriptor cost to a hold-mode plateau
+    CSV, using the resource samples recorded while each plateau was held.
+    The baseline is the last sample taken before the first plateau started.
+    """
+    if not os.path.exists(hold_csv):
+        return
+    samples = [(s['timestamp'], s['mem_usage'], s['open_fds']) for s in resource_samples]
+    with open(hold_csv) as f:
+        lines = f.read().splitlines()
+    header = lines[0].split(',')
+    if not samples or 'Mem_Per_Conn_Bytes' in header:
+        return
+    start_col, end_col, live_col = (header.index(c) for c in
+                                    ('Start_Epoch', 'End_Epoch', 'Live_Sessions'))
 
-    # Remove ALL existing MQTT brokers regardless of origin
-    flows = [
-        n for n in all_nodes
-        if not (n.get('type') == 'mqtt-broker' 
-        and n.get('name') in {'nanomq', 'mosquitto', 'emqx', 'rabbitmq', 'activemq', 'vernemq'})  # Add other broker names
-    ]
+    plateau_rows = []
+    for line in lines[1:]:
+        if not line:
+            break
+        plateau_rows.append(line.split(','))
+    first_start = float(plateau_rows[0][start_col]) if plateau_rows else 0
+    before = [s for s in samples if s[0] < first_start] or samples[:1]
+    base_mem, base_fds = before[-1][1], before[-1][2]
 
-    # 3) Build new flows list:
-    flows = []
-    for n in all_nodes:
-        if n.get('type') == 'tab' and n['id'] in sim_tabs:
-            continue
-        if n.get('z') in sim_tabs:
-            continue
-        if n.get('type') == 'mqtt-broker':
-            continue  # Remove ALL existing brokers
-        flows.append(n)
-
-    # 4) Add new broker configuration
-    flows.append({
-        "id":             broker_config_id,
-        "type":           "mqtt-broker",
-        "name":           broker_host,
-        "broker":         broker_host,
-        "port":           broker_port,
-        "clientid":       "",
-        "autoConnect":    True,
-        "usetls":         False,
-        "protocolVersion": 4,
-        "keepalive":      60,
-        "cleansession":   True,
-        "sim_generated":  True  # Mark for future cleanup
-    })
+    out = [','.join(header + ['Mem_Per_Conn_Bytes', 'FDs_Per_Conn'])]
+    for row in plateau_rows:
+        start, end, live = float(row[start_col]), float(row[end_col]), int(row[live_col])
+        window = [s for s in samples if start <= s[0] <= end]
+        mem_per = fds_per = ''
+        if window and live:
+            mem_per = f"{(sum(s[1] for s in window) / len(window) - base_mem) / live:.1f}"
+            fds = [s[2] for s in window if s[2] is not None]
+            if fds and base_fds is not None:
+                fds_per = f"{(sum(fds) / len(fds) - base_fds) / live:.3f}"
+        out.append(','.join(row + [mem_per, fds_per]))
+    out.extend(lines[len(plateau_rows) + 1:])
+    with open(hold_csv, 'w') as f:
+        f.write('\n'.join(out) + '\n')
 
-    # Create Publisher Tab
-    pub_tab_id = new_id()
-    flows.append({
-        "id":       pub_tab_id,
-        "type":     "tab",
-        "label":    f"Sim-pub-{pub_tab_id[:6]}",
-        "disabled": False,
-        "info":     ""
-    })
+def run_step(job_id, status, key, script, script_args, live=None, step=None, timeout=None):
+    """
+    Run one evaluation script to completion in a pre-warmed worker,
+    tracking it as status[key] and in the job store as `step` (default:
+    key).  Live metrics the script reports are merged into `live` as they
+    arrive; the step is skipped or stopped once the job is aborted, and
+    stopped as 'timeout' after `timeout` seconds.  A step whose load
+    generator saturated ends 'saturated': its results were written, but
+    describe the harness as much as the broker.
+    """
+    def set_status(value):
+        status[key] = value
+        job_store.update_step(job_id, step or key, value, script)
 
-    pubs = spec.get('publishers', [])
-    interval = spec.get('interval', 1)
-
-    # Inject node
-    inject_id = new_id()
-    inject = {
-        "id":       inject_id,
-        "type":     "inject",
-        "z":        pub_tab_id,
-        "name":     "⏱ timestamp",
-        "props":    [{"p":"payload"}],
-        "repeat":   str(interval),
-        "once":     True,
-        "onceDelay":0.1,
-        "outputs":  1,
-        "wires":    []
-    }
-    flows.append(inject)
-
-    # Splitter node
-    splitter_id = new_id()
-    splitter_node = {
-        "id":       splitter_id,
-        "type":     "function",
-        "z":        pub_tab_id,
-        "name":     "Splitter",
-        "func":     (
-            "var outputs = [];\n"
-            f"for(var i=0;i<{len(pubs)};i++){{ outputs.push({{payload:Date.now()}}); }}\n"
-            "return outputs;"
-        ),
-        "outputs":  len(pubs),
-        "noerr":    0,
-        "initialize":"",
-        "finalize": "",
-        "libs":     [],
-        "x":        200,
-        "y":        100,
-        "wires":    [[] for _ in pubs]
-    }
-    flows.append(splitter_node)
-
-    # Wire inject → splitter
-    inject['wires'] = [[splitter_id]]
-
-    # Publisher chains
-    y = 200
-    for idx, p in enumerate(pubs):
-        fn_id = new_id()
-        js_id = new_id()
-        mout_id = new_id()
-
-        func_code = (
-            f"msg.payload = Math.random()*({p['max']}-{p['min']})+{p['min']};\n"
-            "return msg;" if p.get('random') else 
-            f"msg.payload = {p['min']}; return msg;"
-        )
-
-        # Function node
-        flows.append({
-            "id":      fn_id,
-            "type":    "function",
-            "z":       pub_tab_id,
-            "name":    p['name'],
-            "func":    func_code,
-            "outputs": 1,
-            "x":       320,
-            "y":       y,
-            "wires":   [[js_id]]
-        })
-
-        # JSON node
-        flows.append({
-            "id":       js_id,
-            "type":     "json",
-            "z":        pub_tab_id,
-            "name":     "to JSON",
-            "property": "payload",
-            "action":   "str",
-            "pretty":   False,
-            "x":        480,
-            "y":        y,
-            "wires":    [[mout_id]]
-        })
-
-        # MQTT Out node
-        flows.append({
-            "id":       mout_id,
-            "type":     "mqtt out",
-            "z":        pub_tab_id,
-            "name":     f"{p['name']} → {p['topic']}",
-            "topic":    p['topic'],
-            "qos":      str(p.get('qos',1)),
-            "retain":   False,
-            "broker":   broker_config_id,  # Use dynamic ID
-            "x":        650,
-            "y":        y,
-            "wires":    []
-        })
-
-        splitter_node['wires'][idx] = [fn_id]
-        y += 80
-
-    # Create Subscriber Tab + Dashboard
-    sub_tab_id = new_id()
-    ui_tab_id = new_id()
-    ui_grp_id = new_id()
-
-    flows.append({
-        "id":       sub_tab_id,
-        "type":     "tab",
-        "label":    f"Sim-sub-{sub_tab_id[:6]}",
-        "disabled": False,
-        "info":     ""
-    })
-    flows.append({
-        "id":       ui_tab_id,
-        "type":     "ui_tab",
-        "z":        "",
-        "name":     "Metrics",
-        "icon":     "dashboard",
-        "order":    1,
-        "disabled": False,
-        "hidden":   False
-    })
-    flows.append({
-        "id":      ui_grp_id,
-        "type":    "ui_group",
-        "z":       "",
-        "name":    "Values",
-        "tab":     ui_tab_id,
-        "order":   1,
-        "disp":    True,
-        "width":   "24",
-        "collapse":False
-    })
+    if job_status[job_id].get('aborted'):
+        set_status('aborted')
+        return False
+    set_status('running')
+    proc = step_pool.start(script, script_args)
+    with job_procs_lock:
+        job_procs[job_id].add(proc)
+        if job_status[job_id].get('aborted'):
+            proc.terminate()
+    tail = deque(maxlen=50)
+    returncode = None
+    try:
+        for kind, value in proc.records(timeout):
+            if kind == 'live':
+                if live is not None:
+                    live.update(value)
+            elif kind == 'line':
+                tail.append(value + '\n')
+            elif kind == 'exit':
+                returncode = value
+    finally:
+        with job_procs_lock:
+            job_procs[job_id].discard(proc)
 
-    subs = spec.get('subscribers', [])
-    y = 80
-    for s in subs:
-        in_id = new_id()
-        func_id = new_id()
-        gauge_id = new_id()
-        text_id = new_id()
-
-        # MQTT In node
-        flows.append({
-            "id":      in_id,
-            "type":    "mqtt in",
-            "z":       sub_tab_id,
-            "name":    f"{s['name']} ◀ {s['topic']}",
-            "topic":   s['topic'],
-            "qos":     str(s.get('qos',1)),
-            "datatype":"json",
-            "broker":  broker_config_id,  # Use dynamic ID
-            "x":       300,
-            "y":       y,
-            "wires":   [[func_id]]
-        })
-
-        # Function node
-        flows.append({
-            "id":      func_id,
-            "type":    "function",
-            "z":       sub_tab_id,
-            "name":    f"{s['name']} Check",
-            "func":    "msg.payload = parseFloat(msg.payload).toFixed(2); return msg;",
-            "outputs": 1,
-            "x":       450,
-            "y":       y,
-            "wires":   [[gauge_id,text_id]]
-        })
-
-        # UI Gauge
-        flows.append({
-            "id":      gauge_id,
-            "type":    "ui_gauge",
-            "z":       sub_tab_id,
-            "name":    s['name'],
-            "group":   ui_grp_id,
-            "order":   1,
-            "width":   6,
-            "height":  5,
-            "gtype":   s.get('gtype','gage'),
-            "title":   s['name'],
-            "label":   s.get('unit',''),
-            "format":  "{{value}}",
-            "min":     0,
-            "max":     100,
-            "colors":  ["#00b500","#e6e600","#ca3838"],
-            "x":       620,
-            "y":       y,
-            "wires":   []
-        })
-
-        # UI Text
-        flows.append({
-            "id":      text_id,
-            "type":    "ui_text",
-            "z":       sub_tab_id,
-            "group":   ui_grp_id,
-            "order":   2,
-            "width":   0,
-            "height":  0,
-            "name":    f"{s['name']} Text",
-            "label":   s['name'],
-            "format":  "{{msg.payload}}",
-            "layout":  "row-spread",
-            "x":       800,
-            "y":       y,
-            "wires":   []
-        })
-
-        y += 80
-
-    # Deploy flows to Node-RED
-    resp = requests.post(
-        f'{NODE_RED_URL}/flows',
-        headers={'Content-Type':'application/json'},
-        json=flows
-    )
-    if resp.status_code != 204:
-        return resp.text, 500
+    if returncode == 0:
+        set_status('done')
+    elif job_status[job_id].get('aborted'):
+        set_status('aborted')
+    elif returncode is None:
+        print(f"{script} timed out after {timeout:g} s")
+        set_status('timeout')
+    elif returncode == SATURATED_EXIT:
+        print(f"{script}: {tail[-1].strip() if tail else 'load generator saturated'}")
+        set_status('saturated')
+    else:
+        print(f"Error in {script}: {''.join(tail)}")
+        set_status('error')
+    return status[key] in ('done', 'saturated')
 
-    return jsonify(ok=True)
+def steps_result(statuses):
+    """'done' if every step finished cleanly, 'saturated' if some only saturated, else 'error'"""
+    statuses = list(statuses)
+    if all(s == 'done' for s in statuses):
+        return 'done'
+    return 'saturated' if all(s in ('done', 'saturated') for s in statuses) else 'error'
+
+def step_timeout(args):
+    """Seconds a job lets each step run (job parameter step_timeout), or None for no limit"""
+    return float(args.get('step_timeout', 0)) or None
+
+def harness_args(args, report, profile):
+    """Options for a step's harness self-profiling: report and, if requested, profile paths"""
+    extra = ['--harness', report,
+             '--harness_max_lag', str(args.get('harness_max_lag', 0.1)),
+             '--harness_max_cpu', str(args.get('harness_max_cpu', 0))]
+    if args.get('harness_profile'):
+        extra += ['--harness_profile', profile]
+    return extra
+
+def collect_harness(reports, out):
+    """Merge per-step harness reports [(step, path)] into one {step: report} JSON file"""
+    merged = {}
+    for key, path in reports:
+        if os.path.exists(path):
+            with open(path) as f:
+                merged[key] = json.load(f)
+            os.remove(path)
+    if merged:
+        with open(out, 'w') as f:
+            json.dump(merged, f, indent=1)
+    return merged
+
+def retire_job(job_id):
+    """Forget a finished job's live state after JOB_RETENTION seconds; job_store keeps its record"""
+    def forget():
+        job_status.pop(job_id, None)
+        with job_procs_lock:
+            job_procs.pop(job_id, None)
+    timer = threading.Timer(JOB_RETENTION, forget)
+    timer.daemon = True
+    timer.start()
+
+def job_outputs(broker_name, broker_port, job_id, connect_mode=None):
+    """
+    Result file of each evaluation step for one job, as {artifact kind:
+    path relative to the app root}.  Per-sample series are Parquet when
+    pyarrow is installed.
+    """
+    if connect_mode == 'hold':
+        max_clients = ('max_clients_hold', f'results/max_clients_hold_{broker_name}_{job_id}.csv')
+    elif connect_mode == 'sweep':
+        max_clients = ('payload_sweep', f'results/payload_sweep_{broker_name}_{job_id}.csv')
+    else:
+        max_clients = ('max_clients', series_path(f'results/max_clients_results_{broker_name}_{job_id}'))
+    return dict([
+        ('ping', series_path(f'results/broker_pinger_results_{broker_name}_{job_id}')),
+        ('ping_summary', f'results/mqtt_stats_{broker_name}_{broker_port}_{job_id}.csv'),
+        ('availability', f'logs/broker_availability_results_{broker_name}_{job_id}.csv'),
+        ('availability_outages', f'logs/broker_availability_results_{broker_name}_{job_id}_outages.csv'),
+        max_clients,
+        ('throughput', f'results/throughput_results_{broker_name}_{broker_port}_{job_id}.csv'),
+        ('latency', f'results/latency_results_{broker_name}_{broker_port}_{job_id}.csv'),
+        ('harness', f'results/harness_{broker_name}_{job_id}.json'),
+    ])
+
+def register_artifacts(job_id, paths, broker=None):
+    """Record the files in `paths` (relative to the app root) that a step actually wrote"""
+    for kind, rel in paths:
+        if os.path.exists(os.path.join(app.root_path, rel)):
+            job_store.add_artifact(job_id, kind, rel, broker)
 
 def run_tests_in_background(job_id, args):
-    python_cmd = sys.executable
-  
-    env = os.environ.copy()
-    env['PYTHONIOENCODING'] = 'utf-8'
-    env['PYTHONUTF8'] = '1'
 
     # Get container ID from broker name
     broker_name = args['broker_name'].lower()
     container_id = BROKER_IDS.get(broker_name)
-    if not container_id:
+    if not container_id and broker_name != REFERENCE_BROKER:
         job_status[job_id] = {'error': 'Invalid broker name'}
+        job_store.create_job(job_id, 'evaluation', broker_name, args.get('broker_port'), args, 'error')
+        retire_job(job_id)
         return
+    job_store.create_job(job_id, 'evaluation', broker_name, args['broker_port'], args)
 
-    # Setup resource monitoring
-    resource_csv = os.path.join(RESULTS_DIR, f'resource_usage_{broker_name}_{job_id}.csv')
-    stop_event = threading.Event()
-    monitor_thread = threading.Thread(
-        target=monitor_container_stats,
-        args=(container_id, resource_csv, stop_event),
-        daemon=True
-    )
-    
     job_status[job_id] = {
         'step1': 'pending',
         'step2': 'pending',
         'step3': 'pending',
-        'monitoring': 'running'
+        'step4': 'pending',
+        'step5': 'pending',
+        'monitoring': 'running',
+        'live': {}
     }
-    
-    monitor_thread.start()
 
     try:
-        # Test steps
+        # Wait for any other job loading this broker to finish
+        broker_locks[broker_name].acquire()
+
+        # Setup resource monitoring on the shared sampler
+        resource_bin, _, _ = resource_paths(broker_name, job_id)
+        if container_id is None:
+            job_status[job_id]['monitoring'] = 'skipped'
+        else:
+            try:
+                monitor_service.add(job_id, container_id, resource_bin,
+                                    args.get('sampler', 'auto'), float(args.get('sample_hz', 1.0)))
+            except Exception as e:
+                print(f"Monitoring setup failed: {str(e)}")
+                job_status[job_id]['monitoring'] = 'error'
+
+        # Every output file is specific to this job, so earlier runs are kept
+        outputs = job_outputs(args['broker_name'], args['broker_port'], job_id, args.get('connect_mode'))
+        out = {kind: os.path.join(app.root_path, rel) for kind, rel in outputs.items()}
+        max_clients_kind = next(k for k in ('max_clients_hold', 'payload_sweep', 'max_clients') if k in out)
+
+        # Test steps, with the artifact kinds each one writes
         steps = [
-            ('broker_pinger.py', 'step1', ['--duration', args['duration']]),
-            ('broker_availability.py', 'step2', ['--duration', args['duration']]),
+            ('broker_pinger.py', 'step1',
+             ['--duration', args['duration'],
+              '--interval', str(args.get('ping_interval', 5.0)),
+              '--arrival', args.get('arrival', 'constant'),
+              '--output', out['ping'], '--summary', out['ping_summary']],
+             ['ping', 'ping_summary']),
+            ('broker_availability.py', 'step2',
+             ['--duration', args['duration'],
+              '--interval', str(args.get('availability_interval', 0.25)),
+              '--output', out['availability']],
+             ['availability', 'availability_outages']),
             ('max_clients_test.py', 'step3', 
-             ['--clients', args['max_clients'], '--payload_size', args['payload_size']]),
+             ['--clients', args['max_clients'], '--payload_size', args['payload_size'],
+              '--mode', args.get('connect_mode', 'sequential'),
+              '--rate', str(args.get('connect_rate', 0)),
+              '--arrival', args.get('arrival', 'constant'),
+              '--max_inflight', str(args.get('max_inflight', 1000)),
+              '--workers', str(args.get('workers', 1)),
+              '--hold', str(args.get('hold_seconds', 30)),
+              '--max_packet', str(args.get('max_packet', 1048576)),
+              '--output', out[max_clients_kind]],
+             [max_clients_kind]),
+            ('throughput_test.py', 'step4',
+             ['--publishers', str(args.get('publishers', 4)),
+              '--subscribers', str(args.get('subscribers', 2)),
+              '--rate', str(args.get('publish_rate', 0)),
+              '--arrival', args.get('arrival', 'constant'),
+              '--duration', str(args.get('throughput_duration', 10)),
+              '--payload_size', args['payload_size'],
+              '--workers', str(args.get('workers', 1)),
+              '--output', out['throughput']],
+             ['throughput']),
+            ('latency_test.py', 'step5',
+             ['--duration', str(args.get('latency_duration', 10)),
+              '--arrival', args.get('arrival', 'constant'),
+              '--output', out['latency']],
+             ['latency']),
         ]
 
         base_args = [
             '--name', args['broker_name'],
+            '--host', BROKER_HOST,
             '--port', args['broker_port']
         ]
 
-        for script, key, extra in steps:
-            job_status[job_id][key] = 'running'
-            try:
-                subprocess.run(
-                    [python_cmd,
-                     os.path.join(app.root_path, 'evaluation_scripts', script),
-                     *base_args,
-                     *extra
-                    ],
-                    check=True, env=env, capture_output=True
-                )
-                job_status[job_id][key] = 'done'
-            except subprocess.CalledProcessError as e:
-                print(f"Error in {script}: {e.stderr.decode()}")
-                job_status[job_id][key] = 'error'
+        harness_reports = []
+        for script, key, extra, kinds in steps:
+            live = job_status[job_id]['live'].setdefault(key, {})
+            report = out['harness'][:-len('.json')] + f'_{key}.json'
+            profile = f'results/profile_{broker_name}_{job_id}_{key}.folded'
+            harness_reports.append((key, report))
+            run_step(job_id, job_status[job_id], key, script,
+                     [*base_args, *extra,
+                      *harness_args(args, report, os.path.join(app.root_path, profile))],
+                     live, timeout=step_timeout(args))
+            register_artifacts(job_id, [(kind, outputs[kind]) for kind in kinds] +
+                               [(f'profile_{key}', profile)])
+        collect_harness(harness_reports, out['harness'])
+        register_artifacts(job_id, [('harness', outputs['harness'])])
     finally:
         # Stop monitoring when tests complete or error occurs
-        stop_event.set()
-        monitor_thread.join()
-        job_status[job_id]['monitoring'] = 'completed'
+        monitor_service.remove(job_id)
+        broker_locks[broker_name].release()
+        if job_status[job_id]['monitoring'] == 'running':
+            job_status[job_id]['monitoring'] = 'completed'
+
+    if args.get('connect_mode') == 'hold':
+        annotate_hold_plateaus(out['max_clients_hold'], load_resource_samples(broker_name, job_id))
+    resource_file = compact_recording(resource_bin, broker_name)
+    register_artifacts(job_id, [('resources', os.path.relpath(resource_file, app.root_path))])
+    state = job_status[job_id]
+    state['finished'] = True
+    if state.get('aborted'):
+        result = 'aborted'
+    else:
+        result = steps_result(state[key] for _, key, _, _ in steps)
+    job_store.finish_job(job_id, result)
+    retire_job(job_id)
 
 @app.route('/run_tests', methods=['POST'])
 def run_tests():
@@ -479,112 +454,917 @@ def run_tests():
 
 @app.route('/status/<job_id>')
 def status(job_id):
-    return jsonify(job_status.get(job_id, {}))
+    return jsonify(job_status.get(job_id) or job_store.status(job_id) or {})
+
+@app.route('/jobs')
+def jobs():
+    """
+    Recorded jobs, newest first.  broker, kind and limit narrow the list,
+    and any other argument filters on a job parameter (e.g. payload_size=256).
+    """
+    filters = {k: v for k, v in request.args.items() if k not in ('broker', 'kind', 'limit')}
+    return jsonify(job_store.jobs(
+        broker=request.args.get('broker'),
+        kind=request.args.get('kind'),
+        limit=request.args.get('limit', 50, type=int),
+        **filters
+    ))
+
+@app.route('/jobs/<job_id>')
+def job_record(job_id):
+    """One job's parameters, step statuses and timings, and artifact paths"""
+    job = job_store.job(job_id)
+    if job is None:
+        return jsonify(error='Unknown job'), 404
+    return jsonify(job)
+
+@app.route('/abort/<job_id>', methods=['POST'])
+def abort(job_id):
+    """Stop a running job: its current scripts are terminated and the rest skipped"""
+    state = job_status.get(job_id)
+    if state is None:
+        return jsonify(error='Unknown job'), 404
+    with job_procs_lock:
+        state['aborted'] = True
+        for proc in job_procs[job_id]:
+            proc.terminate()
+    return jsonify(ok=True)
+
+def flatten(state, prefix=''):
+    """Nested job state as {'a.b.c': value}, so changes can be sent key by key"""
+    out = {}
+    for k, v in list(state.items()):
+        if isinstance(v, dict):
+            out.update(flatten(v, f'{prefix}{k}.'))
+        else:
+            out[f'{prefix}{k}'] = v
+    return out
+
+def job_finished(state):
+    return bool(state.get('finished') or state.get('status') in ('done', 'aborted') or 'error' in state)
+
+def job_snapshot(job_id, state):
+    """Flattened job state plus the latest container sample for each of its monitored series"""
+    snapshot = flatten(state)
+    for key in monitor_service.keys():
+        if key == job_id:
+            prefix = 'monitor.'
+        elif key.startswith(job_id + '-'):
+            prefix = f"cells.{key[len(job_id) + 1:]}.monitor."
+        else:
+            continue
+        latest = monitor_service.latest(key)
+        if latest:
+            _, sample = latest
+            snapshot[prefix + 'cpu_percent'] = round(sample['cpu_percent'], 2)
+            snapshot[prefix + 'mem_usage'] = sample['mem_usage']
+            snapshot[prefix + 'net_rx'] = sample['net_rx']
+            snapshot[prefix + 'net_tx'] = sample['net_tx']
+    return snapshot
+
+@app.route('/stream/<job_id>')
+def stream(job_id):
+    """
+    Server-Sent Events for a job: each message carries only the flattened
+    keys (step states, live script metrics, container CPU/memory) that
+    changed since the previous one.  An 'end' event follows the last
+    change once the job has finished.
+    """
+    def events():
+        sent = {}
+        last_event = time.monotonic()
+        while True:
+            state = job_status.get(job_id) or job_store.status(job_id)
+            if state is None:
+                yield 'event: end\ndata: {"error": "Unknown job"}\n\n'
+                return
+            finished = job_finished(state)
+            snapshot = job_snapshot(job_id, state)
+            changes = {k: v for k, v in snapshot.items() if k not in sent or sent[k] != v}
+            if changes:
+                sent.update(changes)
+                last_event = time.monotonic()
+                yield f'data: {json.dumps(changes)}\n\n'
+            elif time.monotonic() - last_event > 15:
+                last_event = time.monotonic()
+                yield ': keepalive\n\n'
+            if finished:
+                yield 'event: end\ndata: {}\n\n'
+                return
+            time.sleep(0.5)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+MATRIX_REPORT_COLUMNS = [
+    'Cell', 'Broker', 'Payload_Bytes', 'Clients', 'QoS', 'Status',
+    'Connected_Clients', 'Failed_Clients', 'Avg_Connect_s', 'P99_Connack_s', 'Session_Ceiling',
+    'Peak_Bytes_Per_s', 'Collapse_Payload_Bytes',
+    'Publish_Rate', 'Delivered_Rate', 'Loss_Pct', 'Latency_P50_s', 'Latency_P99_s',
+    'Schedule_Lag_P99_s', 'Harness_Saturated', 'Peak_CPU_Pct', 'Peak_Mem_Bytes'
+]
+
+def matrix_cells(args):
+    """
+    Expand a matrix request into cells, one per broker x payload size x
+    client count x QoS.  Brokers are names or {'name', 'port'} objects.
+    """
+    brokers = []
+    for b in args['brokers']:
+        if isinstance(b, str):
+            b = {'name': b}
+        name = b['name'].lower()
+        if name not in BROKER_IDS and name != REFERENCE_BROKER:
+            raise ValueError(f"Invalid broker name: {b['name']}")
+        brokers.append((name, str(b.get('port', args.get('broker_port', '1883')))))
+
+    cells = {}
+    combos = itertools.product(brokers, args['payload_sizes'], args['client_counts'], args['qos'])
+    for n, ((name, port), payload, clients, qos) in enumerate(combos, start=1):
+        cells[f'c{n:03d}'] = {
+            'broker': name, 'port': port,
+            'payload_size': str(payload), 'clients': str(clients), 'qos': str(qos),
+            'status': 'pending', 'max_clients': 'pending', 'throughput': 'pending'
+        }
+    return cells
+
+def read_metric_tail(path):
+    """The Metric,Value block at the end of a max-clients CSV, or the metrics of its Parquet series"""
+    if is_parquet(path):
+        return read_metrics(path)
+    metrics = {}
+    with open(path) as f:
+        rows = list(csv.reader(f))
+    for i, row in enumerate(rows):
+        if row[:2] == ['Metric', 'Value']:
+            metrics = {r[0]: r[1] for r in rows[i + 1:] if len(r) >= 2}
+    return metrics
+
+def write_matrix_report(matrix_id):
+    """Collect every finished cell's outputs into one comparison CSV"""
+    out_dir = os.path.join(RESULTS_DIR, f'matrix_{matrix_id}')
+    report = os.path.join(out_dir, 'report.csv')
+    rows = []
+    for cell_id, cell in job_status[matrix_id]['cells'].items():
+        prefix = os.path.join(out_dir, cell_id)
+        row = dict.fromkeys(MATRIX_REPORT_COLUMNS, '')
+        row.update(Cell=cell_id, Broker=cell['broker'], Payload_Bytes=cell['payload_size'],
+                   Clients=cell['clients'], QoS=cell['qos'], Status=cell['status'])
+        max_f = next((prefix + '_max_clients' + ext for ext in (PARQUET, '.csv')
+                      if os.path.exists(prefix + '_max_clients' + ext)), None)
+        if max_f:
+            m = read_metric_tail(max_f)
+            row.update(Connected_Clients=m.get('Total_Clients', ''),
+                       Failed_Clients=m.get('Failed_Clients', ''),
+                       Avg_Connect_s=m.get('Average_Connection_Time', ''),
+                       P99_Connack_s=m.get('P99_Connack_s', ''),
+                       Session_Ceiling=m.get('Session_Ceiling', ''),
+                       Peak_Bytes_Per_s=m.get('Peak_Bytes_Per_s', ''),
+                       Collapse_Payload_Bytes=m.get('Collapse_Payload_Bytes', ''))
+        if os.path.exists(prefix + '_throughput.csv'):
+            with open(prefix + '_throughput.csv') as f:
+                t = next(csv.DictReader(f), {})
+            for col in ('Publish_Rate', 'Delivered_Rate', 'Loss_Pct', 'Latency_P50_s', 'Latency_P99_s',
+                        'Schedule_Lag_P99_s'):
+                row[col] = t.get(col, '')
+        if os.path.exists(prefix + '_harness.json'):
+            with open(prefix + '_harness.json') as f:
+                row['Harness_Saturated'] = any(r['saturated'] for r in json.load(f).values())
+        if os.path.exists(prefix + '_resources' + PARQUET):
+            cols = read_series(prefix + '_resources' + PARQUET, ['cpu_percent', 'mem_usage'])
+            if len(cols['cpu_percent']):
+                row['Peak_CPU_Pct'] = f"{cols['cpu_percent'].max():.2f}"
+                row['Peak_Mem_Bytes'] = int(cols['mem_usage'].max())
+        elif os.path.exists(prefix + '_resources.bin'):
+            records, _ = read_records(prefix + '_resources.bin')
+            if records:
+                row['Peak_CPU_Pct'] = f"{max(r[1] for r in records):.2f}"
+                row['Peak_Mem_Bytes'] = max(r[2] for r in records)
+        rows.append(row)
+    with open(report, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=MATRIX_REPORT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return report
+
+def set_cell_status(matrix_id, cell_id, value):
+    job_status[matrix_id]['cells'][cell_id]['status'] = value
+    job_store.update_step(matrix_id, f'cells.{cell_id}.status', value)
+
+def run_matrix_cell(matrix_id, cell_id, args):
+    """Run the max-clients and throughput steps for one cell, monitoring its broker"""
+    cell = job_status[matrix_id]['cells'][cell_id]
+    prefix = os.path.join(RESULTS_DIR, f'matrix_{matrix_id}', cell_id)
+    monitor_key = f'{matrix_id}-{cell_id}'
+    set_cell_status(matrix_id, cell_id, 'running')
+    if cell['broker'] in BROKER_IDS:
+        try:
+            monitor_service.add(monitor_key, BROKER_IDS[cell['broker']], prefix + '_resources.bin',
+                                args.get('sampler', 'auto'), float(args.get('sample_hz', 1.0)))
+        except Exception as e:
+            print(f"Monitoring setup failed: {str(e)}")
+
+    base_args = ['--name', cell['broker'], '--host', BROKER_HOST, '--port', cell['port']]
+    steps = [
+        ('max_clients_test.py', 'max_clients',
+         ['--clients', cell['clients'], '--payload_size', cell['payload_size'],
+          '--mode', args.get('connect_mode', 'sequential'),
+          '--rate', str(args.get('connect_rate', 0)),
+          '--arrival', args.get('arrival', 'constant'),
+          '--max_inflight', str(args.get('max_inflight', 1000)),
+          '--workers', str(args.get('workers', 1)),
+          '--hold', str(args.get('hold_seconds', 30)),
+          '--max_packet', str(args.get('max_packet', 1048576)),
+          '--output', prefix + '_max_clients.csv' if args.get('connect_mode') in ('hold', 'sweep')
+                      else series_path(prefix + '_max_clients')]),
+        ('throughput_test.py', 'throughput',
+         ['--qos', cell['qos'],
+          '--publishers', str(args.get('publishers', 4)),
+          '--subscribers', str(args.get('subscribers', 2)),
+          '--rate', str(args.get('publish_rate', 0)),
+          '--arrival', args.get('arrival', 'constant'),
+          '--duration', str(args.get('throughput_duration', 10)),
+          '--payload_size', cell['payload_size'],
+          '--workers', str(args.get('workers', 1)),
+          '--output', prefix + '_throughput.csv']),
+    ]
+    live = cell.setdefault('live', {})
+    try:
+        ok = [run_step(matrix_id, cell, key, script,
+                       [*base_args, *extra,
+                        *harness_args(args, f'{prefix}_harness_{key}.json', f'{prefix}_profile_{key}.folded')],
+                       live, step=f'cells.{cell_id}.{key}', timeout=step_timeout(args))
+              for script, key, extra in steps]
+        if all(ok):
+            set_cell_status(matrix_id, cell_id, steps_result(cell[key] for _, key, _ in steps))
+        else:
+            set_cell_status(matrix_id, cell_id,
+                            'aborted' if job_status[matrix_id].get('aborted') else 'error')
+    finally:
+        collect_harness([(key, f'{prefix}_harness_{key}.json') for _, key, _ in steps],
+                        prefix + '_harness.json')
+        monitor_service.remove(monitor_key)
+        resource_file = compact_recording(prefix + '_resources.bin', cell['broker'])
+        rel = os.path.relpath(prefix, app.root_path)
+        register_artifacts(matrix_id, [
+            ('max_clients_hold', rel + '_max_clients.csv') if args.get('connect_mode') == 'hold'
+            else ('payload_sweep', rel + '_max_clients.csv') if args.get('connect_mode') == 'sweep'
+            else ('max_clients', series_path(rel + '_max_clients')),
+            ('throughput', rel + '_throughput.csv'),
+            ('harness', rel + '_harness.json'),
+            *((f'profile_{key}', f'{rel}_profile_{key}.folded') for _, key, _ in steps),
+            ('resources', os.path.relpath(resource_file, app.root_path)),
+        ], broker=cell['broker'])
+
+def run_matrix_in_background(matrix_id, args):
+    """
+    Run a matrix job's cells on `parallel` worker threads.  A worker only
+    takes a cell whose broker is not already being loaded, by this matrix
+    or by any other job, so cells for different brokers overlap while
+    each broker sees one load generator at a time.
+    """
+    state = job_status[matrix_id]
+    pending = list(state['cells'])
+    cond = threading.Condition()
+
+    def next_cell():
+        if state.get('aborted'):
+            for cell_id in pending:
+                set_cell_status(matrix_id, cell_id, 'aborted')
+            pending.clear()
+            return None
+        # Claim the first pending cell whose broker lock is free
+        for cell_id in pending:
+            if broker_locks[state['cells'][cell_id]['broker']].acquire(blocking=False):
+                pending.remove(cell_id)
+                return cell_id
+        return None
+
+    def worker():
+        while True:
+            with cond:
+                cell_id = next_cell()
+                while cell_id is None:
+                    if not pending:
+                        return
+                    # Locks held by other jobs are released without a notify
+                    cond.wait(timeout=1.0)
+                    cell_id = next_cell()
+            broker = state['cells'][cell_id]['broker']
+            try:
+                run_matrix_cell(matrix_id, cell_id, args)
+            except Exception as e:
+                print(f"Matrix cell {cell_id} failed: {str(e)}")
+                set_cell_status(matrix_id, cell_id, 'error')
+            finally:
+                broker_locks[broker].release()
+                with cond:
+                    state['completed'] += 1
+                    write_matrix_report(matrix_id)
+                    cond.notify_all()
+
+    brokers = {cell['broker'] for cell in state['cells'].values()}
+    workers = [threading.Thread(target=worker, daemon=True)
+               for _ in range(max(1, min(int(args.get('parallel', 2)), len(brokers))))]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    state['report'] = os.path.relpath(write_matrix_report(matrix_id), app.root_path)
+    state['status'] = 'aborted' if state.get('aborted') else 'done'
+    job_store.add_artifact(matrix_id, 'matrix_report', state['report'])
+    job_store.finish_job(matrix_id, state['status'])
+    retire_job(matrix_id)
+
+@app.route('/run_matrix', methods=['POST'])
+def run_matrix():
+    args = request.get_json()
+    try:
+        cells = matrix_cells(args)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify(error=f"Invalid matrix request: {e}"), 400
+    matrix_id = uuid.uuid4().hex
+    os.makedirs(os.path.join(RESULTS_DIR, f'matrix_{matrix_id}'), exist_ok=True)
+    job_status[matrix_id] = {
+        'type': 'matrix', 'status': 'running',
+        'total': len(cells), 'completed': 0, 'cells': cells
+    }
+    job_store.create_job(matrix_id, 'matrix', None, args.get('broker_port'), args)
+    threading.Thread(
+        target=run_matrix_in_background,
+        args=(matrix_id, args),
+        daemon=True
+    ).start()
+    return jsonify(job_id=matrix_id, cells=len(cells))
+
+@app.route('/matrix/<matrix_id>')
+def matrix_report(matrix_id):
+    report = os.path.join(RESULTS_DIR, f'matrix_{matrix_id}', 'report.csv')
+    rows = []
+    if os.path.exists(report):
+        with open(report) as f:
+            rows = list(csv.DictReader(f))
+    return render_template('matrix.html',
+        matrix_id=matrix_id,
+        state=job_status.get(matrix_id) or job_store.status(matrix_id) or {},
+        rows=rows,
+        columns=MATRIX_REPORT_COLUMNS
+    )
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+LATENCY_COLUMNS = ['P50_s', 'P90_s', 'P99_s', 'P999_s', 'Max_s']
+
+def load_latency_summary(path):
+    """
+    Read a Metric,...,P50_s,...,Count summary into {metric: {column: seconds}}.
+    Summaries written before percentiles were recorded only have Avg_s.
+    """
+    out = {}
+    with open(path) as f:
+        reader = csv.DictReader(f)
+        columns = LATENCY_COLUMNS if 'P50_s' in (reader.fieldnames or []) else ['Avg_s', 'Max_s']
+        for row in reader:
+            values = {}
+            for col in columns:
+                try:
+                    values[col] = float(row[col])
+                except (KeyError, TypeError, ValueError):
+                    pass
+            if values:
+                out[row['Metric']] = values
+    return out
+
+def read_ping_rows(path, offset=None):
+    """(epoch, delay) pairs appended to the pinger CSV since offset"""
+    lines, offset = read_csv_lines(path, offset)
+    return [(float(row[0]), float(row[1] or 0.0)) for row in lines
+            if len(row) >= 2 and row[0] != 'timestamp'], offset
+
+def parse_availability(path):
+    """Metric,Value rows of an availability summary, metric names upper-cased"""
+    metrics = {}
+    with open(path) as f:
+        r = csv.reader(f)
+        next(r, None)
+        for row in r:
+            if len(row) >= 2:
+                metrics[row[0].strip().upper()] = row[1]
+    return metrics
+
+def parse_max_clients(path):
+    """(client ids, connection times) for the clients that connected"""
+    if is_parquet(path):
+        cols = read_series(path, ['client', 'connection_time'])
+        ok = ~np.isnan(cols['connection_time'])
+        return cols['client'][ok], cols['connection_time'][ok]
+    c_ids, c_times = [], []
+    with open(path) as f:
+        next(f, None)
+        try:
+            for line in f:
+                fields = line.split(',', 2)
+                if len(fields) < 2:
+                    break  # blank line before the Metric,Value block
+                if fields[1].strip():
+                    c_ids.append(int(fields[0]))
+                    c_times.append(float(fields[1]))
+        except ValueError:
+            pass
+    return c_ids, c_times
+
+def parse_hold(path):
+    """(rows as dicts, Metric,Value block) of a hold-mode or payload-sweep CSV"""
+    hold_rows, hold_metrics = [], {}
+    with open(path) as f:
+        r = csv.reader(f)
+        header = next(r, None)
+        for row in r:
+            if not row:
+                break
+            hold_rows.append(dict(zip(header, row)))
+        next(r, None)
+        for row in r:
+            if len(row) >= 2:
+                hold_metrics[row[0]] = row[1]
+    return hold_rows, hold_metrics
+
+def parse_dict_rows(path):
+    with open(path) as f:
+        return list(csv.DictReader(f))
+
+def parse_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+# Points per chart series sent with the results page; zooming fetches more
+SERIES_POINTS = 1000
+RESOURCE_CHART_COLUMNS = ['cpu_percent', 'mem_usage', 'net_rx', 'net_tx', 'block_read', 'block_write']
+
+# Job parameters that picked a result file's name before runs were recorded;
+# without a job_id, the newest artifact whose job matches them is shown
+ARTIFACT_PARAMS = {
+    'ping_summary': ('broker_port',),
+    'availability': ('duration',),
+    'max_clients': ('max_clients', 'payload_size'),
+    'max_clients_hold': ('max_clients', 'payload_size'),
+    'payload_sweep': ('broker_port',),
+    'throughput': ('broker_port',),
+    'latency': ('broker_port',),
+}
+LEGACY_PREFIXES = {'ping_summary': 'mqtt_stats', 'throughput': 'throughput_results',
+                   'latency': 'latency_results'}
+
+def legacy_artifact(broker_name, kind, params):
+    """Where runs from before the job store wrote a result file (absolute path or None)"""
+    if kind in LEGACY_PREFIXES:
+        return results_cache.latest(os.path.join(
+            RESULTS_DIR,
+            f"{LEGACY_PREFIXES[kind]}_{broker_name}_{params.get('broker_port', '1883')}_*.csv"
+        ))
+    clients = f"{params.get('max_clients', '100')}_P_{params.get('payload_size', '256')}"
+    names = {
+        'ping': os.path.join(RESULTS_DIR, f'broker_pinger_results_{broker_name}.csv'),
+        'availability': os.path.join(
+            LOGS_DIR, f"broker_availability_results_{broker_name}_{params.get('duration', '60')}.csv"),
+        'max_clients': os.path.join(RESULTS_DIR, f'max_clients_results_{broker_name}_{clients}.csv'),
+        'max_clients_hold': os.path.join(RESULTS_DIR, f'max_clients_hold_{broker_name}_{clients}.csv'),
+    }
+    return names.get(kind)
+
+def artifact_path(broker_name, kind, params):
+    """
+    Absolute path of a result file: the one recorded for params['job_id'],
+    else the newest recorded one matching the ARTIFACT_PARAMS in params,
+    else the file name runs used before they were recorded.
+    """
+    broker_name = broker_name.lower()
+    job_id = params.get('job_id')
+    if job_id and job_store.exists(job_id):
+        rel = job_store.artifact(broker_name, kind, job_id=job_id)
+        return os.path.join(app.root_path, rel) if rel else None
+    rel = job_store.artifact(broker_name, kind, **{
+        k: params[k] for k in ARTIFACT_PARAMS.get(kind, ()) if k in params
+    })
+    if rel:
+        return os.path.join(app.root_path, rel)
+    return legacy_artifact(broker_name, kind, params)
+
+def iso_labels(x):
+    return [datetime.fromtimestamp(t).isoformat(timespec='milliseconds') for t in x]
+
+def load_parquet_series(path, columns, params):
+    """
+    Columns of a Parquet series as float arrays.  A zoom request (start/end
+    in params) reads only the row groups overlapping that time window; the
+    whole series is read once and cached.  A file still being written
+    (no footer yet) reads as empty.
+    """
+    start, end = params.get('start'), params.get('end')
+    try:
+        if start is None and end is None:
+            data = results_cache.load(path, read_series, {})
+        elif os.path.exists(path):
+            data = read_series(path, columns,
+                               start=None if start is None else float(start),
+                               end=None if end is None else float(end))
+        else:
+            data = {}
+    except ValueError:
+        data = {}
+    return [np.asarray(data.get(c, ()), dtype=float) for c in columns]
+
+def load_series(broker_name, name, params):
+    """
+    Full-resolution chart series as (x, {column: y}, label function), with x
+    sorted: 'ping' and 'resources' are indexed by epoch seconds, 'clients'
+    by client id.
+    """
+    if name == 'ping':
+        ping_f = artifact_path(broker_name, 'ping', params)
+        if is_parquet(ping_f):
+            x, delay = load_parquet_series(ping_f, ['timestamp', 'delay'], params)
+            return x, {'delay': delay}, iso_labels
+        pings = np.array(results_cache.load_appended(ping_f, read_ping_rows, []), dtype=float).reshape(-1, 2)
+        return pings[:, 0], {'delay': pings[:, 1]}, iso_labels
+    if name == 'clients':
+        max_f = artifact_path(broker_name, 'max_clients', params)
+        c_ids, c_times = results_cache.load(max_f, parse_max_clients, ([], []))
+        return np.array(c_ids, dtype=float), {'connection_time': np.array(c_times, dtype=float)}, \
+            lambda x: [int(i) for i in x]
+    if name == 'resources':
+        parquet_path = resource_paths(broker_name, params.get('job_id'))[1]
+        if os.path.exists(parquet_path):
+            x, *ys = load_parquet_series(parquet_path, ['timestamp', *RESOURCE_CHART_COLUMNS], params)
+            return x, dict(zip(RESOURCE_CHART_COLUMNS, ys)), iso_labels
+        samples = load_resource_samples(broker_name, params.get('job_id'))
+        x = np.array([s['timestamp'] for s in samples], dtype=float)
+        return x, {col: np.array([s[col] for s in samples], dtype=float)
+                   for col in RESOURCE_CHART_COLUMNS}, iso_labels
+    raise KeyError(name)
+
+def reduce_series(x, columns, labels, points=SERIES_POINTS, method='lttb', start=None, end=None):
+    """Cut a series to [start, end] and downsample it to about `points` points, JSON-ready"""
+    lo, hi = window(x, start, end)
+    x = x[lo:hi]
+    columns = {k: v[lo:hi] for k, v in columns.items()}
+    keep = select_indices(x, list(columns.values()), points, method)
+    return {
+        'x': x[keep].tolist(),
+        'labels': labels(x[keep]),
+        'columns': {k: v[keep].round(6).tolist() for k, v in columns.items()},
+        'total': len(x),
+    }
+
 @app.route('/results/<broker_name>')
 def results(broker_name):
     job_id = request.args.get('job_id')
-    duration = request.args.get('duration', '60')
-    max_clients = request.args.get('max_clients', '100')
-    payload = request.args.get('payload_size', '256')
-    broker_port = request.args.get('broker_port', '1883')
+    points = request.args.get('points', SERIES_POINTS, type=int)
 
     # Load resource data
-    resource_data = []
-    resource_csv = os.path.join(RESULTS_DIR, f'resource_usage_{broker_name}_{job_id}.csv')
-    if os.path.exists(resource_csv):
-        with open(resource_csv) as f:
-            reader = csv.DictReader(f)
-            resource_data = list(reader)
+    resource_series = reduce_series(*load_series(broker_name, 'resources', request.args), points)
 
     # 1) ping times (for your line graph)
-    ping_ts, ping_d = [], []
-    ping_f = os.path.join(RESULTS_DIR, f'broker_pinger_results_{broker_name}.csv')
-    if os.path.exists(ping_f):
-        with open(ping_f) as f:
-            for row in csv.reader(f):
-                if len(row)>=2:
-                    ping_ts.append(row[0])
-                    try:
-                        ping_d.append(float(row[1]))
-                    except:
-                        ping_d.append(0.0)
+    ping_series = reduce_series(*load_series(broker_name, 'ping', request.args), points)
 
     # 2) availability (MTBF / MTTR)
-    mtbf, mttr = 0.0, 0.0
-    avail_f = os.path.join(LOGS_DIR, f'broker_availability_results_{broker_name}_{duration}.csv')
-    if os.path.exists(avail_f):
-        with open(avail_f) as f:
-            r = csv.reader(f)
-            next(r,None)
-            for row in r:
-                if len(row)>=2:
-                    key, val = row[0].strip().upper(), row[1]
-                    try:
-                        if key=='MTBF': mtbf = float(val)
-                        if key=='MTTR': mttr = float(val)
-                    except:
-                        pass
+    avail_f = artifact_path(broker_name, 'availability', request.args)
+    avail = results_cache.load(avail_f, parse_availability, {})
+    try:
+        mtbf = float(avail.get('MTBF', 0.0))
+        mttr = float(avail.get('MTTR', 0.0))
+    except ValueError:
+        mtbf, mttr = 0.0, 0.0
 
     # 3) max-clients curve
-    c_ids, c_times = [], []
-    max_f = os.path.join(
-        RESULTS_DIR,
-        f'max_clients_results_{broker_name}_{max_clients}_P_{payload}.csv'
-    )
-    if os.path.exists(max_f):
-        with open(max_f) as f:
-            r = csv.reader(f)
-            next(r,None)
-            for row in r:
-                if len(row)>=2:
-                    try:
-                        c_ids.append(int(row[0]))
-                        c_times.append(float(row[1]))
-                    except:
-                        pass
-
-    # 4) Load the latest step-1 summary (ConnectionSetup, Subscription, PingRTT)
-    pattern = os.path.join(
-        RESULTS_DIR,
-        f'mqtt_stats_{broker_name}_{broker_port}_*.csv'
-    )
-    files = sorted(glob.glob(pattern))
-    avg_metrics = {}
-    if files:
-        latest = files[-1]
-        with open(latest) as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                metric = row['Metric']
-                try:
-                    avg_metrics[metric] = float(row['Avg_s'])
-                except:
-                    avg_metrics[metric] = None
+    client_series = reduce_series(*load_series(broker_name, 'clients', request.args), points)
+
+    # 3b) hold-mode plateaus (session ceiling), if that mode was run
+    hold_f = artifact_path(broker_name, 'max_clients_hold', request.args)
+    hold_rows, hold_metrics = results_cache.load(hold_f, parse_hold, ([], {}))
+
+    # 3c) payload-size sweep (bytes/s and msg/s per size), if that mode was run
+    sweep_f = artifact_path(broker_name, 'payload_sweep', request.args)
+    sweep_rows, sweep_metrics = results_cache.load(sweep_f, parse_hold, ([], {}))
+
+    # 4) Latency percentiles: latest step-1 summary (ConnectionSetup,
+    #    Subscription, PingRTT) plus the latest end-to-end latency run
+    latency_metrics = {}
+    for kind in ('ping_summary', 'latency'):
+        latency_metrics.update(results_cache.load(
+            artifact_path(broker_name, kind, request.args), load_latency_summary, {}))
+
+    # 5) Latest throughput run (one row per QoS level)
+    throughput_rows = results_cache.load(
+        artifact_path(broker_name, 'throughput', request.args), parse_dict_rows, [])
+
+    # 6) How busy the load generator itself was during each step
+    harness = results_cache.load(artifact_path(broker_name, 'harness', request.args), parse_json, {})
+
+    # Result files that exist but could not be parsed, shown instead of their data
+    shown = [artifact_path(broker_name, kind, request.args) for kind in (
+        'ping', 'availability', 'max_clients', 'max_clients_hold', 'payload_sweep',
+        'ping_summary', 'latency', 'throughput', 'harness')]
+    shown += resource_paths(broker_name, job_id) if job_id else []
+    read_errors = [(os.path.relpath(path, app.root_path), results_cache.error(path))
+                   for path in shown if path and results_cache.error(path)]
+
+    # Download links for the files shown, relative to the app root
+    downloads = []
+    for label, path in (('Ping CSV', artifact_path(broker_name, 'ping', request.args)),
+                        ('Availability CSV', artifact_path(broker_name, 'availability', request.args)),
+                        ('Max Clients CSV', artifact_path(broker_name, 'max_clients', request.args)),
+                        ('Payload Sweep CSV', sweep_f),
+                        ('Resource Usage CSV', resource_paths(broker_name, job_id)[2] if job_id else None)):
+        if path:
+            # Parquet series are exported as CSV by /download
+            rel = os.path.relpath(path, app.root_path)
+            downloads.append((label, rel[:-len(PARQUET)] + '.csv' if is_parquet(rel) else rel))
+    for key, report in harness.items():
+        path = artifact_path(broker_name, f'profile_{key}', request.args)
+        if path:
+            downloads.append((f"Profile of {report['script']}", os.path.relpath(path, app.root_path)))
 
     # JSON‐encode for Chart.js in your template
-    avg_metrics_json = json.dumps(avg_metrics)
+    latency_metrics_json = json.dumps(latency_metrics)
  
     return render_template('results.html',
         broker_name=broker_name,
-        ping_timestamps=ping_ts,
-        ping_delays=ping_d,
+        ping_series=json.dumps(ping_series),
         mtbf=mtbf,
         mttr=mttr,
-        client_ids=c_ids,
-        client_times=c_times,
-        avg_metrics_json=avg_metrics_json,
-        resource_data=json.dumps(resource_data),
+        client_series=json.dumps(client_series),
+        hold_rows=hold_rows,
+        hold_metrics=hold_metrics,
+        sweep_rows=sweep_rows,
+        sweep_metrics=sweep_metrics,
+        throughput_rows=throughput_rows,
+        latency_metrics_json=latency_metrics_json,
+        resource_series=json.dumps(resource_series),
+        harness=harness,
+        read_errors=read_errors,
+        downloads=downloads,
         job_id=job_id
     )
 
+# Result kinds pooled by /compare, and the metrics each one contributes
+COMPARE_KINDS = ('ping', 'max_clients', 'resources', 'availability')
+COMPARE_RESAMPLES = 1000
+
+def ping_delays(path):
+    """Every RTT in a pinger series"""
+    if is_parquet(path):
+        return read_series(path, ['delay'])['delay']
+    rows = results_cache.load_appended(path, read_ping_rows, [])
+    return np.array([delay for _, delay in rows], dtype=float)
+
+def resource_usage(path):
+    """(cpu_percent, mem_usage) samples of a resource recording, or of an older run's CSV"""
+    if is_parquet(path):
+        cols = read_series(path, ['cpu_percent', 'mem_usage'])
+        return cols['cpu_percent'], cols['mem_usage']
+    if path.endswith('.csv'):
+        records = results_cache.load(path, parse_resource_csv, [])
+    else:
+        records = results_cache.load_appended(path, read_records, [])
+    records = np.array([r[1:3] for r in records], dtype=float).reshape(-1, 2)
+    return records[:, 0], records[:, 1]
+
+def comparison_sources():
+    """(kind, broker, absolute path) of every recorded run, plus legacy result files"""
+    sources = []
+    for kind in COMPARE_KINDS:
+        for broker, rel in job_store.artifacts(kind):
+            sources.append((kind, broker, os.path.join(app.root_path, rel)))
+        for broker in BROKER_IDS:
+            legacy = legacy_artifact(broker, kind, {})
+            if legacy and os.path.exists(legacy):
+                sources.append((kind, broker, legacy))
+    return sources
+
+def build_comparison(sources, paths):
+    """Per-broker statistics over every run in `paths`, as the /compare JSON"""
+    present = set(paths)
+    series = defaultdict(list)
+    for kind, broker, path in sources:
+        if path not in present:
+            continue
+        try:
+            if kind == 'ping':
+                series['delay'].append((broker, ping_delays(path)))
+            elif kind == 'max_clients':
+                series['connection_time'].append(
+                    (broker, results_cache.load(path, parse_max_clients, ([], []))[1]))
+            elif kind == 'resources':
+                cpu, mem = resource_usage(path)
+                series['cpu_percent'].append((broker, cpu))
+                series['mem_usage'].append((broker, mem))
+            elif kind == 'availability':
+                metrics = results_cache.load(path, parse_availability, {})
+                for metric in ('MTBF', 'MTTR', 'AVAILABILITY'):
+                    if metric in metrics:
+                        series[metric.lower()].append((broker, [float(metrics[metric])]))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Skipping {path} in comparison: {e}")
+    brokers = sorted({broker for parts in series.values() for broker, _ in parts})
+    return {
+        'brokers': brokers,
+        'runs': len(present),
+        'metrics': compare(series, brokers, resamples=COMPARE_RESAMPLES),
+    }
+
+@app.route('/compare')
+def compare_brokers():
+    """
+    Every broker side by side: delay, jitter, connection time, resource
+    use and availability over all recorded runs, with 95% bootstrap
+    confidence intervals on the means.  ?format=json returns the numbers.
+    """
+    sources = comparison_sources()
+    result = results_cache.aggregate('compare', [path for _, _, path in sources],
+                                     lambda paths: build_comparison(sources, paths))
+    if request.args.get('format') == 'json':
+        return jsonify(result)
+    return render_template('compare.html', comparison=result)
+
+# Job parameters that must match for two evaluation runs to be compared
+REGRESSION_CONFIG = ('broker_port', 'duration', 'ping_interval', 'max_clients', 'payload_size',
+                     'connect_mode', 'publishers', 'subscribers', 'publish_rate', 'arrival')
+# Result files of runs from before the job store, one run per file
+LEGACY_RUN_FILES = (('ping_summary', 'mqtt_stats_{}_*.csv'), ('resources', 'resource_usage_{}_*.csv'))
+
+def regression_runs(broker_name):
+    """
+    Every finished evaluation run of a broker, oldest first, as {'id',
+    'created', 'config', 'files': {kind: absolute path}}.  Result files
+    from before the job store each count as a run of config {'legacy': kind}.
+    """
+    runs, known = [], set()
+    for job in job_store.jobs(broker=broker_name, kind='evaluation', limit=1000):
+        if job['status'] != 'done':
+            continue
+        files = {a['kind']: os.path.join(app.root_path, a['path'])
+                 for a in job_store.job(job['id'])['artifacts']}
+        known.update(files.values())
+        # A job's resource CSV export duplicates its recording
+        known.add(resource_paths(broker_name, job['id'])[2])
+        runs.append({'id': job['id'], 'created': job['created'], 'files': files,
+                     'config': {k: str(job['params'][k]) for k in REGRESSION_CONFIG if k in job['params']}})
+    for kind, pattern in LEGACY_RUN_FILES:
+        for path in sorted(glob.glob(os.path.join(RESULTS_DIR, pattern.format(broker_name)))):
+            if path not in known:
+                runs.append({'id': os.path.basename(path), 'created': os.path.getmtime(path),
+                             'files': {kind: path}, 'config': {'legacy': kind}})
+    runs.sort(key=lambda r: r['created'])
+    return runs
+
+def run_metrics(files):
+    """
+    {metric: (samples or value, higher_is_worse)} for one run's files:
+    sample arrays where the run recorded a series, else one number.
+    """
+    out = {}
+    if 'ping' in files:
+        out['latency'] = (ping_delays(files['ping']), True)
+    if 'max_clients' in files:
+        times = results_cache.load(files['max_clients'], parse_max_clients, ([], []))[1]
+        out['connection_time'] = (np.asarray(times, dtype=float), True)
+    if 'resources' in files:
+        cpu, mem = resource_usage(files['resources'])
+        out['cpu_percent'] = (cpu, True)
+        out['mem_usage'] = (mem, True)
+    if 'max_clients_hold' in files:
+        rows, _ = results_cache.load(files['max_clients_hold'], parse_hold, ([], {}))
+        per_conn = [float(r['Mem_Per_Conn_Bytes']) for r in rows if r.get('Mem_Per_Conn_Bytes')]
+        if per_conn:
+            out['mem_per_conn'] = (per_conn[-1], True)
+    if 'throughput' in files:
+        for row in results_cache.load(files['throughput'], parse_dict_rows, []):
+            out[f"throughput_qos{row['QoS']}"] = (float(row['Delivered_Rate']), False)
+    for kind in ('ping_summary', 'latency'):
+        if kind in files:
+            for metric, values in results_cache.load(files[kind], load_latency_summary, {}).items():
+                value = values.get('P50_s', values.get('Avg_s'))
+                if value is not None:
+                    out[f'{metric}_p50' if 'P50_s' in values else f'{metric}_avg'] = (value, True)
+    return out
+
+def regression_report(broker_name, runs, test, alpha, min_change, baseline):
+    """Latest run vs the `baseline` runs before it, per configuration and metric"""
+    groups = defaultdict(list)
+    for run in runs:
+        groups[json.dumps(run['config'], sort_keys=True)].append(run)
+    results = []
+    for group in groups.values():
+        metrics = []
+        for run in group:
+            try:
+                metrics.append(run_metrics(run['files']))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Skipping run {run['id']} in regression check: {e}")
+                metrics.append({})
+        for name in sorted(set().union(*metrics)):
+            having = [(run, m[name]) for run, m in zip(group, metrics) if name in m]
+            latest_run, (latest, higher_is_worse) = having[-1]
+            base = having[-1 - baseline:-1]
+            if np.ndim(latest):
+                pooled = np.concatenate([np.asarray(v, dtype=float) for _, (v, _) in base]) if base else []
+                result = compare_samples(latest, pooled, higher_is_worse, test, alpha, min_change)
+            else:
+                result = compare_values(float(latest), [v for _, (v, _) in base], higher_is_worse,
+                                        min_change=min_change)
+            results.append(dict(result, metric=name, config=latest_run['config'],
+                                latest_run=latest_run['id'],
+                                baseline_runs=[run['id'] for run, _ in base]))
+    return {
+        'broker': broker_name,
+        'test': test, 'alpha': alpha, 'min_change': min_change, 'baseline': baseline,
+        'regressions': sum(r['verdict'] == 'regression' for r in results),
+        'results': results,
+    }
+
+def regression_params():
+    test = request.args.get('test', 'mannwhitney')
+    if test not in TESTS:
+        raise ValueError(f"test must be one of {', '.join(TESTS)}")
+    return (test, request.args.get('alpha', 0.01, type=float),
+            request.args.get('min_change', 0.05, type=float),
+            max(request.args.get('baseline', 5, type=int), 1))
+
+def broker_regressions(broker_name, params):
+    runs = regression_runs(broker_name)
+    paths = [path for run in runs for path in run['files'].values()]
+    return results_cache.aggregate(
+        ('regressions', broker_name, *params), paths,
+        lambda _: regression_report(broker_name, runs, *params))
+
+@app.route('/regressions/<broker_name>')
+def regressions(broker_name):
+    """
+    Whether a broker's latest run is slower or faster than its earlier runs
+    of the same configuration.  Query arguments: test (mannwhitney or ks),
+    alpha (0.01), min_change (relative median shift, 0.05) and baseline
+    (earlier runs pooled, 5).
+    """
+    try:
+        params = regression_params()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(broker_regressions(broker_name.lower(), params))
+
+@app.route('/regressions')
+def all_regressions():
+    """Regression counts and flagged metrics for every broker with recorded runs"""
+    try:
+        params = regression_params()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    out = {}
+    for broker_name in [*BROKER_IDS, REFERENCE_BROKER]:
+        report = broker_regressions(broker_name, params)
+        if report['results']:
+            out[broker_name] = {
+                'regressions': report['regressions'],
+                'flagged': [r for r in report['results'] if r['verdict'] == 'regression'],
+            }
+    return jsonify(out)
+
+@app.route('/series/<broker_name>/<name>')
+def series(broker_name, name):
+    """
+    One chart series ('ping', 'clients' or 'resources') between the optional
+    start/end x values, downsampled to `points` (0 = full resolution).
+    Takes the same job_id/max_clients/payload_size arguments as /results.
+    """
+    method = request.args.get('method', 'lttb')
+    if method not in METHODS:
+        return jsonify(error=f"method must be one of {', '.join(METHODS)}"), 400
+    try:
+        data = load_series(broker_name, name, request.args)
+    except KeyError:
+        return jsonify(error=f"unknown series {name}"), 404
+    return jsonify(reduce_series(
+        *data,
+        points=request.args.get('points', SERIES_POINTS, type=int),
+        method=method,
+        start=request.args.get('start', type=float),
+        end=request.args.get('end', type=float)
+    ))
+
 @app.route('/download/<path:filename>')
 def download_file(filename):
     full = os.path.join(app.root_path, filename)
+    # Series are stored as Parquet or binary recordings; export CSV on request
+    if full.endswith('.csv') and not os.path.exists(full):
+        base = full[:-len('.csv')]
+        for ext, export in ((PARQUET, to_csv), ('.bin', iter_csv)):
+            if os.path.exists(base + ext):
+                return Response(
+                    export(base + ext), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={os.path.basename(full)}'}
+                )
     return send_from_directory(os.path.dirname(full), os.path.basename(full), as_attachment=True)
 
 if __name__ == '__main__':
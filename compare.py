@@ -0,0 +1,117 @@
+"""
+Cross-broker statistics for the /compare page.
+
+Every sample of a metric, from every run of every broker, is concatenated
+into one array with a parallel array of broker codes, so per-broker
+counts, means, extremes and percentiles come out of a single sort and a
+few bincount calls instead of a loop over files.
+
+Means get percentile-bootstrap confidence intervals, drawn as (resamples
+x n) index matrices per broker.  Long series are first cut to a random
+subsample of max_samples points and the interval is
+widened back by sqrt(m / n) around the full-sample mean, which keeps the
+cost fixed while matching the 1/sqrt(n) scaling of the standard error.
+
+Jitter is the mean absolute difference between consecutive delays of the
+same run, as in the hand-built tables it replaces.
+"""
+import numpy as np
+
+STATS = ('count', 'mean', 'ci_low', 'ci_high', 'min', 'max', 'p50', 'p99')
+
+
+def concat_groups(parts, names):
+    """
+    One (values, codes, runs) triple from [(name, values), ...]: codes index
+    into `names`, runs number the parts so run boundaries stay visible.
+    """
+    index = {name: i for i, name in enumerate(names)}
+    arrays = [np.asarray(v, dtype=float) for _, v in parts]
+    sizes = np.array([len(a) for a in arrays], dtype=int)
+    values = np.concatenate(arrays) if arrays else np.empty(0)
+    codes = np.repeat(np.array([index[name] for name, _ in parts], dtype=int), sizes)
+    runs = np.repeat(np.arange(len(parts)), sizes)
+    ok = ~np.isnan(values)
+    return values[ok], codes[ok], runs[ok]
+
+
+def consecutive_differences(values, codes, runs):
+    """|x[i] - x[i-1]| within each run, with the broker code of each difference"""
+    same = runs[1:] == runs[:-1]
+    return np.abs(np.diff(values))[same], codes[1:][same]
+
+
+def bootstrap_mean_ci(values, resamples=1000, confidence=0.95, max_samples=5000, rng=None):
+    """Percentile-bootstrap interval for the mean of `values`"""
+    n = len(values)
+    if n < 2:
+        mean = float(values[0]) if n else float('nan')
+        return mean, mean
+    rng = rng or np.random.default_rng(0)
+    sample = values if n <= max_samples else rng.choice(values, max_samples, replace=False)
+    m = len(sample)
+    # Index matrices of about a million entries at a time
+    chunk = max(1, 1_000_000 // m)
+    means = np.concatenate([
+        sample[rng.integers(0, m, size=(min(chunk, resamples - i), m))].mean(axis=1)
+        for i in range(0, resamples, chunk)
+    ])
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(means, [alpha, 1 - alpha])
+    centre, scale = sample.mean(), np.sqrt(m / n)
+    full = values.mean()
+    return float(full + (low - centre) * scale), float(full + (high - centre) * scale)
+
+
+def group_stats(values, codes, n_groups, resamples=1000, confidence=0.95, seed=0):
+    """{stat: array over groups} for STATS; groups without samples get count 0 and NaN"""
+    counts = np.bincount(codes, minlength=n_groups)
+    sums = np.bincount(codes, weights=values, minlength=n_groups)
+    out = {name: np.full(n_groups, np.nan) for name in STATS}
+    out['count'] = counts
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out['mean'] = sums / counts
+
+    # One sort orders every group's samples; groups are then contiguous slices
+    order = np.lexsort((values, codes))
+    ordered = values[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    present = counts > 0
+    if present.any():
+        out['min'][present] = ordered[starts[present]]
+        out['max'][present] = ordered[starts[present] + counts[present] - 1]
+        for q, name in ((0.5, 'p50'), (0.99, 'p99')):
+            pos = starts[present] + np.floor(q * (counts[present] - 1)).astype(int)
+            out[name][present] = ordered[pos]
+
+    rng = np.random.default_rng(seed)
+    for g in np.flatnonzero(present):
+        out['ci_low'][g], out['ci_high'][g] = bootstrap_mean_ci(
+            ordered[starts[g]:starts[g] + counts[g]], resamples, confidence, rng=rng)
+    return out
+
+
+def metric_table(values, codes, names, **kwargs):
+    """{broker: {stat: value}} for the brokers that have samples"""
+    stats = group_stats(values, codes, len(names), **kwargs)
+    table = {}
+    for g, name in enumerate(names):
+        if stats['count'][g]:
+            table[name] = {s: (int(stats[s][g]) if s == 'count' else float(stats[s][g])) for s in STATS}
+    return table
+
+
+def compare(series, names, **kwargs):
+    """
+    Per-broker statistics for each metric.  series maps a metric name to
+    [(broker, samples), ...], one entry per run; 'delay' also yields
+    'jitter'.  Returns {metric: {broker: {stat: value}}}.
+    """
+    out = {}
+    for metric, parts in series.items():
+        values, codes, runs = concat_groups(parts, names)
+        out[metric] = metric_table(values, codes, names, **kwargs)
+        if metric == 'delay':
+            diffs, diff_codes = consecutive_differences(values, codes, runs)
+            out['jitter'] = metric_table(diffs, diff_codes, names, **kwargs)
+    return out
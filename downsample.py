@@ -0,0 +1,83 @@
+"""
+Reduce chart series to a fixed number of points before they are sent to
+the browser.
+
+lttb_indices() implements largest-triangle-three-buckets, which keeps the
+points that carry the visual shape of a line (spikes included); each
+bucket's triangle areas are computed in one vectorized step, leaving only
+a loop over buckets.  minmax_indices() keeps the lowest and highest point
+of every bucket and is fully vectorized; it is cheaper and guarantees that
+every extreme survives.  Both return sorted indices into the original
+arrays so several columns sharing one x axis can be reduced together.
+"""
+import numpy as np
+
+METHODS = ('lttb', 'minmax')
+
+
+def lttb_indices(x, y, points):
+    """Indices of the `points` samples LTTB keeps from (x, y)."""
+    n = len(y)
+    if points >= n or points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # First and last points are fixed; the rest is split into points-2 buckets
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    out = np.empty(points, dtype=int)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Third vertex: the mean of the next bucket (or the last point)
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        bx, by = x[lo:hi], y[lo:hi]
+        area = np.abs((x[a] - cx) * (by - y[a]) - (x[a] - bx) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+
+def minmax_indices(y, points):
+    """Indices of each bucket's minimum and maximum, about `points` in total."""
+    n = len(y)
+    buckets = max(points // 2, 1)
+    if points >= n or n == 0:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    size = -(-n // buckets)
+    padded = np.full(size * buckets, np.nan)
+    padded[:n] = y
+    grid = padded.reshape(buckets, size)
+    valid = ~np.isnan(grid).all(axis=1)
+    offsets = np.arange(buckets)[valid] * size
+    lows = np.nanargmin(grid[valid], axis=1) + offsets
+    highs = np.nanargmax(grid[valid], axis=1) + offsets
+    return np.unique(np.concatenate((lows, highs, [0, n - 1])))
+
+
+def select_indices(x, columns, points, method='lttb'):
+    """
+    Indices that keep the shape of every column over a shared x axis.
+    Each column gets an equal share of the point budget and the union of
+    their selections is returned, so a spike in any one series survives.
+    """
+    n = len(x)
+    if not points or points >= n or not columns:
+        return np.arange(n)
+    share = max(points // len(columns), 3)
+    picks = [
+        lttb_indices(x, y, share) if method == 'lttb' else minmax_indices(y, share)
+        for y in columns
+    ]
+    return np.unique(np.concatenate(picks))
+
+
+def window(x, start=None, end=None):
+    """(lo, hi) slice bounds of the samples with start <= x <= end; x must be sorted."""
+    x = np.asarray(x, dtype=float)
+    lo = 0 if start is None else int(np.searchsorted(x, start, side='left'))
+    hi = len(x) if end is None else int(np.searchsorted(x, end, side='right'))
+    return lo, hi
@@ -1,97 +1,301 @@
-import paho.mqtt.client as mqtt
+#!/usr/bin/env python3
+"""
+Broker availability: MTBF, MTTR and availability from concurrent probes.
+
+Independent probes share one asyncio loop, each with its own cadence:
+
+  session    a persistent MQTT session; a drop is seen the moment its
+             socket closes (on_disconnect), and it reconnects on the probe
+             interval until the broker accepts it again
+  connect    a fresh TCP connect + CONNECT/CONNACK every interval
+  publish    a QoS 1 PUBLISH on the persistent session, up when its PUBACK
+             arrives within the timeout
+  subscribe  the same message delivered back through the session's
+             subscription, i.e. the broker is still routing to subscribers
+
+Every probe keeps its own up/down state and stamps the wall-clock time of
+each change: an outage starts at the failing check (or the disconnect
+event) and ends at the first check that succeeds again.  The broker counts
+as down whenever any probe is down, so its outages are the union of the
+probes' outages.  MTBF is the mean up period between outages, MTTR the
+mean outage length.
+"""
+import argparse
+import asyncio
+import os
+import struct
 import time
 from datetime import datetime
-import os
-import argparse
 
-# Setup command-line arguments
-parser = argparse.ArgumentParser(description="MQTT Broker Pinger")
-parser.add_argument("--name", required=True, help="Broker name (used for output file naming)")
-parser.add_argument("--port", required=True, help="Broker port number ")
-parser.add_argument("--duration", required=True, help="Duration in seconds")
-args = parser.parse_args()
+import harness
+from live import report
+from mqtt_async import MQTTClient, MQTTError
+from schedule import Schedule
 
-# Parameters from CLI
-broker_name = args.name
 BROKER = "localhost"
-PORT = int(args.port) 
-INTERVAL = 5  # seconds
-DURATION = int(args.duration)  # seconds
-LOG_FILE = f"logs/availability_log__{broker_name}.txt"
-
-# Output file setup
-os.makedirs("logs", exist_ok=True)
-file_path = f"logs/broker_availability_results_{broker_name}_{DURATION}.csv"
-
-def check_broker():
-    client = mqtt.Client()
-    try:
-        start = time.time()
-        client.connect(BROKER, PORT, 3)
-        client.disconnect()
-        return "UP", time.time() - start
-    except:
-        return "DOWN", None
-
-# Tracking UP and DOWN durations
-up_times = []
-down_times = []
-last_state = None
-last_change_time = time.time()
-
-start_time = time.time()
-
-while time.time() - start_time < DURATION:
-    status, response_time = check_broker()
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    current_time = time.time()
-
-    # Transition tracking
-    if last_state and last_state != status:
-        duration = current_time - last_change_time
-        if last_state == "UP":
-            up_times.append(duration)
-        elif last_state == "DOWN":
-            down_times.append(duration)
-        last_change_time = current_time
-
-    # Handle case where the first state is recorded
-    if last_state is None:
-        last_change_time = current_time
-    last_state = status
-
-    with open(file_path, "a") as f:
-        if status == "UP":
-            f.write(f"{now} - {status} - {response_time:.4f} s\n")
+PROBES = ("session", "connect", "publish", "subscribe")
+
+# probe sequence number, send time (time.time)
+PAYLOAD = struct.Struct("!Qd")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure MQTT broker availability (MTBF/MTTR)")
+    parser.add_argument("--name", required=True, help="Broker name (used for output file naming)")
+    parser.add_argument("--host", default=BROKER, help="Broker host name or address")
+    parser.add_argument("--port", type=int, required=True, help="Broker port number")
+    parser.add_argument("--duration", type=float, required=True, help="Duration in seconds")
+    parser.add_argument("--interval", type=float, default=0.25,
+                        help="Seconds between checks of each probe (sub-second is fine)")
+    parser.add_argument("--timeout", type=float, default=1.0,
+                        help="Seconds before an unanswered check counts as a failure")
+    parser.add_argument("--probes", default=",".join(PROBES),
+                        help="Comma-separated probes to run (session is always kept for publish/subscribe)")
+    parser.add_argument("--output", default=None,
+                        help="Write the results CSV here instead of the default path under logs/")
+    return parser.parse_args()
+
+
+class ProbeState:
+    """Up/down state of one probe and the exact times it changed."""
+
+    def __init__(self, name, log):
+        self.name = name
+        self.up = True
+        self.checks = 0
+        self.failures = 0
+        self.outages = []  # [start, end]; end is None while the outage lasts
+        self._log = log
+
+    def mark(self, up, at, detail=""):
+        self.checks += 1
+        if not up:
+            self.failures += 1
+        if up == self.up:
+            return
+        self.up = up
+        if up:
+            self.outages[-1][1] = at
         else:
-            f.write(f"{now} - {status}\n")
-    print(f"{now} - {status}")
-    time.sleep(INTERVAL)
-
-# After loop ends, capture last interval
-final_duration = time.time() - last_change_time
-if last_state == "UP":
-    up_times.append(final_duration)
-else:
-    down_times.append(final_duration)
-
-# MTBF and MTTR Calculations
-MTBF = sum(up_times) / len(up_times) if up_times else 0
-MTTR = sum(down_times) / len(down_times) if down_times else 0
-availability = MTBF / (MTBF + MTTR) if (MTBF + MTTR) != 0 else 0
-failure_rate = 1 / MTBF if MTBF != 0 else 0
-
-# Output to log
-print("\n--- Availability Analysis ---")
-print(f"MTBF: {MTBF:.2f} s")
-print(f"MTTR: {MTTR:.2f} s")
-print(f"Availability: {availability:.4f}")
-print(f"Failure Rate (λ): {failure_rate:.6f}")
-
-# Optionally write to file
-with open(file_path, "w") as f:
-    f.write("Metric,Value\n")
-    f.write(f"MTBF,{MTBF:.2f}\n")
-    f.write(f"MTTR,{MTTR:.2f}\n")
-    f.write(f"Availability,{availability:.4f}\n")
-    f.write(f"Failure Rate,{failure_rate:.6f}\n")
+            self.outages.append([at, None])
+        stamp = datetime.fromtimestamp(at).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        self._log.write(f"{stamp} - {self.name} - {'UP' if up else 'DOWN'}"
+                        f"{' - ' + detail if detail else ''}\n")
+        self._log.flush()
+
+
+def merge_outages(intervals):
+    """Union of [start, end] intervals, sorted"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def availability_metrics(outages, start, end):
+    """MTBF, MTTR, availability and failure rate over [start, end] for closed outages"""
+    downtime = sum(e - s for s, e in outages)
+    uptime = (end - start) - downtime
+    # Up periods: before the first outage, between outages and after the last
+    edges = [start] + [t for o in outages for t in o] + [end]
+    up_periods = [b - a for a, b in zip(edges[::2], edges[1::2]) if b > a]
+    mtbf = sum(up_periods) / len(up_periods) if up_periods else 0.0
+    mttr = downtime / len(outages) if outages else 0.0
+    return {
+        "MTBF": mtbf,
+        "MTTR": mttr,
+        "Availability": uptime / (end - start) if end > start else 0.0,
+        "Failure Rate": 1 / mtbf if mtbf else 0.0,
+        "Outages": len(outages),
+        "Downtime": downtime,
+    }
+
+
+class AvailabilityMonitor:
+    def __init__(self, host, port, interval, timeout, probes, log):
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.timeout = timeout
+        self.probes = {name: ProbeState(name, log) for name in probes}
+        self.topic = f"availability/{os.getpid()}"
+        self.session = MQTTClient(f"avail-session-{os.getpid()}")
+        self._dropped = asyncio.Event()
+        self._deliveries = {}
+        self._seq = 0
+        self.connect_time = None
+
+    def _mark(self, name, up, at, detail=""):
+        if name in self.probes:
+            self.probes[name].mark(up, at, detail)
+
+    def _on_disconnect(self, client, error):
+        # A client abandoned by a timed-out reconnect can report its close late
+        if client is self.session:
+            self._mark("session", False, time.time(), str(error or "connection closed"))
+            self._dropped.set()
+
+    def _on_message(self, topic, payload, qos, dup):
+        if topic != self.topic or len(payload) < PAYLOAD.size:
+            return
+        seq, _ = PAYLOAD.unpack_from(payload)
+        fut = self._deliveries.pop(seq, None)
+        if fut is not None and not fut.done():
+            fut.set_result(time.time())
+
+    async def _ticks(self, end):
+        """Yield check times on a fixed schedule, skipping slots missed while a check was blocked"""
+        schedule = Schedule(1 / self.interval)
+        while schedule.next_ns < end * 1e9:
+            await schedule.wait()
+            yield
+            schedule.skip_missed()
+
+    async def run_session(self, end):
+        while time.monotonic() < end:
+            at = time.time()
+            try:
+                await asyncio.wait_for(self._open_session(), self.timeout)
+            except (OSError, MQTTError, asyncio.TimeoutError) as e:
+                self.session._abort()
+                self._mark("session", False, at, str(e) or type(e).__name__)
+                await asyncio.sleep(min(self.interval, max(end - time.monotonic(), 0)))
+                continue
+            self._mark("session", True, at)
+            self._dropped.clear()
+            try:
+                await asyncio.wait_for(self._dropped.wait(), max(end - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                break
+
+    async def _open_session(self):
+        # A fresh client per attempt, so a half-open one cannot touch the next
+        client = MQTTClient(f"avail-session-{os.getpid()}", keepalive=max(int(self.timeout * 2), 1),
+                            auto_keepalive=True)
+        client.on_message = self._on_message
+        client.on_disconnect = lambda error: self._on_disconnect(client, error)
+        self.session = client
+        await self.session.connect(self.host, self.port, self.timeout)
+        await self.session.subscribe(self.topic, 1)
+
+    async def run_connect(self, end):
+        client_id = f"avail-connect-{os.getpid()}"
+        async for _ in self._ticks(end):
+            at = time.time()
+            client = MQTTClient(client_id, keepalive=0)
+            try:
+                latency = await asyncio.wait_for(client.connect(self.host, self.port, self.timeout),
+                                                 self.timeout)
+                await client.disconnect()
+            except (OSError, MQTTError, asyncio.TimeoutError) as e:
+                client._abort()
+                self.connect_time = None
+                self._mark("connect", False, at, str(e) or type(e).__name__)
+                continue
+            self.connect_time = latency
+            self._mark("connect", True, at)
+
+    async def run_roundtrip(self, end):
+        loop = asyncio.get_running_loop()
+        async for _ in self._ticks(end):
+            if not self.session.connected:
+                # The session probe already records this outage
+                continue
+            self._seq += 1
+            seq, at = self._seq, time.time()
+            delivered = loop.create_future()
+            self._deliveries[seq] = delivered
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(
+                    self.session.publish(self.topic, PAYLOAD.pack(seq, at), qos=1), self.timeout)
+                self._mark("publish", True, at)
+            except (OSError, MQTTError, asyncio.TimeoutError) as e:
+                self._mark("publish", False, at, str(e) or type(e).__name__)
+            remaining = self.timeout - (time.monotonic() - started)
+            try:
+                await asyncio.wait_for(delivered, max(remaining, 0))
+                self._mark("subscribe", True, at)
+            except asyncio.TimeoutError:
+                self._mark("subscribe", False, at, "message not delivered")
+            finally:
+                self._deliveries.pop(seq, None)
+
+    async def run_reporter(self, end):
+        while time.monotonic() < end:
+            up = all(p.up for p in self.probes.values())
+            report(status="UP" if up else "DOWN",
+                   response_time=None if self.connect_time is None else round(self.connect_time, 4))
+            await asyncio.sleep(1.0)
+
+    async def run(self, duration):
+        harness.watch_loop()
+        end = time.monotonic() + duration
+        tasks = [self.run_session(end), self.run_reporter(end)]
+        if "connect" in self.probes:
+            tasks.append(self.run_connect(end))
+        if "publish" in self.probes or "subscribe" in self.probes:
+            tasks.append(self.run_roundtrip(end))
+        await asyncio.gather(*tasks)
+        await self.session.disconnect()
+
+
+def write_results(path, monitor, start, end):
+    for probe in monitor.probes.values():
+        for outage in probe.outages:
+            if outage[1] is None:
+                outage[1] = end
+    broker_outages = merge_outages([o for p in monitor.probes.values() for o in p.outages])
+    metrics = availability_metrics(broker_outages, start, end)
+
+    print("\n--- Availability Analysis ---")
+    print(f"MTBF: {metrics['MTBF']:.2f} s")
+    print(f"MTTR: {metrics['MTTR']:.3f} s")
+    print(f"Availability: {metrics['Availability']:.4f}")
+    print(f"Failure Rate (λ): {metrics['Failure Rate']:.6f}")
+    print(f"Outages: {metrics['Outages']}")
+
+    with open(path, "w") as f:
+        f.write("Metric,Value\n")
+        f.write(f"MTBF,{metrics['MTBF']:.2f}\n")
+        f.write(f"MTTR,{metrics['MTTR']:.3f}\n")
+        f.write(f"Availability,{metrics['Availability']:.4f}\n")
+        f.write(f"Failure Rate,{metrics['Failure Rate']:.6f}\n")
+        f.write(f"Outages,{metrics['Outages']}\n")
+        f.write(f"Downtime,{metrics['Downtime']:.3f}\n")
+        for probe in monitor.probes.values():
+            f.write(f"{probe.name} Checks,{probe.checks}\n")
+            f.write(f"{probe.name} Failures,{probe.failures}\n")
+            f.write(f"{probe.name} Outages,{len(probe.outages)}\n")
+
+    outages_path = os.path.splitext(path)[0] + "_outages.csv"
+    with open(outages_path, "w") as f:
+        f.write("probe,start,end,duration\n")
+        rows = [("broker", s, e) for s, e in broker_outages]
+        rows += [(p.name, s, e) for p in monitor.probes.values() for s, e in p.outages]
+        f.writelines(f"{name},{s:.6f},{e:.6f},{e - s:.6f}\n" for name, s, e in rows)
+
+
+def main():
+    args = parse_args()
+    probes = [p.strip() for p in args.probes.split(",") if p.strip()]
+    unknown = set(probes) - set(PROBES)
+    if unknown:
+        raise SystemExit(f"unknown probes: {', '.join(sorted(unknown))}")
+    if "session" not in probes:
+        probes.insert(0, "session")
+
+    os.makedirs("logs", exist_ok=True)
+    output = args.output or f"logs/broker_availability_results_{args.name}_{int(args.duration)}.csv"
+    with open(f"logs/availability_log__{args.name}.txt", "a") as log:
+        monitor = AvailabilityMonitor(args.host, args.port, args.interval, args.timeout, probes, log)
+        start = time.time()
+        asyncio.run(monitor.run(args.duration))
+        write_results(output, monitor, start, time.time())
+
+
+if __name__ == "__main__":
+    harness.run(main)
@@ -1,10 +1,21 @@
 #!/usr/bin/env python3
 import os
+import sys
 import time
 import argparse
 from datetime import datetime
-import logging
-import paho.mqtt.client as mqtt
+
+import harness
+from histogram import LatencyHistogram, SUMMARY_HEADER, summary_row
+from live import report
+from ping_probe import PingProbe
+from schedule import ARRIVALS, describe_lag, lag_row
+
+# series_store.py is shared with the Flask app one directory up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from series_store import PING_FIELDS, SeriesWriter, series_path
+
+BROKER = "localhost"
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -12,123 +23,95 @@ def parse_args():
     )
     parser.add_argument("--name", default="localhost",
                         help="MQTT broker hostname or IP (used in filenames)")
+    parser.add_argument("--host", default=BROKER, help="Broker host name or address")
     parser.add_argument("--port", type=int, default=1883,
                         help="MQTT broker port")
     parser.add_argument("--topic", default="test/topic",
                         help="Topic to SUBSCRIBE to for measuring subscription delay")
-    parser.add_argument("--duration", type=int, required=True,
+    parser.add_argument("--duration", type=float, required=True,
                         help="Total test duration in seconds")
     parser.add_argument("--interval", type=float, default=5.0,
-                        help="Interval (seconds) between PINGREQs (can be fractional)")
+                        help="Interval (seconds) between PINGREQs, down to milliseconds (e.g. 0.001)")
+    parser.add_argument("--arrival", choices=ARRIVALS, default="constant",
+                        help="Send PINGREQs evenly spaced or as Poisson arrivals averaging --interval")
+    parser.add_argument("--window", type=int, default=1024,
+                        help="Most PINGREQs in flight at once; probes beyond it are skipped")
+    parser.add_argument("--timeout", type=float, default=5.0,
+                        help="Seconds without a PINGRESP before the session is treated as broken")
+    parser.add_argument("--output", default=None,
+                        help="Write the per-ping series here (.parquet or .csv) instead of "
+                             "results/broker_pinger_results_<name>.parquet/.csv")
+    parser.add_argument("--summary", default=None,
+                        help="Write the summary CSV here instead of a timestamped file under results/")
     return parser.parse_args()
 
-def make_ping_log(name):
-    """
-    Create the per-ping CSV:
-      results/broker_pinger_results_<name>.csv
-    with header "timestamp,delay"
+def make_ping_log(name, path=None):
     """
-    path = os.path.join("results", f"broker_pinger_results_{name}.csv")
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w") as f:
-        f.write("timestamp,delay\n")
-    return path
-
-def on_connect(client, userdata, flags, rc, properties=None):
-    """Fired when CONNECT completes."""
-    now   = time.time()
-    delay = now - userdata["conn_start"]
-    userdata["conn_delays"].append(delay)
-    print(f"[CONNECT] Delay: {delay:.4f}s")
-    # immediately SUBSCRIBE and time it
-    userdata["sub_start"] = time.time()
-    client.subscribe(userdata["topic"])
-
-def on_subscribe(client, userdata, mid, granted_qos, properties=None):
-    """Fired when SUBSCRIBE is acknowledged."""
-    now   = time.time()
-    delay = now - userdata["sub_start"]
-    userdata["sub_delays"].append(delay)
-    print(f"[SUBSCRIBE] Delay: {delay:.4f}s")
-
-def on_log(client, userdata, level, buf):
+    Open the per-ping series (by default
+      results/broker_pinger_results_<name>.parquet, or .csv without pyarrow)
+    with columns timestamp, delay.  Pings are buffered and written in batches.
     """
-    All Paho log messages flow here.  We watch for PINGRESP
-    so we can compute RTT and append it to the per-ping CSV.
-    """
-    if "PINGRESP" in buf:
-        now = time.time()
-        rtt = now - userdata["ping_start"]
-        userdata["ping_rtts"].append(rtt)
-        userdata["total_ping_received"] += 1
-        print(f"[PINGRESP] RTT: {rtt:.4f}s")
-
-        # append line-by-line to CSV
-        with open(userdata["ping_log"], "a") as f:
-            f.write(f"{now:.6f},{rtt:.6f}\n")
-
-def summarize(data):
-    """Compute min, max, avg, count over a list of floats."""
-    if not data:
-        return None, None, None, 0
-    mn  = min(data)
-    mx  = max(data)
-    avg = sum(data)/len(data)
-    return mn, mx, avg, len(data)
+    path = path or series_path(os.path.join("results", f"broker_pinger_results_{name}"))
+    return SeriesWriter(path, PING_FIELDS, broker=name)
+
+def make_rtt_handler(probe, metrics, ping_log, verbose):
+    """Record each answered probe; live metrics are reported at most twice a second."""
+    last_report = [0.0]
+    record = harness.stage("record_rtt")
+
+    def on_rtt(sent_ns, rtt_ns):
+        started = time.perf_counter_ns()
+        metrics["ping_rtts"].record(rtt_ns)
+        rtt = rtt_ns / 1e9
+        ping_log.append(probe.epoch(sent_ns), rtt)
+        if verbose:
+            print(f"[PINGRESP] RTT: {rtt:.6f}s")
+        now = time.monotonic()
+        if now - last_report[0] >= 0.5:
+            last_report[0] = now
+            report(rtt=round(rtt, 6), sent=probe.sent, lost=probe.lost)
+        record.add(started)
+    return on_rtt
+
+def summarize(hist):
+    """Compute min, max, avg, tail percentiles and count from a histogram."""
+    if not hist.total:
+        return None
+    return hist.summary()
 
 def main():
     args = parse_args()
 
-    # enable DEBUG logging so on_log events fire
-    logging.basicConfig(level=logging.DEBUG)
-
     # in-memory metrics store
     metrics = {
-        "conn_start":          None,
-        "sub_start":           None,
-        "ping_start":          None,
-        "topic":               args.topic,
-        "conn_delays":         [],
-        "sub_delays":          [],
-        "ping_rtts":           [],
-        "total_ping_sent":     0,
-        "total_ping_received": 0
+        "conn_delays":         LatencyHistogram(),
+        "sub_delays":          LatencyHistogram(),
+        "ping_rtts":           LatencyHistogram(),
     }
 
-    # prepare the per-ping CSV
-    metrics["ping_log"] = make_ping_log(args.name)
-
-    # force MQTT v3.1.1 so our callback signatures match
-    client = mqtt.Client(userdata=metrics, protocol=mqtt.MQTTv311)
-    client.enable_logger()
-
-    client.on_connect   = on_connect
-    client.on_subscribe = on_subscribe
-    client.on_log       = on_log
-
-    # asynchronously connect
-    metrics["conn_start"] = time.time()
-    client.connect_async("localhost", args.port, keepalive=int(args.interval))
-    client.loop_start()
-
-    # give one full interval before first ping
-    time.sleep(args.interval)
-
-    # ping loop
-    start = time.time()
-    while time.time() - start < args.duration:
-        metrics["total_ping_sent"] += 1
-        metrics["ping_start"] = time.time()
-        # Paho’s public .ping() may be missing—fall back to private API
-        if hasattr(client, "ping"):
-            client.ping()
-        else:
-            client._send_pingreq()
-        time.sleep(args.interval)
-
-    # tear down
-    client.loop_stop()
-    client.disconnect()
+    # prepare the per-ping series
+    ping_log = make_ping_log(args.name, args.output)
+    try:
+        # keepalive must outlast the gap between probes or the broker drops us
+        probe = PingProbe(args.host, args.port, args.interval, window=args.window,
+                          timeout=args.timeout, keepalive=max(60, int(args.interval * 2) + 1),
+                          arrival=args.arrival)
+
+        delay = probe.connect()
+        metrics["conn_delays"].record_seconds(delay)
+        print(f"[CONNECT] Delay: {delay:.4f}s")
+        delay = probe.subscribe(args.topic)
+        metrics["sub_delays"].record_seconds(delay)
+        print(f"[SUBSCRIBE] Delay: {delay:.4f}s")
+
+        # open-loop, pipelined probes
+        probe.run(args.duration, make_rtt_handler(probe, metrics, ping_log, args.interval >= 1.0))
+        probe.close()
+    finally:
+        # Also when aborted: a Parquet series is unreadable until its footer is written
+        ping_log.close()
+    metrics["total_ping_sent"] = probe.sent
+    metrics["total_ping_received"] = probe.received
 
     # compute summaries
     conn_stats = summarize(metrics["conn_delays"])
@@ -138,41 +121,42 @@ def main():
     # print console summary
     print("\n=== Summary ===")
     print(f"PINGREQ sent: {metrics['total_ping_sent']}, "
-          f"PINGRESP recv: {metrics['total_ping_received']}")
+          f"PINGRESP recv: {metrics['total_ping_received']}, "
+          f"lost: {probe.lost}, skipped: {probe.skipped}, reconnects: {probe.reconnects}")
+    print(describe_lag(probe.schedule.lag, probe.schedule.late))
+    harness.note(schedule=probe.schedule.summary())
     for label, stats in [
         ("Connection Setup", conn_stats),
         ("Subscription",     sub_stats),
         ("Ping RTT",         ping_stats)
     ]:
-        mn, mx, avg, cnt = stats
-        if cnt:
-            print(f"{label:18s} | min: {mn:.4f}s  max: {mx:.4f}s  "
-                  f"avg: {avg:.4f}s  count: {cnt}")
+        if stats:
+            print(f"{label:18s} | min: {stats['min']:.4f}s  p50: {stats['p50']:.4f}s  "
+                  f"p99: {stats['p99']:.4f}s  p99.9: {stats['p99.9']:.4f}s  "
+                  f"max: {stats['max']:.4f}s  count: {stats['count']}")
         else:
             print(f"{label:18s} | no data")
 
-    # write the 3-line summary CSV
+    # write the summary CSV
     os.makedirs("results", exist_ok=True)
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    summary_file = os.path.join(
+    summary_file = args.summary or os.path.join(
         "results",
         f"mqtt_stats_{args.name}_{args.port}_{ts}.csv"
     )
     with open(summary_file, "w") as f:
-        f.write("Metric,Min_s,Max_s,Avg_s,Count\n")
-        f.write(f"ConnectionSetup,{conn_stats[0] or ''},"
-                f"{conn_stats[1] or ''},{conn_stats[2] or ''},"
-                f"{conn_stats[3]}\n")
-        f.write(f"Subscription,{sub_stats[0] or ''},"
-                f"{sub_stats[1] or ''},{sub_stats[2] or ''},"
-                f"{sub_stats[3]}\n")
-        f.write(f"PingRTT,{ping_stats[0] or ''},"
-                f"{ping_stats[1] or ''},{ping_stats[2] or ''},"
-                f"{ping_stats[3]}\n")
-        f.write(f"PingREQ_Sent,,,,{metrics['total_ping_sent']}\n")
-        f.write(f"PingRESP_Recv,,,,{metrics['total_ping_received']}\n")
+        f.write(SUMMARY_HEADER + "\n")
+        f.write(summary_row("ConnectionSetup", metrics["conn_delays"]) + "\n")
+        f.write(summary_row("Subscription", metrics["sub_delays"]) + "\n")
+        f.write(summary_row("PingRTT", metrics["ping_rtts"]) + "\n")
+        f.write(lag_row(probe.schedule.lag) + "\n")
+        f.write(f"PingREQ_Sent,,,,,,,,{metrics['total_ping_sent']}\n")
+        f.write(f"PingRESP_Recv,,,,,,,,{metrics['total_ping_received']}\n")
+        f.write(f"Ping_Lost,,,,,,,,{probe.lost}\n")
+        f.write(f"Ping_Skipped,,,,,,,,{probe.skipped}\n")
+        f.write(f"Reconnects,,,,,,,,{probe.reconnects}\n")
 
     print(f"\nStats saved to {summary_file}")
 
 if __name__ == "__main__":
-    main()
+    harness.run(main)
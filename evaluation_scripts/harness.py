@@ -0,0 +1,368 @@
+"""
+Self-instrumentation of the load generator.
+
+When a run reports poor numbers, this shows whether the broker or the
+Python harness was slow.  run(main) runs a script's main() under a probe
+when --harness (report path) or --harness_profile is given, and records:
+
+  stages       time spent in named hot-path sections (stage(name).add()),
+               as count, total and max: cheap enough for per-message use
+  loop lag     how long a callback waits in a watched asyncio loop's ready
+               queue, measured by posting one from a sampler thread
+  thread lag   how late the sampler thread itself wakes; a main thread
+               holding the GIL delays it even in scripts without a loop
+  cpu, rss     process CPU time (plus reaped worker processes) and
+               resident memory
+  gc           every collection's pause, via gc.callbacks
+  notes        anything the script adds with note(), e.g. schedule lag
+
+With --harness_profile, SIGPROF samples the main thread's stack every
+few milliseconds of CPU time and writes folded stacks (one "a;b;c count"
+line per stack, the input of flamegraph.pl and speedscope).
+
+The report is written as JSON.  The run counts as saturated when loop or
+thread lag p99 passes --harness_max_lag, CPU passes --harness_max_cpu (if
+set), or a noted schedule fell behind; the script then exits with
+SATURATED_EXIT after writing its results, so the step is flagged.
+
+Shards started by loadgen.run_sharded() are probed (and profiled) too;
+their lag, GC, stage counters and stacks are merged into the
+coordinator's report.
+"""
+import argparse
+import collections
+import gc
+import json
+import os
+import resource
+import signal
+import sys
+import threading
+import time
+
+from histogram import LatencyHistogram
+
+SATURATED_EXIT = 3
+
+SAMPLE_INTERVAL = 0.1
+PROFILE_INTERVAL = 0.005
+
+PARSER = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+PARSER.add_argument("--harness", default=None, help="Write the harness report (JSON) here")
+PARSER.add_argument("--harness_profile", default=None,
+                    help="Sample the main thread's stacks and write them here as folded stacks")
+PARSER.add_argument("--harness_max_lag", type=float, default=0.1,
+                    help="Saturated when loop or thread lag p99 exceeds this (s)")
+PARSER.add_argument("--harness_max_cpu", type=float, default=0,
+                    help="Saturated when the generator's CPU use exceeds this %% of one core (0 = off)")
+
+_active = None
+
+
+class Stage:
+    """Count, total and longest duration of one hot-path section."""
+
+    __slots__ = ("name", "count", "total_ns", "max_ns")
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def add(self, started_ns):
+        """Count one pass that began at perf_counter_ns() == started_ns"""
+        elapsed = time.perf_counter_ns() - started_ns
+        self.count += 1
+        self.total_ns += elapsed
+        if elapsed > self.max_ns:
+            self.max_ns = elapsed
+
+    def merge(self, d):
+        """Add the counters of another Stage's to_dict()"""
+        self.count += d["count"]
+        self.total_ns += d["total_ns"]
+        self.max_ns = max(self.max_ns, d["max_ns"])
+
+    def to_dict(self):
+        return {"count": self.count, "total_ns": self.total_ns, "max_ns": self.max_ns}
+
+
+STAGES = {}
+
+
+def stage(name):
+    """The process-wide Stage called `name`, created on first use"""
+    s = STAGES.get(name)
+    if s is None:
+        s = STAGES[name] = Stage(name)
+    return s
+
+
+def process_rss():
+    """Current resident set size in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class HarnessProbe:
+    def __init__(self, max_lag=0.1, max_cpu=0, profile=None):
+        self.max_lag = max_lag
+        self.max_cpu = max_cpu
+        self.profile = profile
+        self.loop_lag = LatencyHistogram()
+        self.thread_lag = LatencyHistogram()
+        self.gc_pause = LatencyHistogram()
+        self.gc_collections = [0, 0, 0]
+        self.rss_max = 0
+        self.notes = {}
+        self.workers = []
+        self._worker_stages = {}
+        self._loops = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._gc_started = None
+        self._stacks = collections.Counter()
+
+    # -- lifecycle ------------------------------------------------------
+
+    def start(self):
+        for s in STAGES.values():
+            s.count = s.total_ns = s.max_ns = 0
+        self._wall0 = time.monotonic()
+        self._cpu0 = time.process_time()
+        self._children0 = children_cpu()
+        gc.callbacks.append(self._on_gc)
+        if self.profile and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGPROF, self._on_sigprof)
+            signal.setitimer(signal.ITIMER_PROF, PROFILE_INTERVAL, PROFILE_INTERVAL)
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self.profile:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        self._stop.set()
+        self._thread.join()
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+        self.wall_s = time.monotonic() - self._wall0
+        self.cpu_s = time.process_time() - self._cpu0
+        self.children_cpu_s = children_cpu() - self._children0
+        self.rss_max = max(self.rss_max, process_rss())
+
+    def watch_loop(self, loop):
+        self._loops.append(loop)
+
+    # -- samplers -------------------------------------------------------
+
+    def _sample(self):
+        deadline = time.monotonic()
+        while not self._stop.is_set():
+            deadline += SAMPLE_INTERVAL
+            self._stop.wait(max(deadline - time.monotonic(), 0))
+            now = time.monotonic()
+            self.thread_lag.record_seconds(max(now - deadline, 0))
+            if now - deadline > SAMPLE_INTERVAL:
+                deadline = now
+            self.rss_max = max(self.rss_max, process_rss())
+            for loop in list(self._loops):
+                try:
+                    loop.call_soon_threadsafe(self._loop_tick, time.perf_counter_ns())
+                except RuntimeError:
+                    self._loops.remove(loop)  # closed
+
+    def _loop_tick(self, posted_ns):
+        self.loop_lag.record(time.perf_counter_ns() - posted_ns)
+
+    def _on_gc(self, phase, info):
+        if phase == "start":
+            self._gc_started = time.perf_counter_ns()
+        elif self._gc_started is not None:
+            self.gc_pause.record(time.perf_counter_ns() - self._gc_started)
+            self.gc_collections[info["generation"]] += 1
+            self._gc_started = None
+
+    def _on_sigprof(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        self._stacks[";".join(reversed(stack))] += 1
+
+    # -- report ---------------------------------------------------------
+
+    def snapshot(self):
+        """Everything recorded, in a form that can cross a process boundary"""
+        return {
+            "wall_s": self.wall_s,
+            "cpu_s": self.cpu_s,
+            "children_cpu_s": self.children_cpu_s,
+            "rss_max_bytes": self.rss_max,
+            "loop_lag": self.loop_lag.to_dict(),
+            "thread_lag": self.thread_lag.to_dict(),
+            "gc_pause": self.gc_pause.to_dict(),
+            "gc_collections": self.gc_collections,
+            "stages": {name: s.to_dict() for name, s in STAGES.items() if s.count},
+            "notes": self.notes,
+            "stacks": dict(self._stacks),
+        }
+
+    def merge_worker(self, snapshot):
+        """Fold a shard's snapshot into this report"""
+        self.loop_lag.merge(LatencyHistogram.from_dict(snapshot["loop_lag"]))
+        self.thread_lag.merge(LatencyHistogram.from_dict(snapshot["thread_lag"]))
+        self.gc_pause.merge(LatencyHistogram.from_dict(snapshot["gc_pause"]))
+        for generation, count in enumerate(snapshot["gc_collections"]):
+            self.gc_collections[generation] += count
+        for name, s in snapshot["stages"].items():
+            self._worker_stages.setdefault(name, Stage(name)).merge(s)
+        self._stacks.update(snapshot["stacks"])
+        self.workers.append({
+            "cpu_pct": 100 * snapshot["cpu_s"] / snapshot["wall_s"] if snapshot["wall_s"] else 0.0,
+            "rss_max_bytes": snapshot["rss_max_bytes"],
+            "stages": snapshot["stages"],
+        })
+
+    def report(self, script):
+        snap = self.snapshot()
+        cpu_pct = 100 * self.cpu_s / self.wall_s if self.wall_s else 0.0
+        lags = {name: getattr(self, name).summary() for name in ("loop_lag", "thread_lag")}
+        reasons = [
+            f"{name.replace('_', ' ')} p99 {s['p99'] * 1000:.1f} ms > {self.max_lag * 1000:.1f} ms"
+            for name, s in lags.items() if s["count"] and s["p99"] > self.max_lag
+        ]
+        busiest = max([cpu_pct] + [w["cpu_pct"] for w in self.workers])
+        if self.max_cpu and busiest > self.max_cpu:
+            reasons.append(f"CPU {busiest:.0f}% of a core > {self.max_cpu:.0f}%")
+        reasons += [f"{name}: {value['late']}/{value['fired']} fired a gap or more late"
+                    for name, value in self.notes.items()
+                    if isinstance(value, dict) and value.get("saturated")]
+        # Stage totals over this process and every shard
+        totals = {}
+        for name, s in snap["stages"].items():
+            totals.setdefault(name, Stage(name)).merge(s)
+        for name, w in self._worker_stages.items():
+            totals.setdefault(name, Stage(name)).merge(w.to_dict())
+        stages = {
+            name: {
+                "count": s.count,
+                "total_s": s.total_ns / 1e9,
+                "mean_s": s.total_ns / s.count / 1e9,
+                "max_s": s.max_ns / 1e9,
+                # Summed over processes, so it can pass 100 with several workers
+                "wall_pct": 100 * s.total_ns / 1e9 / self.wall_s if self.wall_s else 0.0,
+            }
+            for name, s in totals.items()
+        }
+        return {
+            "script": script,
+            "wall_s": self.wall_s,
+            "cpu_s": self.cpu_s,
+            "cpu_pct": cpu_pct,
+            "children_cpu_s": self.children_cpu_s,
+            "rss_max_bytes": self.rss_max,
+            "loop_lag": lags["loop_lag"],
+            "thread_lag": lags["thread_lag"],
+            "gc": {"collections": self.gc_collections, "pause": self.gc_pause.summary()},
+            "stages": stages,
+            "workers": self.workers,
+            "notes": self.notes,
+            "profile": self.profile,
+            "max_lag": self.max_lag,
+            "max_cpu": self.max_cpu,
+            "saturated": bool(reasons),
+            "reasons": reasons,
+        }
+
+    def write_profile(self):
+        with open(self.profile, "w") as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# -- module API: no-ops unless a probe is running ------------------------
+
+def watch_loop():
+    """Measure the running asyncio loop's lag; call from inside the loop"""
+    if _active is not None:
+        import asyncio
+        _active.watch_loop(asyncio.get_running_loop())
+
+
+def note(**values):
+    """
+    Attach values to the report.  A schedule summary (schedule.lag_summary())
+    with saturated=True marks the run saturated.
+    """
+    if _active is not None:
+        _active.notes.update(values)
+
+
+def start_worker():
+    """In a forked shard: replace the inherited probe with a fresh one, or None"""
+    global _active
+    if _active is None:
+        return None
+    if _active._on_gc in gc.callbacks:
+        gc.callbacks.remove(_active._on_gc)
+    _active = HarnessProbe(_active.max_lag, _active.max_cpu, _active.profile).start()
+    return _active
+
+
+def finish_worker(probe):
+    probe.stop()
+    return probe.snapshot()
+
+
+def merge_worker(snapshot):
+    if _active is not None:
+        _active.merge_worker(snapshot)
+
+
+def run(main, argv=None):
+    """
+    Call main() with the harness options removed from sys.argv, probing it
+    if --harness or --harness_profile was given.
+    """
+    global _active
+    opts, rest = PARSER.parse_known_args(sys.argv[1:] if argv is None else argv)
+    sys.argv[1:] = rest
+    if not opts.harness and not opts.harness_profile:
+        return main()
+    probe = _active = HarnessProbe(opts.harness_max_lag, opts.harness_max_cpu,
+                                   opts.harness_profile).start()
+    try:
+        main()
+    finally:
+        probe.stop()
+        _active = None
+        report = probe.report(os.path.basename(sys.argv[0]))
+        if opts.harness:
+            os.makedirs(os.path.dirname(opts.harness) or ".", exist_ok=True)
+            with open(opts.harness, "w") as f:
+                json.dump(report, f, indent=1)
+        if opts.harness_profile:
+            probe.write_profile()
+    parts = [f"CPU {report['cpu_pct']:.0f}% of a core"]
+    if report["workers"]:
+        parts[0] += f" (workers up to {max(w['cpu_pct'] for w in report['workers']):.0f}%)"
+    for name in ("loop_lag", "thread_lag"):
+        if report[name]["count"]:
+            parts.append(f"{name.replace('_', ' ')} p99 {report[name]['p99'] * 1000:.2f} ms")
+    parts.append(f"GC max pause {report['gc']['pause']['max'] * 1000:.2f} ms")
+    parts.append(f"peak RSS {report['rss_max_bytes'] / 2 ** 20:.1f} MiB")
+    print(f"\nHarness: {', '.join(parts)}")
+    if report["saturated"]:
+        print(f"Harness saturated: {'; '.join(report['reasons'])}")
+        sys.exit(SATURATED_EXIT)
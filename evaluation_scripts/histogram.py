@@ -0,0 +1,139 @@
+"""
+Constant-memory latency histogram with HDR-style log-linear buckets.
+
+Values are recorded as integer nanoseconds.  Every power-of-two range is
+split into SUB_BUCKETS/2 linear sub-buckets, so any recorded value is
+reported to within 1/128 (< 0.8 %) of its true value while the whole
+range from 1 ns to an hour fits in a few thousand counters, however many
+samples are recorded.  Histograms from several processes can be merged
+exactly, which is what makes percentiles from sharded runs correct.
+"""
+import math
+from array import array
+
+SUB_BITS = 8
+SUB_BUCKETS = 1 << SUB_BITS           # 256
+HALF = SUB_BUCKETS >> 1               # 128
+
+NS_PER_S = 1_000_000_000
+DEFAULT_HIGHEST_NS = 3600 * NS_PER_S  # one hour
+
+# Percentiles reported everywhere a latency summary is written
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def bucket_index(value):
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BITS
+    return SUB_BUCKETS + (shift - 1) * HALF + ((value >> shift) - HALF)
+
+
+def bucket_bounds(index):
+    """Inclusive (lowest, highest) value that lands in bucket `index`."""
+    if index < SUB_BUCKETS:
+        return index, index
+    shift = (index - SUB_BUCKETS) // HALF + 1
+    mantissa = (index - SUB_BUCKETS) % HALF + HALF
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """Log-bucketed histogram of nanosecond latencies."""
+
+    def __init__(self, highest_ns=DEFAULT_HIGHEST_NS):
+        self.highest_ns = highest_ns
+        self.counts = array("Q", bytes(8 * (bucket_index(highest_ns) + 1)))
+        self.total = 0
+        self.sum_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+
+    def record(self, value_ns, count=1):
+        value_ns = min(max(int(value_ns), 0), self.highest_ns)
+        self.counts[bucket_index(value_ns)] += count
+        self.total += count
+        self.sum_ns += value_ns * count
+        if self.min_ns is None or value_ns < self.min_ns:
+            self.min_ns = value_ns
+        if value_ns > self.max_ns:
+            self.max_ns = value_ns
+
+    def record_seconds(self, seconds, count=1):
+        self.record(seconds * NS_PER_S, count)
+
+    def merge(self, other):
+        if len(other.counts) != len(self.counts):
+            raise ValueError("cannot merge histograms with different ranges")
+        for i, c in enumerate(other.counts):
+            if c:
+                self.counts[i] += c
+        self.total += other.total
+        self.sum_ns += other.sum_ns
+        if other.min_ns is not None and (self.min_ns is None or other.min_ns < self.min_ns):
+            self.min_ns = other.min_ns
+        self.max_ns = max(self.max_ns, other.max_ns)
+        return self
+
+    def percentile(self, q):
+        """Value (ns) at or below which q percent of samples fall."""
+        if not self.total:
+            return 0
+        target = max(math.ceil(q / 100.0 * self.total), 1)
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c:
+                seen += c
+                if seen >= target:
+                    return min(bucket_bounds(i)[1], self.max_ns)
+        return self.max_ns
+
+    def mean(self):
+        return self.sum_ns / self.total if self.total else 0
+
+    def summary(self):
+        """min/max/avg/percentiles in seconds plus the sample count."""
+        out = {
+            "min": (self.min_ns or 0) / NS_PER_S,
+            "max": self.max_ns / NS_PER_S,
+            "avg": self.mean() / NS_PER_S,
+            "count": self.total,
+        }
+        for q in PERCENTILES:
+            out[f"p{q:g}"] = self.percentile(q) / NS_PER_S
+        return out
+
+    # -- serialisation (sparse, for shipping between processes) ----------
+
+    def to_dict(self):
+        return {
+            "highest_ns": self.highest_ns,
+            "buckets": {i: c for i, c in enumerate(self.counts) if c},
+            "total": self.total,
+            "sum_ns": self.sum_ns,
+            "min_ns": self.min_ns,
+            "max_ns": self.max_ns,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        hist = cls(data["highest_ns"])
+        for i, c in data["buckets"].items():
+            hist.counts[int(i)] = c
+        hist.total = data["total"]
+        hist.sum_ns = data["sum_ns"]
+        hist.min_ns = data["min_ns"]
+        hist.max_ns = data["max_ns"]
+        return hist
+
+
+SUMMARY_HEADER = "Metric,Min_s,Max_s,Avg_s,P50_s,P90_s,P99_s,P999_s,Count"
+
+
+def summary_row(metric, hist):
+    """One CSV row in SUMMARY_HEADER layout; empty cells when nothing was recorded."""
+    if not hist.total:
+        return f"{metric},,,,,,,,0"
+    s = hist.summary()
+    return (f"{metric},{s['min']:.6f},{s['max']:.6f},{s['avg']:.6f},"
+            f"{s['p50']:.6f},{s['p90']:.6f},{s['p99']:.6f},{s['p99.9']:.6f},{s['count']}")
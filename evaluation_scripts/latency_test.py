@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+End-to-end publish -> deliver latency per QoS level.
+
+A single publisher sends timestamped messages at a steady, unsaturating
+rate to a single subscriber, which records each delivery's latency (from
+the intended send time carried in the payload, see schedule.py) into a
+log-bucketed histogram.  The summary reports tail percentiles rather than
+averages, plus how far the publisher fell behind its timetable.
+"""
+import argparse
+import os
+from datetime import datetime
+
+import harness
+from histogram import SUMMARY_HEADER, summary_row
+from live import report
+from schedule import ARRIVALS, describe_lag, lag_row, lag_summary
+from throughput_test import BROKER, HEADER, measure_qos
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Measure end-to-end MQTT publish-to-deliver latency percentiles per QoS"
+    )
+    parser.add_argument("--name", required=True, help="Broker name (used for output file naming)")
+    parser.add_argument("--host", default=BROKER, help="Broker host name or address")
+    parser.add_argument("--port", type=int, default=1883, help="Broker port number")
+    parser.add_argument("--qos", default="0,1,2", help="Comma-separated QoS levels to run, one pass each")
+    parser.add_argument("--rate", type=float, default=100.0, help="Messages per second")
+    parser.add_argument("--arrival", choices=ARRIVALS, default="constant",
+                        help="Evenly spaced messages or Poisson arrivals")
+    parser.add_argument("--duration", type=float, default=10.0, help="Publishing time per QoS level (s)")
+    parser.add_argument("--payload_size", type=int, default=64, help="Payload size in bytes")
+    parser.add_argument("--output", default=None,
+                        help="Write the results CSV here instead of a timestamped file under results/")
+    args = parser.parse_args()
+
+    # measure_qos() reads the throughput-test options; pin them to one
+    # publisher and one subscriber so latency is measured unloaded.
+    args.publishers = 1
+    args.subscribers = 1
+    args.window = 1
+    args.drain = 3.0
+    args.workers = 1
+    args.payload_size = max(args.payload_size, HEADER.size)
+    return args
+
+
+def run_all(args, levels):
+    results = []
+    for qos in levels:
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] QoS {qos}: "
+              f"{args.rate:.0f} msg/s for {args.duration:.0f} s")
+        r = measure_qos(args, qos)
+        s = r["latency"].summary()
+        print(f"    {s['count']} delivered, lost {r['lost']} | p50 {s['p50'] * 1000:.3f} ms  "
+              f"p90 {s['p90'] * 1000:.3f} ms  p99 {s['p99'] * 1000:.3f} ms  "
+              f"p99.9 {s['p99.9'] * 1000:.3f} ms  max {s['max'] * 1000:.3f} ms")
+        print(f"    {describe_lag(r['lag'], r['late'])}")
+        harness.note(**{f"schedule_qos{qos}": lag_summary(r["lag"], r["late"])})
+        report(qos=qos, e2e_p50=round(s["p50"], 6), e2e_p99=round(s["p99"], 6))
+        results.append(r)
+    return results
+
+
+def main():
+    args = parse_args()
+    levels = [int(q) for q in args.qos.split(",") if q.strip()]
+    results = run_all(args, levels)
+
+    os.makedirs("results", exist_ok=True)
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    out = args.output or os.path.join("results", f"latency_results_{args.name}_{args.port}_{ts}.csv")
+    with open(out, "w") as f:
+        f.write(SUMMARY_HEADER + "\n")
+        for r in results:
+            f.write(summary_row(f"E2E_QoS{r['qos']}", r["latency"]) + "\n")
+        for r in results:
+            f.write(lag_row(r["lag"], f"ScheduleLag_QoS{r['qos']}") + "\n")
+    print(f"\nLatency stats saved to {out}")
+
+
+if __name__ == "__main__":
+    harness.run(main)
@@ -0,0 +1,26 @@
+"""
+Live metric lines for the web UI.
+
+report() prints one machine-readable line to stdout.  Run from a
+terminal, these are just extra log lines.  In one of app.py's step
+workers (step_worker.py) they go to a sink instead, which sends them to
+the app as "live" records for /stream/<job_id>.
+"""
+import json
+
+PREFIX = "@live "
+
+_sink = None
+
+
+def set_sink(sink):
+    """Pass every report() to sink(metrics) instead of printing it"""
+    global _sink
+    _sink = sink
+
+
+def report(**metrics):
+    if _sink is not None:
+        _sink(metrics)
+    else:
+        print(PREFIX + json.dumps(metrics, separators=(",", ":")), flush=True)
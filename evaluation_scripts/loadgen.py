@@ -0,0 +1,133 @@
+"""
+Process pool plumbing for the load-generating evaluation scripts.
+
+One Python process can multiplex a few thousand sockets on an asyncio loop
+before the interpreter itself becomes the bottleneck, after which the
+numbers describe the test host rather than the broker.  Two shapes of
+coordinator/worker split live here:
+
+* run_sharded() runs one function per shard of the client population and
+  message rate, each in its own process and event loop, streaming records
+  (progress counters, histogram snapshots) back over a queue while it runs
+  and returning each shard's final result for merging.  When the
+  coordinator runs under harness.run(), each shard is probed as well.
+* WorkerPool keeps long-lived workers that the coordinator drives in lock
+  step with (command, payload) tuples, for tests that hold state between
+  phases such as hold mode's plateaus.
+"""
+import multiprocessing
+import queue
+import time
+import traceback
+
+import harness
+
+
+def split_evenly(total, parts):
+    """Split an integer total into `parts` near-equal shares."""
+    base, extra = divmod(total, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
+
+
+def _shard_main(target, index, shard, records):
+    def emit(record):
+        records.put(("record", index, record))
+    try:
+        probe = harness.start_worker()
+        result = target(index, shard, emit)
+        if probe is not None:
+            records.put(("harness", index, harness.finish_worker(probe)))
+        records.put(("done", index, result))
+    except BaseException:
+        records.put(("error", index, traceback.format_exc()))
+
+
+def run_sharded(target, shards, on_record=None):
+    """
+    Run target(index, shard, emit) in one process per shard.
+
+    Anything a worker passes to emit() is delivered to on_record(index,
+    record) in the coordinator as it happens.  Returns the targets' return
+    values in shard order; a worker that raises or dies aborts the run.
+    """
+    records = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=_shard_main, args=(target, i, shard, records), daemon=True)
+        for i, shard in enumerate(shards)
+    ]
+    for proc in procs:
+        proc.start()
+
+    results = [None] * len(shards)
+    remaining = set(range(len(shards)))
+    try:
+        while remaining:
+            try:
+                kind, index, value = records.get(timeout=1.0)
+            except queue.Empty:
+                dead = [i for i in remaining if procs[i].exitcode is not None]
+                if dead:
+                    # give a just-exited worker's final message a moment to arrive
+                    time.sleep(0.5)
+                    if records.empty():
+                        raise RuntimeError(f"worker {dead[0]} exited with code {procs[dead[0]].exitcode}")
+                continue
+            if kind == "record":
+                if on_record is not None:
+                    on_record(index, value)
+            elif kind == "harness":
+                harness.merge_worker(value)
+            elif kind == "done":
+                results[index] = value
+                remaining.discard(index)
+            else:
+                raise RuntimeError(f"worker {index} failed:\n{value}")
+    finally:
+        for proc in procs:
+            if remaining:
+                proc.terminate()
+            proc.join()
+    return results
+
+
+class WorkerPool:
+    """
+    Start `size` processes running target(conn, index, *args).
+
+    The target is expected to loop on conn.recv() and answer every command
+    with exactly one conn.send(); request() fans a command out to every
+    worker and returns their replies in worker order.
+    """
+
+    def __init__(self, size, target, args=()):
+        self.size = size
+        self._conns = []
+        self._procs = []
+        for index in range(size):
+            parent, child = multiprocessing.Pipe()
+            proc = multiprocessing.Process(target=target, args=(child, index, *args), daemon=True)
+            proc.start()
+            child.close()
+            self._conns.append(parent)
+            self._procs.append(proc)
+
+    def request(self, command, payloads):
+        """Send (command, payloads[i]) to worker i and collect the replies."""
+        for conn, payload in zip(self._conns, payloads):
+            conn.send((command, payload))
+        return [conn.recv() for conn in self._conns]
+
+    def close(self, timeout=30):
+        """Send "stop" to every worker and return the replies of those that answered."""
+        replies = []
+        for conn in self._conns:
+            try:
+                conn.send(("stop", None))
+                replies.append(conn.recv())
+            except (EOFError, OSError):
+                pass
+        for proc in self._procs:
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.terminate()
+        return replies
@@ -1,100 +1,605 @@
 #!/usr/bin/env python3
 import paho.mqtt.client as mqtt
+import asyncio
 import time
 import argparse
+import resource
 from datetime import datetime
 import os
+import sys
 
-# Setup command-line arguments
-parser = argparse.ArgumentParser(
-    description="MQTT Broker Maximum Client Connection and Payload Size Evaluation"
-)
-parser.add_argument("--name", required=True, help="Broker name (used for output file naming)")
-parser.add_argument("--port", required=True, type=int, help="Broker port number")
-parser.add_argument("--clients", required=True, type=int, help="Maximum number of clients to attempt to connect")
-parser.add_argument("--payload_size", required=True, type=int, help="Size of the payload to publish (in bytes)")
-args = parser.parse_args()
-
-broker_name = args.name
-PORT = args.port
-MAX_CLIENTS = args.clients
-PAYLOAD_SIZE = args.payload_size
-
-# For simplicity, we assume the broker is running on localhost.
+import harness
+from mqtt_async import MQTTClient
+from histogram import LatencyHistogram
+from live import report
+from loadgen import WorkerPool, run_sharded, split_evenly
+from schedule import ARRIVALS, Schedule, describe_lag, lag_state, lag_summary, merge_lag
+from throughput_test import HEADER, measure_qos
+
+# series_store.py is shared with the Flask app one directory up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from series_store import CLIENT_FIELDS, SeriesWriter, series_path
+
+# Default broker host; --host points the test elsewhere
 BROKER = "localhost"
 TOPIC = "test"
 
-# Generate a dummy payload of the given size (the actual content does not matter)
-PAYLOAD = "X" * PAYLOAD_SIZE
-
-# Compute the payload size in bytes (should match the provided payload_size when using UTF-8 encoding)
-computed_payload_size = len(PAYLOAD.encode("utf-8"))
-print(f"Using payload of size: {computed_payload_size} bytes")
-
-# Prepare output file logging
-os.makedirs("results", exist_ok=True)
-PAYLOAD_SIZE = args.payload_size
-log_file = f"results/max_clients_results_{broker_name}_{MAX_CLIENTS}_P_{PAYLOAD_SIZE}.csv"
-
-connection_times = []
-successful_clients = 0
-
-print("Starting maximum clients evaluation...")
-
-for i in range(1, MAX_CLIENTS + 1):
-    client_id = f"client{i}"
-    # Instantiate the client with all parameters passed explicitly as keywords.
-    client = mqtt.Client(
-        client_id=client_id,
-        clean_session=True,
-        userdata=None,
-        protocol=mqtt.MQTTv311,
-        transport="tcp",
-        callback_api_version=1  # Force legacy callback API.
+DEFAULT_PLATEAUS = "1000,5000,10000,50000"
+
+# Fixed header, topic and packet id of a sweep PUBLISH, on top of the payload
+SWEEP_OVERHEAD = 64
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="MQTT Broker Maximum Client Connection and Payload Size Evaluation"
     )
-    start_time = time.time()
+    parser.add_argument("--name", required=True, help="Broker name (used for output file naming)")
+    parser.add_argument("--host", default=BROKER, help="Broker host name or address")
+    parser.add_argument("--port", required=True, type=int, help="Broker port number")
+    parser.add_argument("--clients", required=True, type=int, help="Maximum number of clients to attempt to connect")
+    parser.add_argument("--payload_size", required=True, type=int, help="Size of the payload to publish (in bytes)")
+    parser.add_argument("--mode", choices=["sequential", "storm", "hold", "sweep"], default="sequential",
+                        help="sequential: one blocking client at a time; "
+                             "storm: open all clients concurrently on one asyncio loop; "
+                             "hold: keep sessions open and step the live count up in plateaus; "
+                             "sweep: measure publish throughput over a logarithmic range of payload sizes")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="Storm/hold mode: connection attempts started per second (0 = as fast as possible)")
+    parser.add_argument("--arrival", choices=ARRIVALS, default="constant",
+                        help="Storm/hold mode with --rate: evenly spaced attempts or Poisson arrivals")
+    parser.add_argument("--max_inflight", type=int, default=1000,
+                        help="Storm mode: cap on simultaneous in-progress handshakes (0 = no cap)")
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help="Storm/hold mode: seconds to wait for a CONNACK before counting a failure")
+    parser.add_argument("--plateaus", default=DEFAULT_PLATEAUS,
+                        help="Hold mode: comma-separated live-session targets, capped at --clients")
+    parser.add_argument("--hold", type=float, default=30.0,
+                        help="Hold mode: seconds to hold each plateau before checking for dropped sessions")
+    parser.add_argument("--keepalive", type=int, default=30,
+                        help="Hold mode: MQTT keepalive (s); PINGREQs keep idle sessions alive")
+    parser.add_argument("--latency_threshold", type=float, default=1.0,
+                        help="Hold mode: stop once a plateau's p99 CONNACK latency exceeds this (s)")
+    parser.add_argument("--failure_threshold", type=float, default=0.01,
+                        help="Hold mode: stop once this fraction of a plateau's connects fail or drop")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Storm/hold mode: worker processes to spread the clients and rate across")
+    parser.add_argument("--max_packet", type=int, default=1048576,
+                        help="Sweep mode: the broker's maximum packet size in bytes; payloads grow from "
+                             "--payload_size up to just below it (MQTT allows up to 268435455)")
+    parser.add_argument("--sweep_factor", type=float, default=4.0,
+                        help="Sweep mode: ratio between consecutive payload sizes")
+    parser.add_argument("--sweep_qos", type=int, choices=[0, 1, 2], default=0,
+                        help="Sweep mode: QoS level to publish at")
+    parser.add_argument("--sweep_duration", type=float, default=5.0,
+                        help="Sweep mode: publishing time per payload size (s)")
+    parser.add_argument("--collapse", type=float, default=0.5,
+                        help="Sweep mode: a size has collapsed once its delivered bytes/s falls "
+                             "below this fraction of the best smaller size")
+    parser.add_argument("--output", default=None,
+                        help="Write the results here instead of the default path under results/ "
+                             "(per-client series as .parquet or .csv; hold mode always writes CSV)")
+    args = parser.parse_args()
+    if args.mode == "sweep" and args.max_packet - SWEEP_OVERHEAD < max(args.payload_size, HEADER.size):
+        parser.error(f"--max_packet must be at least {max(args.payload_size, HEADER.size) + SWEEP_OVERHEAD} "
+                     f"to fit a --payload_size {args.payload_size} sweep PUBLISH")
+    return args
+
+
+def raise_fd_limit():
+    """Lift the soft open-file limit to the hard limit so we can hold many sockets."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def run_sequential(args, payload):
+    """Connect, publish and disconnect one client at a time (original behaviour)."""
+    connection_times = []
+    for i in range(1, args.clients + 1):
+        client_id = f"client{i}"
+        # Instantiate the client with all parameters passed explicitly as keywords.
+        client = mqtt.Client(
+            client_id=client_id,
+            clean_session=True,
+            userdata=None,
+            protocol=mqtt.MQTTv311,
+            transport="tcp",
+            callback_api_version=1  # Force legacy callback API.
+        )
+        start_time = time.time()
+        try:
+            client.connect(args.host, args.port, keepalive=5)
+            # Publish the dummy payload to the test topic.
+            client.publish(TOPIC, payload)
+            client.disconnect()
+            connection_time = time.time() - start_time
+            connection_times.append(connection_time)
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Client {i} connected, connection time: {connection_time:.4f} s")
+            report(connected=i, connect_time=round(connection_time, 4))
+        except Exception as e:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Client {i} failed to connect. Error: {e}")
+            report(failed=1)
+            # Stop testing further clients if a connection failure occurs.
+            break
+    return connection_times
+
+
+async def storm_attempt(i, args, payload, results, t0, intended_ns):
+    """
+    One storm client: CONNECT, wait for CONNACK, publish once, DISCONNECT.
+    Latency runs from the attempt's intended start, so time spent waiting
+    for an in-flight slot counts.
+    """
+    client = MQTTClient(f"client{i}", keepalive=5)
+    started = intended_ns / 1e9 - t0
     try:
-        client.connect(BROKER, PORT, keepalive=5)
-        # Publish the dummy payload to the test topic.
-        client.publish(TOPIC, PAYLOAD)
-        client.disconnect()
-        connection_time = time.time() - start_time
-        connection_times.append(connection_time)
-        successful_clients += 1
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Client {i} connected, connection time: {connection_time:.4f} s")
+        await client.connect(args.host, args.port, timeout=args.timeout)
+        latency = (time.monotonic_ns() - intended_ns) / 1e9
+        await client.publish(TOPIC, payload)
+        await client.disconnect()
+        results.append((i, started, latency, "ok"))
     except Exception as e:
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Client {i} failed to connect. Error: {e}")
-        # Stop testing further clients if a connection failure occurs.
-        break
-
-if connection_times:
-    total_clients = len(connection_times)
-    avg_time = sum(connection_times) / total_clients
-    max_time = max(connection_times)
-    min_time = min(connection_times)
-    # Compute average jitter as the average absolute difference between consecutive connection times.
-    jitters = [abs(connection_times[i] - connection_times[i - 1]) for i in range(1, total_clients)]
-    avg_jitter = sum(jitters) / len(jitters) if jitters else 0
-
-    print("\n--- Maximum Clients Evaluation Results ---")
-    print(f"Total Clients Connected: {total_clients}")
-    print(f"Average Connection Time: {avg_time:.4f} s")
-    print(f"Maximum Connection Time: {max_time:.4f} s")
-    print(f"Minimum Connection Time: {min_time:.4f} s")
-    print(f"Average Jitter: {avg_jitter:.4f} s")
-else:
-    print("No clients were able to connect.")
-
-# Write detailed results, including the payload size, to a CSV file.
-with open(log_file, "w") as f:
-    f.write("Client,Connection_Time(s)\n")
-    for idx, ct in enumerate(connection_times, start=1):
-        f.write(f"{idx},{ct:.4f}\n")
-    f.write("\n")
-    f.write("Metric,Value\n")
-    f.write(f"Total_Clients,{len(connection_times)}\n")
-    f.write(f"Average_Connection_Time,{avg_time:.4f}\n")
-    f.write(f"Maximum_Connection_Time,{max_time:.4f}\n")
-    f.write(f"Minimum_Connection_Time,{min_time:.4f}\n")
-    f.write(f"Average_Jitter,{avg_jitter:.4f}\n")
-    f.write(f"Payload_Size_Bytes,{computed_payload_size}\n")
+        results.append((i, started, None, type(e).__name__))
+
+
+async def run_storm(args, payload, first=1, t0=None, emit=None):
+    """
+    Open clients first .. first+args.clients-1 concurrently.  Attempts are
+    released on an open-loop timetable of args.rate per second starting at
+    monotonic time t0 (so a slow broker does not slow the ramp down, and
+    sharded workers share one time axis) and at most args.max_inflight
+    handshakes are outstanding at once.  emit, if given, receives a
+    progress record about once a second.  Returns (results, schedule lag
+    state or None).
+    """
+    harness.watch_loop()
+    results = []
+    inflight = asyncio.Semaphore(args.max_inflight) if args.max_inflight > 0 else None
+    tasks = []
+
+    async def attempt(i, intended_ns):
+        try:
+            await storm_attempt(i, args, payload, results, t0, intended_ns)
+        finally:
+            if inflight is not None:
+                inflight.release()
+
+    async def progress():
+        while True:
+            await asyncio.sleep(1.0)
+            ok = sum(1 for r in results if r[3] == "ok")
+            emit({"ok": ok, "failed": len(results) - ok})
+
+    if t0 is None:
+        t0 = time.monotonic()
+    if t0 > time.monotonic():
+        await asyncio.sleep(t0 - time.monotonic())
+    reporter = asyncio.ensure_future(progress()) if emit is not None else None
+
+    schedule = Schedule(args.rate, args.arrival, int(t0 * 1e9), seed=first) if args.rate > 0 else None
+    for i in range(first, first + args.clients):
+        # Without a rate every attempt is due now, so it is stamped before
+        # waiting for an in-flight slot
+        intended_ns = await schedule.wait() if schedule is not None else time.monotonic_ns()
+        if inflight is not None:
+            await inflight.acquire()
+        tasks.append(asyncio.ensure_future(attempt(i, intended_ns)))
+    await asyncio.gather(*tasks)
+    if reporter is not None:
+        reporter.cancel()
+    return results, lag_state(schedule) if schedule is not None else None
+
+
+def storm_worker(index, shard, emit):
+    """run_sharded() target: one shard of the storm population."""
+    raise_fd_limit()
+    return asyncio.run(run_storm(shard["args"], shard["payload"], shard["first"], shard["t0"], emit))
+
+
+def run_storm_sharded(args, payload):
+    """
+    Split the storm's clients, ramp rate and in-flight budget across
+    args.workers processes, all starting on one shared timetable, and merge
+    their per-connection results.  Returns (results, elapsed, sustained,
+    merged schedule lag as (histogram, late, skipped)).
+    """
+    counts = split_evenly(args.clients, args.workers)
+    t0 = time.monotonic() + 1.0  # let every worker get its loop running first
+    shards, first = [], 1
+    for count in counts:
+        shard_args = argparse.Namespace(**vars(args))
+        shard_args.clients = count
+        shard_args.rate = args.rate * count / args.clients if args.rate > 0 else 0
+        shard_args.max_inflight = max(args.max_inflight * count // args.clients, 1) if args.max_inflight > 0 else 0
+        shards.append({"args": shard_args, "payload": payload, "first": first, "t0": t0})
+        first += count
+
+    progress = [{"ok": 0, "failed": 0} for _ in counts]
+    last = [time.monotonic(), 0]
+
+    def on_record(index, record):
+        progress[index] = record
+        ok = sum(p["ok"] for p in progress)
+        failed = sum(p["failed"] for p in progress)
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] progress: {ok} connected, {failed} failed")
+        now = time.monotonic()
+        rate = (ok - last[1]) / (now - last[0]) if now > last[0] else 0
+        last[:] = [now, ok]
+        report(connected=ok, failed=failed, connect_rate=round(rate, 1))
+
+    if args.workers > 1:
+        shard_results = run_sharded(storm_worker, shards, on_record)
+    else:
+        shard_results = [asyncio.run(run_storm(args, payload, 1, t0,
+                                               lambda record: on_record(0, record)))]
+    elapsed = time.monotonic() - t0
+    results = sorted(r for part, _ in shard_results for r in part)
+    lag = merge_lag(state for _, state in shard_results if state is not None)
+
+    # Sustained rate: successful handshakes over the span from the first
+    # attempt to the last CONNACK.
+    ok = [r for r in results if r[3] == "ok"]
+    if ok:
+        span = max(started + latency for _, started, latency, _ in ok)
+        sustained = len(ok) / span if span > 0 else 0
+    else:
+        sustained = 0
+    return results, elapsed, sustained, lag
+
+
+def plateau_targets(args):
+    """Plateau session counts from --plateaus, capped at (and always ending on) --clients."""
+    targets = sorted({int(p) for p in args.plateaus.split(",") if p.strip() and int(p) < args.clients})
+    return targets + [args.clients]
+
+
+def hold_worker(conn, index, args):
+    """Worker process entry point for hold mode."""
+    raise_fd_limit()
+    asyncio.run(hold_worker_loop(conn, index, args))
+
+
+async def hold_worker_loop(conn, index, args):
+    """
+    Serve coordinator commands: ("grow", n) opens sessions until this worker
+    holds n live ones, ("status", _) reports live/dropped counts, ("stop", _) closes
+    everything.  Sessions stay open between commands, kept alive by
+    PINGREQs from MQTTClient's keepalive loop.
+    """
+    loop = asyncio.get_running_loop()
+    probe = harness.start_worker()
+    harness.watch_loop()
+    sessions = []
+    dropped = [0]
+    # Client ids are never reused: a second session with a live one's id
+    # would take it over, and the broker's kick would count as a drop
+    next_id = 0
+    # Each worker ramps its share of the global rate / in-flight budget.
+    rate = args.rate / args.workers if args.rate > 0 else 0
+    inflight = asyncio.Semaphore(max(args.max_inflight // args.workers, 1)) if args.max_inflight > 0 else None
+
+    def on_drop(_error):
+        dropped[0] += 1
+
+    async def open_session(n, latency, failures, intended_ns):
+        client = MQTTClient(f"hold{index}-{n}", keepalive=args.keepalive, auto_keepalive=True)
+        client.on_disconnect = on_drop
+        try:
+            await client.connect(args.host, args.port, timeout=args.timeout)
+            # From the intended start, as in storm mode
+            latency.record(time.monotonic_ns() - intended_ns)
+            sessions.append(client)
+        except Exception:
+            failures.append(n)
+        finally:
+            if inflight is not None:
+                inflight.release()
+
+    def live():
+        return sum(1 for c in sessions if c.connected)
+
+    while True:
+        command, value = await loop.run_in_executor(None, conn.recv)
+        if command == "grow":
+            latency, failures, tasks = LatencyHistogram(), [], []
+            first = next_id
+            next_id += max(value - live(), 0)
+            schedule = Schedule(rate, args.arrival, seed=index) if rate else None
+            for n in range(first, next_id):
+                intended_ns = await schedule.wait() if schedule is not None else time.monotonic_ns()
+                if inflight is not None:
+                    await inflight.acquire()
+                tasks.append(asyncio.ensure_future(open_session(n, latency, failures, intended_ns)))
+            await asyncio.gather(*tasks)
+            conn.send({"latency": latency.to_dict(), "failed": len(failures),
+                       "live": live(), "dropped": dropped[0],
+                       "schedule": lag_state(schedule) if schedule is not None else None})
+        elif command == "status":
+            conn.send({"live": live(), "dropped": dropped[0]})
+        elif command == "stop":
+            await asyncio.gather(*(c.disconnect() for c in sessions), return_exceptions=True)
+            conn.send({"live": 0, "dropped": dropped[0],
+                       "harness": harness.finish_worker(probe) if probe is not None else None})
+            return
+
+
+def run_hold(args):
+    """
+    Step the live session count through the plateaus, holding each one for
+    args.hold seconds.  Stops at the first plateau where CONNACKs fail,
+    sessions drop, or p99 CONNACK latency passes the threshold; the last
+    plateau that held is the concurrent-session ceiling.  Also returns the
+    ramp's schedule lag as (histogram, late, skipped).
+    """
+    pool = WorkerPool(args.workers, hold_worker, (args,))
+    rows, schedules = [], []
+    ceiling, reason = 0, "all plateaus held"
+    try:
+        dropped_before = 0
+        for plateau, target in enumerate(plateau_targets(args), start=1):
+            start = time.time()
+            replies = pool.request("grow", split_evenly(target, args.workers))
+            latency = LatencyHistogram()
+            for r in replies:
+                latency.merge(LatencyHistogram.from_dict(r["latency"]))
+            failed = sum(r["failed"] for r in replies)
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Plateau {plateau}: "
+                  f"{latency.total} new sessions, {failed} failed; holding {args.hold:.0f} s")
+            plateau_schedules = [r["schedule"] for r in replies if r["schedule"] is not None]
+            if plateau_schedules:
+                print(f"    {describe_lag(*merge_lag(plateau_schedules))}")
+                schedules += plateau_schedules
+            time.sleep(args.hold)
+            status = pool.request("status", [None] * args.workers)
+            end = time.time()
+            live = sum(s["live"] for s in status)
+            dropped = sum(s["dropped"] for s in status) - dropped_before
+            dropped_before += dropped
+
+            attempted = latency.total + failed
+            stats = latency.summary()
+            p50, p99, mx = stats["p50"], stats["p99"], stats["max"]
+            verdict = "ok"
+            if attempted and (failed + dropped) / attempted > args.failure_threshold:
+                verdict = "connect_failures"
+            elif live < target * (1 - args.failure_threshold):
+                verdict = "sessions_dropped"
+            elif p99 > args.latency_threshold:
+                verdict = "latency_degraded"
+
+            rows.append((plateau, target, live, latency.total, failed, dropped,
+                         p50, p99, mx, start, end, verdict))
+            report(plateau=plateau, live_sessions=live, dropped=dropped,
+                   connack_p99=round(p99, 4), verdict=verdict)
+            print(f"    target {target}, live {live}, dropped {dropped}, "
+                  f"CONNACK p50 {p50:.4f} s p99 {p99:.4f} s max {mx:.4f} s -> {verdict}")
+            if verdict != "ok":
+                reason = verdict
+                break
+            ceiling = live
+    finally:
+        for reply in pool.close():
+            if reply.get("harness") is not None:
+                harness.merge_worker(reply["harness"])
+    return rows, ceiling, reason, merge_lag(schedules)
+
+
+def sweep_sizes(args):
+    """Payload sizes from --payload_size growing by --sweep_factor, ending just below --max_packet."""
+    largest = args.max_packet - SWEEP_OVERHEAD
+    size = max(args.payload_size, HEADER.size)
+    sizes = []
+    while size < largest:
+        sizes.append(size)
+        size = max(int(size * args.sweep_factor), size + 1)
+    return sizes + [largest]
+
+
+def run_sweep(args):
+    """
+    One throughput pass per payload size (one publisher, one subscriber, as
+    fast as the broker takes it).  Each publisher sends a small packed
+    header ahead of one preallocated body per size, so large payloads are
+    not built or copied per publish.  A size whose delivered bytes/s falls below args.collapse of
+    the best smaller size is marked collapsed; a size the broker refuses
+    (connection dropped, nothing delivered) ends the sweep.
+    """
+    pass_args = argparse.Namespace(
+        host=args.host, port=args.port, publishers=1, subscribers=1, rate=0, duration=args.sweep_duration,
+        window=32, drain=3.0, workers=1,
+    )
+    rows = []
+    peak_bytes, peak_size, collapse_size = 0.0, None, None
+    for size in sweep_sizes(args):
+        pass_args.payload_size = size
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Payload {size} B at QoS {args.sweep_qos} "
+              f"for {args.sweep_duration:g} s")
+        try:
+            r = measure_qos(pass_args, args.sweep_qos)
+        except Exception as e:
+            print(f"    failed: {type(e).__name__}: {e}")
+            rows.append((size, args.sweep_qos, 0, 0, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, "failed"))
+            collapse_size = collapse_size or size
+            break
+        delivered_bytes = r["delivered_rate"] * size
+        lat = r["latency"].summary()
+        if not r["delivered"]:
+            verdict = "failed"
+        elif delivered_bytes < args.collapse * peak_bytes:
+            verdict = "collapsed"
+        else:
+            verdict = "ok"
+        if verdict != "ok":
+            collapse_size = collapse_size or size
+        if delivered_bytes > peak_bytes:
+            peak_bytes, peak_size = delivered_bytes, size
+        rows.append((size, args.sweep_qos, r["sent"], r["delivered"], r["lost"],
+                     r["publish_rate"], r["publish_rate"] * size, r["delivered_rate"], delivered_bytes,
+                     lat["p50"], lat["p99"], verdict))
+        report(payload_size=size, msgs_per_s=round(r["delivered_rate"], 1),
+               bytes_per_s=round(delivered_bytes), verdict=verdict)
+        print(f"    {r['delivered_rate']:.1f} msg/s, {delivered_bytes / 1e6:.3f} MB/s delivered, "
+              f"lost {r['lost']} -> {verdict}")
+        if verdict == "failed":
+            break
+    return rows, peak_size, peak_bytes, collapse_size
+
+
+def write_sweep(path, args, rows, peak_size, peak_bytes, collapse_size):
+    with open(path, "w") as f:
+        f.write("Payload_Bytes,QoS,Sent,Delivered,Lost,Publish_Msgs_Per_s,Publish_Bytes_Per_s,"
+                "Delivered_Msgs_Per_s,Delivered_Bytes_Per_s,Latency_P50_s,Latency_P99_s,Verdict\n")
+        for (size, qos, sent, delivered, lost, pub_rate, pub_bytes, del_rate, del_bytes,
+             p50, p99, verdict) in rows:
+            f.write(f"{size},{qos},{sent},{delivered},{lost},{pub_rate:.2f},{pub_bytes:.0f},"
+                    f"{del_rate:.2f},{del_bytes:.0f},{p50:.6f},{p99:.6f},{verdict}\n")
+        f.write("\n")
+        f.write("Metric,Value\n")
+        f.write(f"Peak_Payload_Bytes,{peak_size or ''}\n")
+        f.write(f"Peak_Bytes_Per_s,{peak_bytes:.0f}\n")
+        f.write(f"Collapse_Payload_Bytes,{collapse_size or ''}\n")
+        f.write(f"Max_Packet,{args.max_packet}\n")
+        f.write(f"QoS,{args.sweep_qos}\n")
+
+
+def main():
+    args = parse_args()
+
+    if args.mode == "sweep":
+        rows, peak_size, peak_bytes, collapse_size = run_sweep(args)
+        os.makedirs("results", exist_ok=True)
+        sweep_file = args.output or f"results/payload_sweep_{args.name}_{args.port}_Q{args.sweep_qos}.csv"
+        write_sweep(sweep_file, args, rows, peak_size, peak_bytes, collapse_size)
+        print(f"\nPeak {peak_bytes / 1e6:.3f} MB/s at {peak_size} B; "
+              f"throughput collapses at {collapse_size or 'no tested size'}")
+        return
+
+    # Generate a dummy payload of the given size (the actual content does not matter);
+    # bytes, so clients send it as is instead of encoding it on every publish
+    payload = b"X" * args.payload_size
+    computed_payload_size = len(payload)
+    print(f"Using payload of size: {computed_payload_size} bytes")
+
+    # Prepare output file logging
+    os.makedirs("results", exist_ok=True)
+    log_file = args.output or series_path(f"results/max_clients_results_{args.name}_{args.clients}_P_{args.payload_size}")
+
+    print(f"Starting maximum clients evaluation ({args.mode} mode)...")
+
+    if args.mode == "hold":
+        raise_fd_limit()
+        rows, ceiling, reason, (lag, late, _) = run_hold(args)
+        hold_file = args.output or f"results/max_clients_hold_{args.name}_{args.clients}_P_{args.payload_size}.csv"
+        with open(hold_file, "w") as f:
+            f.write("Plateau,Target_Sessions,Live_Sessions,Connected,Failed,Dropped,"
+                    "P50_Connack_s,P99_Connack_s,Max_Connack_s,Start_Epoch,End_Epoch,Verdict\n")
+            for (plateau, target, live, connected, failed, dropped,
+                 p50, p99, mx, start, end, verdict) in rows:
+                f.write(f"{plateau},{target},{live},{connected},{failed},{dropped},"
+                        f"{p50:.4f},{p99:.4f},{mx:.4f},{start:.3f},{end:.3f},{verdict}\n")
+            f.write("\n")
+            f.write("Metric,Value\n")
+            f.write(f"Session_Ceiling,{ceiling}\n")
+            f.write(f"Stop_Reason,{reason}\n")
+            f.write(f"Workers,{args.workers}\n")
+            f.write(f"Keepalive_s,{args.keepalive}\n")
+            if lag.total:
+                sched = lag_summary(lag, late)
+                harness.note(schedule=sched)
+                f.write(f"Schedule_Lag_P99_s,{sched['lag_p99']:.6f}\n")
+                f.write(f"Schedule_Lag_Max_s,{sched['lag_max']:.6f}\n")
+                f.write(f"Late_Attempts,{late}\n")
+        print(f"\nConcurrent session ceiling: {ceiling} ({reason})")
+        return
+
+    extra_metrics = []
+    if args.mode == "storm":
+        fd_limit = raise_fd_limit()
+        if args.max_inflight <= 0 or args.max_inflight > fd_limit:
+            print(f"Warning: open-file limit is {fd_limit}; in-flight handshakes beyond that will fail")
+        results, elapsed, sustained, (lag, late, _) = run_storm_sharded(args, payload)
+        for i, started, latency, status in results:
+            if status == "ok":
+                print(f"Client {i} CONNACK after {latency:.4f} s (started at +{started:.4f} s)")
+            else:
+                print(f"Client {i} failed to connect. Error: {status}")
+        rows = [(i, latency, started, status) for i, started, latency, status in results]
+        connection_times = [r[1] for r in rows if r[3] == "ok"]
+        failed = len(rows) - len(connection_times)
+        connack = LatencyHistogram()
+        for ct in connection_times:
+            connack.record_seconds(ct)
+        stats = connack.summary()
+        extra_metrics = [
+            ("Mode", "storm"),
+            ("Failed_Clients", failed),
+            ("Target_Connect_Rate", f"{args.rate:.2f}"),
+            ("Sustained_Connect_Rate", f"{sustained:.2f}"),
+            ("Max_Inflight", args.max_inflight),
+            ("Workers", args.workers),
+            ("Elapsed_s", f"{elapsed:.4f}"),
+            ("P50_Connack_s", f"{stats['p50']:.4f}"),
+            ("P99_Connack_s", f"{stats['p99']:.4f}"),
+            ("P999_Connack_s", f"{stats['p99.9']:.4f}"),
+        ]
+        if lag.total:
+            sched = lag_summary(lag, late)
+            harness.note(schedule=sched)
+            extra_metrics += [
+                ("Arrival", args.arrival),
+                ("Schedule_Lag_P99_s", f"{sched['lag_p99']:.6f}"),
+                ("Schedule_Lag_Max_s", f"{sched['lag_max']:.6f}"),
+                ("Late_Attempts", late),
+            ]
+        print(f"\nSustained connect rate: {sustained:.2f} conn/s "
+              f"({len(connection_times)} ok, {failed} failed in {elapsed:.2f} s)")
+        if lag.total:
+            print(describe_lag(lag, late))
+    else:
+        connection_times = run_sequential(args, payload)
+        rows = [(i, ct, None, "ok") for i, ct in enumerate(connection_times, start=1)]
+
+    avg_time = max_time = min_time = avg_jitter = 0
+    if connection_times:
+        total_clients = len(connection_times)
+        avg_time = sum(connection_times) / total_clients
+        max_time = max(connection_times)
+        min_time = min(connection_times)
+        # Compute average jitter as the average absolute difference between consecutive connection times.
+        jitters = [abs(connection_times[i] - connection_times[i - 1]) for i in range(1, total_clients)]
+        avg_jitter = sum(jitters) / len(jitters) if jitters else 0
+
+        print("\n--- Maximum Clients Evaluation Results ---")
+        print(f"Total Clients Connected: {total_clients}")
+        print(f"Average Connection Time: {avg_time:.4f} s")
+        print(f"Maximum Connection Time: {max_time:.4f} s")
+        print(f"Minimum Connection Time: {min_time:.4f} s")
+        print(f"Average Jitter: {avg_jitter:.4f} s")
+    else:
+        print("No clients were able to connect.")
+
+    # Write the per-client series, with the payload size and summary as its metrics
+    if args.mode == "storm":
+        fields, header = CLIENT_FIELDS, "Client,Connection_Time(s),Start_Offset(s),Status"
+    else:
+        fields, header = CLIENT_FIELDS[:2], "Client,Connection_Time(s)"
+    metrics = [
+        ("Total_Clients", len(connection_times)),
+        ("Average_Connection_Time", f"{avg_time:.4f}"),
+        ("Maximum_Connection_Time", f"{max_time:.4f}"),
+        ("Minimum_Connection_Time", f"{min_time:.4f}"),
+        ("Average_Jitter", f"{avg_jitter:.4f}"),
+        ("Payload_Size_Bytes", computed_payload_size),
+        *extra_metrics,
+    ]
+    writer = SeriesWriter(log_file, fields, broker=args.name, csv_header=header, flush_every=65536)
+    try:
+        writer.extend(row[:len(fields)] for row in rows)
+    finally:
+        writer.close(metrics=metrics)
+
+
+if __name__ == "__main__":
+    harness.run(main)
@@ -0,0 +1,374 @@
+"""
+Minimal asyncio MQTT 3.1.1 client used by the load-generating evaluation
+scripts.
+
+paho spins up a network thread per client and blocks in connect(), which
+is fine for a handful of sessions but caps concurrent load at whatever the
+test host can schedule.  This module speaks the wire protocol directly over
+asyncio streams so thousands of sessions can share one event loop.
+"""
+import asyncio
+import collections
+import struct
+import time
+
+# Control packet types (MQTT 3.1.1, section 2.2.1)
+CONNECT     = 1
+CONNACK     = 2
+PUBLISH     = 3
+PUBACK      = 4
+PUBREC      = 5
+PUBREL      = 6
+PUBCOMP     = 7
+SUBSCRIBE   = 8
+SUBACK      = 9
+UNSUBSCRIBE = 10
+UNSUBACK    = 11
+PINGREQ     = 12
+PINGRESP    = 13
+DISCONNECT  = 14
+
+PINGREQ_PACKET    = b"\xc0\x00"
+PINGRESP_PACKET   = b"\xd0\x00"
+DISCONNECT_PACKET = b"\xe0\x00"
+
+CONNACK_CODES = {
+    0: "accepted",
+    1: "unacceptable protocol version",
+    2: "identifier rejected",
+    3: "server unavailable",
+    4: "bad username or password",
+    5: "not authorized",
+}
+
+
+class MQTTError(Exception):
+    """Raised when the broker refuses or breaks the protocol exchange."""
+
+
+def encode_remaining_length(n):
+    out = bytearray()
+    while True:
+        byte = n % 128
+        n //= 128
+        if n:
+            byte |= 0x80
+        out.append(byte)
+        if not n:
+            return bytes(out)
+
+
+def encode_string(s):
+    if isinstance(s, str):
+        s = s.encode("utf-8")
+    return struct.pack("!H", len(s)) + s
+
+
+def fixed_header(ptype, flags, length):
+    return bytes([(ptype << 4) | flags]) + encode_remaining_length(length)
+
+
+def connect_packet(client_id, keepalive=60, clean_session=True,
+                   username=None, password=None):
+    flags = 0x02 if clean_session else 0
+    payload = encode_string(client_id)
+    if username is not None:
+        flags |= 0x80
+        payload += encode_string(username)
+    if password is not None:
+        flags |= 0x40
+        payload += encode_string(password)
+    variable = encode_string("MQTT") + bytes([4, flags]) + struct.pack("!H", keepalive)
+    body = variable + payload
+    return fixed_header(CONNECT, 0, len(body)) + body
+
+
+def publish_header(topic, payload_len, qos=0, packet_id=None, retain=False, dup=False):
+    """
+    Everything in a PUBLISH packet except the application payload, so
+    callers holding a preallocated bytes payload can write the two parts
+    back to back without concatenating them.
+    """
+    flags = (qos << 1) | (0x01 if retain else 0) | (0x08 if dup else 0)
+    variable = encode_string(topic)
+    if qos:
+        variable += struct.pack("!H", packet_id)
+    return fixed_header(PUBLISH, flags, len(variable) + payload_len) + variable
+
+
+def publish_packet(topic, payload, qos=0, packet_id=None, retain=False, dup=False):
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return publish_header(topic, len(payload), qos, packet_id, retain, dup) + bytes(payload)
+
+
+def subscribe_packet(packet_id, topics):
+    """topics: iterable of (topic_filter, qos)."""
+    body = struct.pack("!H", packet_id)
+    for topic, qos in topics:
+        body += encode_string(topic) + bytes([qos])
+    return fixed_header(SUBSCRIBE, 0x02, len(body)) + body
+
+
+def ack_packet(ptype, packet_id):
+    """Two-byte packet-id acknowledgements: PUBACK, PUBREC, PUBREL, PUBCOMP."""
+    flags = 0x02 if ptype == PUBREL else 0
+    return fixed_header(ptype, flags, 2) + struct.pack("!H", packet_id)
+
+
+async def read_packet(reader, max_length=None):
+    """
+    Read one control packet, returning (type, flags, body).  A packet whose
+    remaining length exceeds max_length raises MQTTError before its body
+    is read.
+    """
+    first = await reader.readexactly(1)
+    length, multiplier = 0, 1
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            break
+        multiplier *= 128
+        if multiplier > 128 ** 3:
+            raise MQTTError("malformed remaining length")
+    if max_length is not None and length > max_length:
+        raise MQTTError(f"packet of {length} bytes exceeds the {max_length} byte limit")
+    body = await reader.readexactly(length) if length else b""
+    return first[0] >> 4, first[0] & 0x0F, body
+
+
+def parse_publish(flags, body):
+    """Split a PUBLISH body into (topic, qos, packet_id, payload)."""
+    qos = (flags >> 1) & 0x03
+    (tlen,) = struct.unpack_from("!H", body, 0)
+    topic = body[2:2 + tlen].decode("utf-8")
+    pos = 2 + tlen
+    packet_id = None
+    if qos:
+        (packet_id,) = struct.unpack_from("!H", body, pos)
+        pos += 2
+    return topic, qos, packet_id, body[pos:]
+
+
+class MQTTClient:
+    """
+    One MQTT session on the running event loop.
+
+    connect() returns the CONNACK latency; publish() at QoS 1/2 waits for
+    the full acknowledgement flow; ping() returns the PINGREQ/PINGRESP
+    round trip.  Incoming PUBLISH packets are handed to on_message(topic,
+    payload, qos, dup) and acknowledged automatically.
+    """
+
+    def __init__(self, client_id, keepalive=60, clean_session=True,
+                 username=None, password=None, auto_keepalive=False):
+        self.client_id = client_id
+        self.keepalive = keepalive
+        self.clean_session = clean_session
+        self.username = username
+        self.password = password
+        self.auto_keepalive = auto_keepalive
+        self.on_message = None
+        self.on_disconnect = None
+
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._ping_task = None
+        self._next_id = 0
+        self._pending = {}
+        self._pings = collections.deque()
+        self._last_send = 0.0
+        self.connected = False
+
+    # -- connection lifecycle -------------------------------------------
+
+    async def connect(self, host, port, timeout=10.0):
+        start = time.perf_counter()
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), timeout)
+        self._send(connect_packet(self.client_id, self.keepalive, self.clean_session,
+                                  self.username, self.password))
+        try:
+            ptype, _, body = await asyncio.wait_for(read_packet(self._reader), timeout)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            self._abort()
+            raise MQTTError(f"connection closed before CONNACK: {e}")
+        except asyncio.TimeoutError:
+            self._abort()
+            raise
+        latency = time.perf_counter() - start
+        if ptype != CONNACK or len(body) < 2:
+            self._abort()
+            raise MQTTError(f"expected CONNACK, got packet type {ptype}")
+        if body[1] != 0:
+            self._abort()
+            raise MQTTError(f"CONNACK refused: {CONNACK_CODES.get(body[1], body[1])}")
+
+        self.connected = True
+        self._read_task = asyncio.ensure_future(self._read_loop())
+        if self.auto_keepalive and self.keepalive:
+            self._ping_task = asyncio.ensure_future(self._keepalive_loop())
+        return latency
+
+    async def disconnect(self):
+        if self._writer is None:
+            return
+        if self.connected:
+            try:
+                self._send(DISCONNECT_PACKET)
+                await self._writer.drain()
+            except ConnectionError:
+                pass
+        self.connected = False
+        self._abort()
+        if self._read_task is not None:
+            try:
+                await self._read_task
+            except asyncio.CancelledError:
+                pass
+
+    def _abort(self):
+        if self._ping_task is not None:
+            self._ping_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+    # -- operations -----------------------------------------------------
+
+    async def publish(self, topic, payload, qos=0, retain=False):
+        fut = self.publish_nowait(topic, payload, qos, retain)
+        await self._writer.drain()
+        if fut is not None:
+            await fut
+
+    def publish_nowait(self, topic, payload, qos=0, retain=False):
+        """
+        Write a PUBLISH immediately and return a future for its QoS 1/2
+        acknowledgement (None at QoS 0).  payload is bytes, str, or a tuple
+        of bytes parts sent back to back, so a fixed body need not be copied
+        behind a per-message header.  The transport may hold on to what it
+        is given until the socket takes it, so payload must not be a buffer
+        the caller changes afterwards.
+        """
+        packet_id = fut = None
+        if qos:
+            packet_id = self._packet_id()
+            fut = self._expect(packet_id)
+        self._write_publish(topic, payload, qos, packet_id, retain)
+        return fut
+
+    async def drain(self):
+        await self._writer.drain()
+
+    async def subscribe(self, topic, qos=0):
+        packet_id = self._packet_id()
+        fut = self._expect(packet_id)
+        self._send(subscribe_packet(packet_id, [(topic, qos)]))
+        await self._writer.drain()
+        granted = await fut
+        if granted and granted[0] == 0x80:
+            raise MQTTError(f"SUBSCRIBE to {topic!r} refused")
+        return granted
+
+    async def ping(self):
+        """Send one PINGREQ and wait for its PINGRESP; returns RTT in seconds."""
+        fut = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        self._pings.append(fut)
+        self._send(PINGREQ_PACKET)
+        await self._writer.drain()
+        await fut
+        return time.perf_counter() - start
+
+    async def wait_closed(self):
+        if self._read_task is not None:
+            await asyncio.shield(self._read_task)
+
+    # -- internals ------------------------------------------------------
+
+    def _send(self, data):
+        self._writer.write(data)
+        self._last_send = time.monotonic()
+
+    def _write_publish(self, topic, payload, qos, packet_id, retain):
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        parts = payload if isinstance(payload, tuple) else (payload,)
+        self._send(publish_header(topic, sum(len(part) for part in parts), qos, packet_id, retain))
+        for part in parts:
+            self._writer.write(part)
+
+    def _packet_id(self):
+        for _ in range(65535):
+            self._next_id = self._next_id % 65535 + 1
+            if self._next_id not in self._pending:
+                return self._next_id
+        raise MQTTError("no free packet identifiers")
+
+    def _expect(self, packet_id):
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[packet_id] = fut
+        return fut
+
+    def _resolve(self, packet_id, value=None):
+        fut = self._pending.pop(packet_id, None)
+        if fut is not None and not fut.done():
+            fut.set_result(value)
+
+    async def _keepalive_loop(self):
+        interval = self.keepalive
+        while self.connected:
+            idle = time.monotonic() - self._last_send
+            if idle >= interval * 0.75:
+                try:
+                    # None marks a keepalive ping nobody is waiting on
+                    self._pings.append(None)
+                    self._send(PINGREQ_PACKET)
+                except ConnectionError:
+                    return
+                idle = 0
+            await asyncio.sleep(max(interval * 0.75 - idle, 0.05))
+
+    async def _read_loop(self):
+        error = None
+        try:
+            while True:
+                ptype, flags, body = await read_packet(self._reader)
+                if ptype == PUBLISH:
+                    topic, qos, packet_id, payload = parse_publish(flags, body)
+                    if qos == 1:
+                        self._send(ack_packet(PUBACK, packet_id))
+                    elif qos == 2:
+                        self._send(ack_packet(PUBREC, packet_id))
+                    if self.on_message is not None:
+                        self.on_message(topic, payload, qos, bool(flags & 0x08))
+                elif ptype == PUBREL:
+                    self._send(ack_packet(PUBCOMP, struct.unpack("!H", body[:2])[0]))
+                elif ptype in (PUBACK, PUBCOMP, UNSUBACK):
+                    self._resolve(struct.unpack("!H", body[:2])[0])
+                elif ptype == PUBREC:
+                    packet_id = struct.unpack("!H", body[:2])[0]
+                    self._send(ack_packet(PUBREL, packet_id))
+                elif ptype == SUBACK:
+                    self._resolve(struct.unpack("!H", body[:2])[0], body[2:])
+                elif ptype == PINGRESP:
+                    if self._pings:
+                        fut = self._pings.popleft()
+                        if fut is not None and not fut.done():
+                            fut.set_result(None)
+        except (asyncio.IncompleteReadError, ConnectionError, MQTTError) as e:
+            error = e
+        finally:
+            was_connected = self.connected
+            self.connected = False
+            exc = ConnectionError(f"connection lost: {error}" if error else "connection closed")
+            for fut in list(self._pending.values()) + list(self._pings):
+                if fut is not None and not fut.done():
+                    fut.set_exception(exc)
+            self._pending.clear()
+            self._pings.clear()
+            self._abort()
+            if was_connected and self.on_disconnect is not None:
+                self.on_disconnect(error)
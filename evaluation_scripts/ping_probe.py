@@ -0,0 +1,250 @@
+"""
+Timer-driven MQTT keepalive probe.
+
+PingProbe holds one MQTT session on a raw non-blocking socket and sends
+PINGREQs on an open-loop timetable (schedule.py: evenly spaced or Poisson
+arrivals, so a slow iteration never shifts later probes), without waiting
+for the previous PINGRESP.  Probes the loop was too busy to send on time
+go out as soon as it catches up, and every RTT is measured from the
+probe's intended send time, kept in a ring buffer of outstanding probes.
+A broker answers PINGREQs on a connection in order, so each PINGRESP
+completes the oldest outstanding probe.
+
+A probe unanswered after `timeout` seconds means the session is broken:
+it and everything behind it are counted as lost and the session is
+re-established.  When `window` probes are already outstanding, the next
+one is skipped rather than queued, so a stalled broker cannot build up a
+backlog that would inflate the RTTs measured after it recovers.  Slots
+that fall while the broker refuses connections are skipped too.
+"""
+import os
+import selectors
+import socket
+import time
+
+import harness
+from mqtt_async import (
+    CONNACK, CONNACK_CODES, PINGREQ_PACKET, PINGRESP, SUBACK, MQTTError,
+    connect_packet, subscribe_packet
+)
+from schedule import Schedule
+
+NS = 1_000_000_000
+
+SEND = harness.stage("ping_send")
+RECEIVE = harness.stage("ping_receive")
+
+
+class PingProbe:
+    def __init__(self, host, port, interval, window=1024, timeout=5.0, keepalive=60,
+                 client_id=None, arrival="constant"):
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.arrival = arrival
+        self.schedule = None
+        self.timeout_ns = int(timeout * NS)
+        self.keepalive = keepalive
+        self.client_id = client_id or f"pinger-{os.getpid()}"
+
+        # Ring buffer of intended send times: slots [head, head + outstanding) are in flight
+        self._sent_ns = [0] * window
+        self._head = 0
+        self._outstanding = 0
+
+        self.sent = self.received = self.lost = self.skipped = self.reconnects = 0
+        self._sock = None
+        self._selector = selectors.DefaultSelector()
+        self._inbuf = bytearray()
+        self._outbuf = bytearray()
+        # monotonic_ns -> epoch seconds, fixed once so stamps stay monotonic
+        self._epoch_offset = time.time() - time.monotonic_ns() / NS
+
+    def epoch(self, stamp_ns):
+        return self._epoch_offset + stamp_ns / NS
+
+    # -- session --------------------------------------------------------
+
+    def connect(self):
+        """Open the session; returns the CONNECT -> CONNACK time in seconds."""
+        start = time.monotonic_ns()
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout_ns / NS)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.sendall(connect_packet(self.client_id, self.keepalive))
+        self._sock = sock
+        ptype, body = self._read_blocking()
+        elapsed = time.monotonic_ns() - start
+        if ptype != CONNACK or len(body) < 2:
+            raise MQTTError(f"expected CONNACK, got packet type {ptype}")
+        if body[1] != 0:
+            raise MQTTError(f"CONNACK refused: {CONNACK_CODES.get(body[1], body[1])}")
+        sock.setblocking(False)
+        self._selector.register(sock, selectors.EVENT_READ)
+        return elapsed / NS
+
+    def subscribe(self, topic, qos=0):
+        """Subscribe on the open session; returns the SUBSCRIBE -> SUBACK time in seconds."""
+        self._sock.setblocking(True)
+        self._sock.settimeout(self.timeout_ns / NS)
+        start = time.monotonic_ns()
+        self._sock.sendall(subscribe_packet(1, [(topic, qos)]))
+        while True:
+            ptype, _ = self._read_blocking()
+            if ptype == SUBACK:
+                break
+        elapsed = time.monotonic_ns() - start
+        self._sock.setblocking(False)
+        return elapsed / NS
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._selector.unregister(self._sock)
+            except (KeyError, ValueError):
+                pass
+            self._sock.close()
+            self._sock = None
+        self._inbuf.clear()
+        self._outbuf.clear()
+
+    def _reset(self):
+        """Drop a broken session, counting every probe in flight as lost."""
+        self.lost += self._outstanding
+        self._head = (self._head + self._outstanding) % len(self._sent_ns)
+        self._outstanding = 0
+        self.close()
+
+    def _reopen(self):
+        try:
+            self.connect()
+            self.reconnects += 1
+        except (OSError, MQTTError):
+            self.close()
+
+    # -- wire -----------------------------------------------------------
+
+    def _next_packet(self):
+        """Pop one complete (type, body) from the input buffer, or None."""
+        buf = self._inbuf
+        if len(buf) < 2:
+            return None
+        length, multiplier, pos = 0, 1, 1
+        while True:
+            if pos >= len(buf):
+                return None
+            byte = buf[pos]
+            length += (byte & 0x7F) * multiplier
+            pos += 1
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+            if multiplier > 128 ** 3:
+                raise MQTTError("malformed remaining length")
+        if len(buf) < pos + length:
+            return None
+        ptype, body = buf[0] >> 4, bytes(buf[pos:pos + length])
+        del buf[:pos + length]
+        return ptype, body
+
+    def _read_blocking(self):
+        while True:
+            packet = self._next_packet()
+            if packet is not None:
+                return packet
+            data = self._sock.recv(65536)
+            if not data:
+                raise MQTTError("connection closed")
+            self._inbuf += data
+
+    def _send_ping(self, intended_ns):
+        if self._outstanding == len(self._sent_ns):
+            self.skipped += 1
+            return
+        self._outbuf += PINGREQ_PACKET
+        try:
+            del self._outbuf[:self._sock.send(self._outbuf)]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._reset()
+            self.skipped += 1
+            return
+        self._sent_ns[(self._head + self._outstanding) % len(self._sent_ns)] = intended_ns
+        self._outstanding += 1
+        self.sent += 1
+
+    def _receive(self, on_rtt):
+        try:
+            data = self._sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        now_ns = time.monotonic_ns()
+        if not data:
+            self._reset()
+            return
+        self._inbuf += data
+        while True:
+            packet = self._next_packet()
+            if packet is None:
+                break
+            if packet[0] != PINGRESP or not self._outstanding:
+                continue
+            sent_ns = self._sent_ns[self._head]
+            self._head = (self._head + 1) % len(self._sent_ns)
+            self._outstanding -= 1
+            self.received += 1
+            on_rtt(sent_ns, now_ns - sent_ns)
+        if self._outbuf:
+            try:
+                del self._outbuf[:self._sock.send(self._outbuf)]
+            except BlockingIOError:
+                pass
+
+    # -- schedule -------------------------------------------------------
+
+    def run(self, duration, on_rtt):
+        """
+        Probe for `duration` seconds.  on_rtt(sent_ns, rtt_ns) is called for
+        every answered probe, with the intended send time as a
+        monotonic_ns stamp (see epoch()).
+        """
+        schedule = self.schedule = Schedule(1 / self.interval, self.arrival)
+        end = schedule.start_ns + int(duration * NS)
+        while True:
+            now = time.monotonic_ns()
+            if now >= end:
+                break
+            if schedule.due(now) and self._sock is None:
+                # Reconnect attempts follow the probe schedule; slots that
+                # pass while the broker is unreachable are not probes
+                self._reopen()
+                if self._sock is None:
+                    self.skipped += schedule.skip_missed()
+            while schedule.due(now) and schedule.next_ns < end and self._sock is not None:
+                started = time.perf_counter_ns()
+                self._send_ping(schedule.take(now))
+                SEND.add(started)
+            if self._outstanding and now - self._sent_ns[self._head] > self.timeout_ns:
+                self._reset()
+            # epoll rounds timeouts up to whole milliseconds, so wake up to
+            # 1 ms early and poll the rest of the way to the deadline
+            wait = max(min(schedule.next_ns, end) - time.monotonic_ns(), 0) // 1_000_000 / 1000
+            if self._sock is None:
+                time.sleep(wait)
+                continue
+            for _ in self._selector.select(wait):
+                started = time.perf_counter_ns()
+                self._receive(on_rtt)
+                RECEIVE.add(started)
+        # Give answers still in flight up to one timeout to arrive
+        drain_end = time.monotonic_ns() + self.timeout_ns
+        while self._outstanding and self._sock is not None:
+            wait = (drain_end - time.monotonic_ns()) / NS
+            if wait <= 0:
+                break
+            for _ in self._selector.select(wait):
+                self._receive(on_rtt)
+        self.lost += self._outstanding
+        self._outstanding = 0
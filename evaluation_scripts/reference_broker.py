@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+In-process MQTT 3.1.1 reference broker.
+
+A small asyncio broker to point the evaluation scripts at when none of the
+Docker brokers are available: to check the load generators, probes and
+availability math end to end on any machine, and to measure the harness's
+own overhead against a target that costs next to nothing.
+
+It handles CONNECT, SUBSCRIBE/UNSUBSCRIBE with + and # wildcards, PUBLISH
+at QoS 0-2 in both directions, PINGREQ and DISCONNECT.  Every session is
+treated as a clean session and retained messages are not kept.  Faults
+can be injected on purpose:
+
+  --latency/--jitter  delay every packet the broker sends (order is kept
+                      per connection)
+  --drop_rate         fraction of deliveries to subscribers silently dropped
+  --max_connections   CONNECTs beyond this are refused ("server unavailable")
+  --max_packet        connections sending a larger packet are closed
+  --outage P:L        every P seconds, drop all connections and stop
+                      listening for L seconds
+
+Run standalone (python reference_broker.py --port 1883) or embed it with
+ReferenceBroker(...).start(host, port).
+"""
+import argparse
+import asyncio
+import collections
+import random
+import struct
+import time
+from datetime import datetime
+
+from mqtt_async import (
+    CONNACK, CONNECT, DISCONNECT, PINGREQ, PINGRESP_PACKET, PUBACK, PUBCOMP, PUBLISH,
+    PUBREC, PUBREL, SUBACK, SUBSCRIBE, UNSUBACK, UNSUBSCRIBE, MQTTError, ack_packet,
+    fixed_header, parse_publish, publish_packet, read_packet
+)
+
+# MQTT 3.1.1 remaining-length ceiling
+MAX_PACKET = 268435455
+
+
+def topic_matches(topic_filter, topic):
+    """MQTT topic filter match with + (one level) and # (all remaining levels)"""
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def parse_connect(body):
+    """(client id, keepalive) from a CONNECT body"""
+    (name_len,) = struct.unpack_from("!H", body, 0)
+    pos = 2 + name_len + 2  # protocol name, level and connect flags
+    (keepalive,) = struct.unpack_from("!H", body, pos)
+    (id_len,) = struct.unpack_from("!H", body, pos + 2)
+    client_id = body[pos + 4:pos + 4 + id_len].decode("utf-8")
+    return client_id, keepalive
+
+
+def parse_subscribe(body, with_qos=True):
+    """(packet id, [(filter, requested qos)]) from a SUBSCRIBE or UNSUBSCRIBE body"""
+    (packet_id,) = struct.unpack_from("!H", body, 0)
+    pos, topics = 2, []
+    while pos < len(body):
+        (tlen,) = struct.unpack_from("!H", body, pos)
+        topic = body[pos + 2:pos + 2 + tlen].decode("utf-8")
+        pos += 2 + tlen
+        qos = 0
+        if with_qos:
+            qos = min(body[pos], 2)
+            pos += 1
+        topics.append((topic, qos))
+    return packet_id, topics
+
+
+class Session:
+    """One client connection and its subscriptions."""
+
+    def __init__(self, broker, writer):
+        self.broker = broker
+        self.writer = writer
+        self.client_id = None
+        self.subscriptions = {}  # filter -> granted qos
+        self.awaiting_rel = set()  # inbound QoS 2 packet ids
+        self._next_id = 0
+        self._inflight = set()  # outbound QoS 1/2 packet ids
+        self._send_due = 0.0
+
+    def packet_id(self):
+        for _ in range(65535):
+            self._next_id = self._next_id % 65535 + 1
+            if self._next_id not in self._inflight:
+                self._inflight.add(self._next_id)
+                return self._next_id
+        return None
+
+    def acknowledged(self, packet_id):
+        self._inflight.discard(packet_id)
+
+    def send(self, data):
+        """Write now, or after the injected latency without overtaking earlier packets"""
+        broker = self.broker
+        if not broker.latency and not broker.jitter:
+            self.writer.write(data)
+            return
+        loop = asyncio.get_running_loop()
+        delay = broker.latency + (broker.rng.uniform(0, broker.jitter) if broker.jitter else 0.0)
+        self._send_due = max(loop.time() + delay, self._send_due)
+        loop.call_at(self._send_due, self._write_later, data)
+
+    def _write_later(self, data):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    def close(self):
+        self.writer.close()
+
+
+class ReferenceBroker:
+    def __init__(self, latency=0.0, jitter=0.0, drop_rate=0.0, max_connections=0,
+                 max_packet=MAX_PACKET, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.max_connections = max_connections
+        self.max_packet = max_packet
+        self.rng = random.Random(seed)
+        self.sessions = {}  # client id -> Session
+        self.stats = collections.Counter()
+        self._server = None
+        self._host = self._port = None
+
+    async def start(self, host="0.0.0.0", port=1883):
+        self._host, self._port = host, port
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server
+
+    async def stop(self):
+        """Stop listening and drop every connection"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for session in list(self.sessions.values()):
+            session.close()
+
+    async def run_outages(self, period, length):
+        """Go down for `length` seconds every `period` seconds"""
+        while True:
+            await asyncio.sleep(period)
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] outage: down for {length:.1f} s")
+            await self.stop()
+            await asyncio.sleep(length)
+            await self.start(self._host, self._port)
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] outage over")
+
+    # -- connection -----------------------------------------------------
+
+    async def _handle(self, reader, writer):
+        session = Session(self, writer)
+        try:
+            ptype, _, body = await asyncio.wait_for(read_packet(reader, self.max_packet), 10.0)
+            if ptype != CONNECT:
+                return
+            client_id, keepalive = parse_connect(body)
+            if self.max_connections and len(self.sessions) >= self.max_connections:
+                self.stats["refused"] += 1
+                writer.write(fixed_header(CONNACK, 0, 2) + b"\x00\x03")
+                await writer.drain()
+                return
+            previous = self.sessions.get(client_id)
+            if previous is not None:
+                # Session takeover: the newer connection wins
+                previous.close()
+            session.client_id = client_id
+            self.sessions[client_id] = session
+            self.stats["connects"] += 1
+            session.send(fixed_header(CONNACK, 0, 2) + b"\x00\x00")
+            # Keepalive: the client must send something within 1.5x its interval
+            timeout = keepalive * 1.5 if keepalive else None
+            while True:
+                ptype, flags, body = await asyncio.wait_for(read_packet(reader, self.max_packet), timeout)
+                if ptype == DISCONNECT:
+                    break
+                self._dispatch(session, ptype, flags, body)
+                if writer.transport.get_write_buffer_size() > 1 << 20:
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, MQTTError,
+                struct.error, UnicodeDecodeError):
+            pass
+        finally:
+            if session.client_id is not None and self.sessions.get(session.client_id) is session:
+                del self.sessions[session.client_id]
+            writer.close()
+
+    def _dispatch(self, session, ptype, flags, body):
+        if ptype == PUBLISH:
+            topic, qos, packet_id, payload = parse_publish(flags, body)
+            self.stats["published"] += 1
+            if qos == 1:
+                session.send(ack_packet(PUBACK, packet_id))
+            elif qos == 2:
+                session.send(ack_packet(PUBREC, packet_id))
+                if packet_id in session.awaiting_rel:
+                    return  # duplicate of a QoS 2 message already routed
+                session.awaiting_rel.add(packet_id)
+            self.route(topic, payload, qos)
+        elif ptype == PUBREL:
+            packet_id = struct.unpack("!H", body[:2])[0]
+            session.awaiting_rel.discard(packet_id)
+            session.send(ack_packet(PUBCOMP, packet_id))
+        elif ptype in (PUBACK, PUBCOMP):
+            session.acknowledged(struct.unpack("!H", body[:2])[0])
+        elif ptype == PUBREC:
+            packet_id = struct.unpack("!H", body[:2])[0]
+            session.send(ack_packet(PUBREL, packet_id))
+        elif ptype == SUBSCRIBE:
+            packet_id, topics = parse_subscribe(body)
+            for topic_filter, qos in topics:
+                session.subscriptions[topic_filter] = qos
+            payload = struct.pack("!H", packet_id) + bytes(qos for _, qos in topics)
+            session.send(fixed_header(SUBACK, 0, len(payload)) + payload)
+        elif ptype == UNSUBSCRIBE:
+            packet_id, topics = parse_subscribe(body, with_qos=False)
+            for topic_filter, _ in topics:
+                session.subscriptions.pop(topic_filter, None)
+            session.send(ack_packet(UNSUBACK, packet_id))
+        elif ptype == PINGREQ:
+            session.send(PINGRESP_PACKET)
+
+    def route(self, topic, payload, qos):
+        """Deliver a message to every matching subscriber at min(publish, subscription) QoS"""
+        for session in list(self.sessions.values()):
+            granted = max((q for f, q in session.subscriptions.items() if topic_matches(f, topic)),
+                          default=None)
+            if granted is None:
+                continue
+            if self.drop_rate and self.rng.random() < self.drop_rate:
+                self.stats["dropped"] += 1
+                continue
+            out_qos = min(qos, granted)
+            packet_id = session.packet_id() if out_qos else None
+            if out_qos and packet_id is None:
+                self.stats["dropped"] += 1
+                continue
+            session.send(publish_packet(topic, payload, out_qos, packet_id))
+            self.stats["delivered"] += 1
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the in-process MQTT reference broker")
+    parser.add_argument("--host", default="0.0.0.0", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=1883, help="Port to listen on")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds added before every packet the broker sends")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="Extra uniformly random delay of up to this many seconds per packet")
+    parser.add_argument("--drop_rate", type=float, default=0.0,
+                        help="Fraction of deliveries to subscribers to drop (0-1)")
+    parser.add_argument("--max_connections", type=int, default=0,
+                        help="Refuse CONNECTs beyond this many live sessions (0 = no limit)")
+    parser.add_argument("--max_packet", type=int, default=MAX_PACKET,
+                        help="Close connections that send a packet larger than this (bytes)")
+    parser.add_argument("--outage", default=None,
+                        help="PERIOD:LENGTH - every PERIOD seconds, go down for LENGTH seconds")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the jitter and drop decisions")
+    return parser.parse_args()
+
+
+async def serve(args):
+    broker = ReferenceBroker(args.latency, args.jitter, args.drop_rate, args.max_connections,
+                             args.max_packet, args.seed)
+    await broker.start(args.host, args.port)
+    print(f"Reference broker listening on {args.host}:{args.port}")
+    tasks = []
+    if args.outage:
+        period, length = (float(v) for v in args.outage.split(":"))
+        tasks.append(asyncio.ensure_future(broker.run_outages(period, length)))
+    started = time.monotonic()
+    try:
+        while True:
+            await asyncio.sleep(10)
+            elapsed = time.monotonic() - started
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {len(broker.sessions)} sessions, "
+                  f"{broker.stats['published'] / elapsed:.0f} pub/s, "
+                  f"{broker.stats['delivered'] / elapsed:.0f} deliveries/s, "
+                  f"{broker.stats['dropped']} dropped, {broker.stats['refused']} refused")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await broker.stop()
+
+
+def main():
+    args = parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
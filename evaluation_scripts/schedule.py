@@ -0,0 +1,156 @@
+"""
+Open-loop load scheduling.
+
+A closed-loop generator waits for one operation before it starts the
+next.  A broker that slows down is then offered less load, and a stall is
+recorded once instead of once for every operation it held up (coordinated
+omission), so its latency looks better than it is.  A Schedule fixes every
+operation's intended start time in advance, from the rate and start time
+alone:
+
+  constant  start + k / rate
+  poisson   start + the sum of k exponential gaps with mean 1 / rate,
+            drawn from a seeded generator
+
+Operations fire at their intended time, or at once if the generator is
+running late, and their latency is measured from the intended time, so
+time spent queued behind a stall is counted.  How late each operation
+actually fired is recorded as schedule lag.  Lag well under one gap means
+the generator kept up; if more than SATURATED_FRACTION of operations
+fire a whole gap late, the harness itself was saturated and the numbers
+describe it rather than the broker.
+
+Times are time.monotonic_ns(), which is system-wide on Linux, so shards
+in separate processes can share one timetable and stamps.
+"""
+import asyncio
+import random
+import time
+
+from histogram import LatencyHistogram, summary_row
+
+ARRIVALS = ("constant", "poisson")
+NS = 1_000_000_000
+
+# Fraction of operations fired a whole gap late beyond which the generator is saturated
+SATURATED_FRACTION = 0.01
+
+
+class Schedule:
+    """Absolute timetable of intended operation times at `rate` per second."""
+
+    def __init__(self, rate, arrival="constant", start_ns=None, seed=None):
+        if rate <= 0:
+            raise ValueError("an open-loop schedule needs a positive rate")
+        if arrival not in ARRIVALS:
+            raise ValueError(f"arrival must be one of {', '.join(ARRIVALS)}")
+        self.rate = rate
+        self.arrival = arrival
+        self.gap_ns = NS / rate
+        self.start_ns = time.monotonic_ns() if start_ns is None else start_ns
+        self.next_ns = self.start_ns
+        self.lag = LatencyHistogram()
+        self.late = 0
+        self.skipped = 0
+        self._k = 0
+        self._offset = 0.0
+        self._rng = random.Random(seed)
+
+    def _advance(self):
+        self._k += 1
+        if self.arrival == "constant":
+            # From the start time each step, so rounding never accumulates
+            self.next_ns = self.start_ns + round(self._k * self.gap_ns)
+        else:
+            self._offset += self._rng.expovariate(1.0) * self.gap_ns
+            self.next_ns = self.start_ns + round(self._offset)
+
+    def due(self, now_ns=None):
+        """Whether the next operation's intended time has come"""
+        return self.next_ns <= (time.monotonic_ns() if now_ns is None else now_ns)
+
+    def take(self, now_ns=None):
+        """Fire the next operation at now_ns: records its lag and returns its intended time"""
+        now_ns = time.monotonic_ns() if now_ns is None else now_ns
+        intended = self.next_ns
+        lag = max(now_ns - intended, 0)
+        self.lag.record(lag)
+        if lag >= self.gap_ns:
+            self.late += 1
+        self._advance()
+        return intended
+
+    def skip_missed(self, now_ns=None):
+        """
+        Drop intended times already past instead of firing them late, for
+        health checks where a burst of catch-up checks tells nothing new.
+        Returns how many were dropped.
+        """
+        now_ns = time.monotonic_ns() if now_ns is None else now_ns
+        skipped = 0
+        while self.next_ns < now_ns:
+            skipped += 1
+            self._advance()
+        self.skipped += skipped
+        return skipped
+
+    async def wait(self):
+        """Sleep until the next intended time, then take() it"""
+        delay = self.next_ns - time.monotonic_ns()
+        if delay > 0:
+            await asyncio.sleep(delay / NS)
+        return self.take()
+
+    def summary(self):
+        """Counters and lag (seconds) for logs and result files"""
+        return lag_summary(self.lag, self.late, self.skipped)
+
+
+def merge_lag(parts):
+    """(lag histogram, late, skipped) summed over schedules or their lag_state() forms"""
+    lag, late, skipped = LatencyHistogram(), 0, 0
+    for part in parts:
+        if isinstance(part, Schedule):
+            lag.merge(part.lag)
+            late += part.late
+            skipped += part.skipped
+        else:
+            lag.merge(LatencyHistogram.from_dict(part["lag"]))
+            late += part["late"]
+            skipped += part["skipped"]
+    return lag, late, skipped
+
+
+def lag_state(schedule):
+    """A schedule's lag counters in a form that can cross a process boundary"""
+    return {"lag": schedule.lag.to_dict(), "late": schedule.late, "skipped": schedule.skipped}
+
+
+def lag_summary(lag, late, skipped=0):
+    s = lag.summary()
+    return {
+        "fired": lag.total,
+        "late": late,
+        "skipped": skipped,
+        "lag_p50": s["p50"],
+        "lag_p99": s["p99"],
+        "lag_max": s["max"],
+        "saturated": bool(lag.total) and late > SATURATED_FRACTION * lag.total,
+    }
+
+
+def describe_lag(lag, late, skipped=0):
+    """One log line on how far the generator fell behind its timetable"""
+    s = lag_summary(lag, late, skipped)
+    line = (f"schedule lag p50 {s['lag_p50'] * 1000:.3f} ms  p99 {s['lag_p99'] * 1000:.3f} ms  "
+            f"max {s['lag_max'] * 1000:.3f} ms, {late}/{lag.total} fired a gap or more late")
+    if skipped:
+        line += f", {skipped} skipped"
+    if s["saturated"]:
+        line += " - WARNING: the load generator could not keep up; results describe the harness"
+    return line
+
+
+def lag_row(lag, metric="ScheduleLag"):
+    """Schedule lag as a row in histogram.SUMMARY_HEADER layout"""
+    return summary_row(metric, lag)
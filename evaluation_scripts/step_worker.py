@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+A pre-warmed process for one evaluation step, started by app.py's StepPool
+(step_pool.py).
+
+It imports the evaluation scripts up front, then waits for one command on
+stdin, a JSON list [script, arg, ...], and runs that script's main() under
+harness.run().  Everything the step produces goes back on stdout as JSON
+lines, as it happens:
+
+  ["live", {metric: value}]   a live.report() call
+  ["line", text]              anything else the script printed
+  ["exit", status]            main() returned (0) or exited; always last
+
+The script's prints never reach stdout directly: sys.stdout and
+sys.stderr are replaced for the step, and file descriptor 1 is pointed at
+stderr, so output from C extensions cannot break the record stream.
+SIGTERM ends the step through SystemExit, so sharded workers are stopped
+and the harness report is still written.  One worker runs one step and
+exits, so no module state carries over to the next.
+"""
+import importlib
+import json
+import os
+import signal
+import sys
+import threading
+import traceback
+
+import harness
+import live
+
+# Imported while the worker waits, so a step starts without import time
+SCRIPTS = ("broker_pinger", "broker_availability", "max_clients_test", "throughput_test", "latency_test")
+
+
+class RecordStream:
+    """JSON-line records on a file; safe to share between threads."""
+
+    def __init__(self, f):
+        self._f = f
+        self._lock = threading.Lock()
+
+    def send(self, kind, value):
+        line = json.dumps([kind, value], separators=(",", ":")) + "\n"
+        with self._lock:
+            self._f.write(line)
+            self._f.flush()
+
+
+class LineWriter:
+    """A text stream that sends each complete line as a "line" record."""
+
+    encoding = "utf-8"
+
+    def __init__(self, records):
+        self._records = records
+        self._partial = ""
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            *lines, self._partial = (self._partial + text).split("\n")
+            for line in lines:
+                self._records.send("line", line)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+    def finish(self):
+        """Send a last line that was never terminated"""
+        with self._lock:
+            if self._partial:
+                self._records.send("line", self._partial)
+                self._partial = ""
+
+
+def run_step(script, argv):
+    """Run script's main() with argv; returns its exit status"""
+    sys.argv = [os.path.join(os.path.dirname(os.path.abspath(__file__)), script), *argv]
+    try:
+        harness.run(importlib.import_module(os.path.splitext(script)[0]).main)
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+def main():
+    for name in SCRIPTS:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass  # reported by the step that runs it
+    records = RecordStream(os.fdopen(os.dup(1), "w", encoding="utf-8"))
+    os.dup2(2, 1)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+
+    command = sys.stdin.readline()
+    if not command:
+        return  # the app closed without handing this worker a step
+    script, *argv = json.loads(command)
+    out = LineWriter(records)
+    sys.stdout = sys.stderr = out
+    live.set_sink(lambda metrics: records.send("live", metrics))
+    status = run_step(script, argv)
+    out.finish()
+    records.send("exit", status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Sustained publish throughput per QoS level.
+
+M publishers send sequence-numbered, timestamped payloads at a target (or
+unbounded) aggregate rate while K subscribers receive everything on the
+run's topic tree.  With a target rate, publishes follow an open-loop
+timetable (schedule.py) and carry their intended send time, so latency
+includes any time a publish spent waiting behind a slow broker.  Each
+subscriber tracks, per publisher, which sequence numbers it has seen, so
+the summary can report achieved publish rate, delivered rate, loss,
+duplicates and out-of-order deliveries, and records end-to-end latency
+from the embedded send time into a histogram.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import struct
+import time
+import uuid
+from datetime import datetime
+
+import harness
+from histogram import LatencyHistogram
+from live import report
+from loadgen import run_sharded, split_evenly
+from mqtt_async import MQTTClient
+from schedule import ARRIVALS, Schedule, describe_lag, lag_state, lag_summary, merge_lag
+
+BROKER = "localhost"
+
+# publisher id, sequence number, intended send time (time.monotonic_ns)
+HEADER = struct.Struct("!IQQ")
+
+PUBLISH = harness.stage("publish")
+DELIVER = harness.stage("deliver")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Measure sustained MQTT publish/deliver rate, loss, duplicates and reordering per QoS"
+    )
+    parser.add_argument("--name", required=True, help="Broker name (used for output file naming)")
+    parser.add_argument("--host", default=BROKER, help="Broker host name or address")
+    parser.add_argument("--port", type=int, default=1883, help="Broker port number")
+    parser.add_argument("--publishers", type=int, default=4, help="Number of publishing clients (M)")
+    parser.add_argument("--subscribers", type=int, default=2, help="Number of subscribing clients (K)")
+    parser.add_argument("--qos", default="0,1,2", help="Comma-separated QoS levels to run, one pass each")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="Aggregate target publish rate in msg/s (0 = unbounded)")
+    parser.add_argument("--arrival", choices=ARRIVALS, default="constant",
+                        help="With --rate: evenly spaced publishes or Poisson arrivals")
+    parser.add_argument("--duration", type=float, default=10.0, help="Publishing time per QoS level (s)")
+    parser.add_argument("--payload_size", type=int, default=256,
+                        help=f"Payload size in bytes (at least {HEADER.size} for the header)")
+    parser.add_argument("--window", type=int, default=32,
+                        help="Unacknowledged QoS 1/2 publishes allowed per publisher")
+    parser.add_argument("--drain", type=float, default=3.0,
+                        help="Seconds to keep subscribers listening after publishing stops")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes to spread publishers, subscribers and rate across")
+    parser.add_argument("--output", default=None,
+                        help="Write the results CSV here instead of a timestamped file under results/")
+    return parser.parse_args()
+
+
+class DeliveryTracker:
+    """Per-subscriber sequence accounting across all publishers."""
+
+    def __init__(self):
+        self.seen = {}          # publisher id -> bytearray bitmap of sequence numbers
+        self.highest = {}       # publisher id -> highest sequence number seen
+        self.received = 0
+        self.unique = 0
+        self.duplicates = 0
+        self.out_of_order = 0
+        self.last_receive = 0.0
+        self.latency = LatencyHistogram()
+
+    def on_message(self, topic, payload, qos, dup):
+        if len(payload) < HEADER.size:
+            return
+        started = time.perf_counter_ns()
+        pub_id, seq, sent_ns = HEADER.unpack_from(payload)
+        # monotonic_ns is system-wide on Linux, so this holds across processes
+        self.latency.record(time.monotonic_ns() - sent_ns)
+        self.received += 1
+        self.last_receive = time.monotonic()
+        bitmap = self.seen.get(pub_id)
+        if bitmap is None:
+            bitmap = self.seen[pub_id] = bytearray()
+        if seq >= len(bitmap):
+            bitmap.extend(bytes(seq - len(bitmap) + 4096))
+        if bitmap[seq]:
+            self.duplicates += 1
+            DELIVER.add(started)
+            return
+        bitmap[seq] = 1
+        self.unique += 1
+        if seq < self.highest.get(pub_id, -1):
+            self.out_of_order += 1
+        else:
+            self.highest[pub_id] = seq
+        DELIVER.add(started)
+
+
+async def publisher(client, pub_id, topic, qos, schedule, duration, payload_size, window):
+    """
+    Publish until `duration` elapses, on `schedule` if given or else as
+    fast as the window allows; returns (sent, failed).  Each message is a
+    freshly packed header followed by one shared, immutable body: the
+    transport may still hold earlier messages when the next one is built.
+    """
+    body = bytes(payload_size - HEADER.size)
+    inflight = asyncio.Semaphore(window)
+    pending = set()
+    failed = [0]
+    seq = 0
+
+    def done(fut):
+        inflight.release()
+        pending.discard(fut)
+        if fut.exception() is not None:
+            failed[0] += 1
+
+    end_ns = time.monotonic_ns() + int(duration * 1e9)
+    while True:
+        if schedule is not None:
+            if schedule.next_ns >= end_ns:
+                break
+            sent_ns = await schedule.wait()
+        else:
+            sent_ns = time.monotonic_ns()
+            if sent_ns >= end_ns:
+                break
+        payload = (HEADER.pack(pub_id, seq, sent_ns), body)
+        if qos == 0:
+            started = time.perf_counter_ns()
+            await client.publish(topic, payload, 0)
+            PUBLISH.add(started)
+            if seq % 64 == 0:
+                # drain() does not yield while the socket keeps up; let the
+                # subscribers on this loop run.
+                await asyncio.sleep(0)
+        else:
+            await inflight.acquire()
+            started = time.perf_counter_ns()
+            fut = client.publish_nowait(topic, payload, qos)
+            PUBLISH.add(started)
+            pending.add(fut)
+            fut.add_done_callback(done)
+            await client.drain()
+        seq += 1
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    return seq, failed[0]
+
+
+async def run_qos(args, qos, run=None, pub_ids=None, sub_ids=None, barrier=None, emit=None):
+    """
+    One QoS pass.  Standalone it runs every publisher and subscriber; as a
+    shard of a multi-process run it runs only pub_ids/sub_ids and meets the
+    other shards at `barrier` once everyone is subscribed and again once
+    publishing has stopped everywhere.  Returns raw counters for
+    combine_parts().
+    """
+    loop = asyncio.get_running_loop()
+    harness.watch_loop()
+    run = run or uuid.uuid4().hex[:6]
+    base = f"bench/{run}"
+    pub_ids = range(args.publishers) if pub_ids is None else pub_ids
+    sub_ids = range(args.subscribers) if sub_ids is None else sub_ids
+
+    trackers, subs = [], []
+    for k in sub_ids:
+        tracker = DeliveryTracker()
+        client = MQTTClient(f"tp-sub-{run}-{k}", keepalive=60, auto_keepalive=True)
+        client.on_message = tracker.on_message
+        await client.connect(args.host, args.port)
+        await client.subscribe(f"{base}/#", qos)
+        trackers.append(tracker)
+        subs.append(client)
+
+    pubs = []
+    for m in pub_ids:
+        client = MQTTClient(f"tp-pub-{run}-{m}", keepalive=60, auto_keepalive=True)
+        await client.connect(args.host, args.port)
+        pubs.append((m, client))
+
+    if barrier is not None:
+        await loop.run_in_executor(None, barrier.wait)
+
+    async def report():
+        while True:
+            await asyncio.sleep(1.0)
+            emit({"delivered": sum(t.unique for t in trackers)})
+
+    reporter = asyncio.ensure_future(report()) if emit is not None else None
+    t0 = time.monotonic()
+    schedules = {}
+    if args.rate > 0:
+        # Publishers start a share of the aggregate gap apart, so evenly
+        # spaced arrivals stay evenly spaced in aggregate
+        start_ns, gap_ns = time.monotonic_ns(), int(1e9 / args.rate)
+        schedules = {m: Schedule(args.rate / args.publishers, args.arrival, start_ns + m * gap_ns, seed=m)
+                     for m, _ in pubs}
+    results = await asyncio.gather(*(
+        publisher(client, m, f"{base}/{m}", qos, schedules.get(m), args.duration,
+                  args.payload_size, args.window)
+        for m, client in pubs
+    ))
+    publish_time = time.monotonic() - t0
+    sent = sum(r[0] for r in results)
+
+    # Let in-flight deliveries land.  Standalone we know how many to expect;
+    # a shard does not, so it stops once deliveries have gone quiet.
+    expected = sent * len(sub_ids)
+    if barrier is not None:
+        await loop.run_in_executor(None, barrier.wait)
+        expected = None
+    deadline = time.monotonic() + args.drain
+    last_count, quiet_since = -1, time.monotonic()
+    while time.monotonic() < deadline:
+        count = sum(t.unique for t in trackers)
+        if expected is not None and count >= expected:
+            break
+        if count != last_count:
+            last_count, quiet_since = count, time.monotonic()
+        elif expected is None and time.monotonic() - quiet_since >= 0.5:
+            break
+        await asyncio.sleep(0.05)
+    if reporter is not None:
+        reporter.cancel()
+
+    await asyncio.gather(*(c.disconnect() for _, c in pubs), *(c.disconnect() for c in subs),
+                         return_exceptions=True)
+
+    latency = LatencyHistogram()
+    for t in trackers:
+        latency.merge(t.latency)
+    return {
+        "sent": sent,
+        "publish_failed": sum(r[1] for r in results),
+        "t0": t0,
+        "publish_time": publish_time,
+        "delivered": sum(t.unique for t in trackers),
+        "duplicates": sum(t.duplicates for t in trackers),
+        "out_of_order": sum(t.out_of_order for t in trackers),
+        "last_receive": max((t.last_receive for t in trackers), default=0.0),
+        "latency": latency,
+        "schedule": [lag_state(s) for s in schedules.values()],
+    }
+
+
+def combine_parts(args, qos, parts):
+    """Merge per-shard counters into the per-QoS summary."""
+    sent = sum(p["sent"] for p in parts)
+    delivered = sum(p["delivered"] for p in parts)
+    expected = sent * args.subscribers
+    t0 = min(p["t0"] for p in parts)
+    publish_time = max(p["t0"] + p["publish_time"] for p in parts) - t0
+    last = max(p["last_receive"] for p in parts)
+    deliver_time = (last - t0) if last > t0 else publish_time
+    latency = LatencyHistogram()
+    for p in parts:
+        latency.merge(p["latency"])
+    lag, late, _ = merge_lag(s for p in parts for s in p["schedule"])
+    return {
+        "qos": qos,
+        "sent": sent,
+        "publish_failed": sum(p["publish_failed"] for p in parts),
+        "publish_rate": sent / publish_time if publish_time else 0,
+        "expected": expected,
+        "delivered": delivered,
+        "delivered_rate": delivered / deliver_time if deliver_time else 0,
+        "lost": max(expected - delivered, 0),
+        "duplicates": sum(p["duplicates"] for p in parts),
+        "out_of_order": sum(p["out_of_order"] for p in parts),
+        "duration": publish_time,
+        "latency": latency,
+        "lag": lag,
+        "late": late,
+    }
+
+
+def throughput_worker(index, shard, emit):
+    """run_sharded() target: this shard's publishers and subscribers for one QoS pass."""
+    part = asyncio.run(run_qos(shard["args"], shard["qos"], shard["run"], shard["pub_ids"],
+                               shard["sub_ids"], shard["barrier"], emit))
+    part["latency"] = part["latency"].to_dict()
+    return part
+
+
+def run_qos_sharded(args, qos):
+    """Spread publishers and subscribers over args.workers processes and merge their counters."""
+    barrier = multiprocessing.Barrier(args.workers)
+    run = uuid.uuid4().hex[:6]
+    shards, first_pub, first_sub = [], 0, 0
+    for n_pub, n_sub in zip(split_evenly(args.publishers, args.workers),
+                            split_evenly(args.subscribers, args.workers)):
+        shards.append({
+            "args": args, "qos": qos, "run": run, "barrier": barrier,
+            "pub_ids": range(first_pub, first_pub + n_pub),
+            "sub_ids": range(first_sub, first_sub + n_sub),
+        })
+        first_pub += n_pub
+        first_sub += n_sub
+
+    parts = run_sharded(throughput_worker, shards, progress_reporter(qos, args.workers))
+    for part in parts:
+        part["latency"] = LatencyHistogram.from_dict(part["latency"])
+    return combine_parts(args, qos, parts)
+
+
+def progress_reporter(qos, workers):
+    """on_record callback that logs and reports the running delivered count and rate."""
+    delivered = [0] * workers
+    last = [time.monotonic(), 0]
+
+    def on_record(index, record):
+        delivered[index] = record["delivered"]
+        total = sum(delivered)
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]     delivered so far: {total}")
+        now = time.monotonic()
+        rate = (total - last[1]) / (now - last[0]) if now > last[0] else 0
+        last[:] = [now, total]
+        report(qos=qos, delivered=total, delivered_rate=round(rate, 1))
+    return on_record
+
+
+def measure_qos(args, qos):
+    """One QoS pass, in-process or across worker processes depending on args.workers."""
+    if args.workers > 1:
+        return run_qos_sharded(args, qos)
+    on_record = progress_reporter(qos, 1)
+    return combine_parts(args, qos, [asyncio.run(run_qos(args, qos, emit=lambda r: on_record(0, r)))])
+
+
+def run_all(args, levels):
+    results = []
+    for qos in levels:
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] QoS {qos}: "
+              f"{args.publishers} publishers -> {args.subscribers} subscribers for {args.duration:.0f} s"
+              f" ({args.workers} worker{'s' if args.workers > 1 else ''})")
+        r = measure_qos(args, qos)
+        loss_pct = 100.0 * r["lost"] / r["expected"] if r["expected"] else 0.0
+        print(f"    published {r['sent']} ({r['publish_rate']:.1f} msg/s), "
+              f"delivered {r['delivered']}/{r['expected']} ({r['delivered_rate']:.1f} msg/s), "
+              f"lost {r['lost']} ({loss_pct:.2f}%), dup {r['duplicates']}, "
+              f"out-of-order {r['out_of_order']}")
+        lat = r["latency"].summary()
+        print(f"    latency p50 {lat['p50'] * 1000:.3f} ms  p99 {lat['p99'] * 1000:.3f} ms  "
+              f"p99.9 {lat['p99.9'] * 1000:.3f} ms  max {lat['max'] * 1000:.3f} ms")
+        if r["lag"].total:
+            print(f"    {describe_lag(r['lag'], r['late'])}")
+            harness.note(**{f"schedule_qos{qos}": lag_summary(r["lag"], r["late"])})
+        results.append(r)
+    return results
+
+
+def main():
+    args = parse_args()
+    args.payload_size = max(args.payload_size, HEADER.size)
+    levels = [int(q) for q in args.qos.split(",") if q.strip()]
+
+    args.workers = max(min(args.workers, max(args.publishers, args.subscribers)), 1)
+    results = run_all(args, levels)
+
+    os.makedirs("results", exist_ok=True)
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    out = args.output or os.path.join("results", f"throughput_results_{args.name}_{args.port}_{ts}.csv")
+    with open(out, "w") as f:
+        f.write("QoS,Publishers,Subscribers,Payload_Bytes,Target_Rate,Sent,Publish_Failed,"
+                "Publish_Rate,Expected,Delivered,Delivered_Rate,Lost,Loss_Pct,"
+                "Duplicates,Out_Of_Order,Duration_s,Latency_P50_s,Latency_P99_s,"
+                "Latency_P999_s,Latency_Max_s,Schedule_Lag_P99_s,Schedule_Lag_Max_s,Late_Sends\n")
+        for r in results:
+            loss_pct = 100.0 * r["lost"] / r["expected"] if r["expected"] else 0.0
+            lat = r["latency"].summary()
+            sched = lag_summary(r["lag"], r["late"])
+            f.write(f"{r['qos']},{args.publishers},{args.subscribers},{args.payload_size},"
+                    f"{args.rate:.1f},{r['sent']},{r['publish_failed']},{r['publish_rate']:.2f},"
+                    f"{r['expected']},{r['delivered']},{r['delivered_rate']:.2f},{r['lost']},"
+                    f"{loss_pct:.4f},{r['duplicates']},{r['out_of_order']},{r['duration']:.3f},"
+                    f"{lat['p50']:.6f},{lat['p99']:.6f},{lat['p99.9']:.6f},{lat['max']:.6f},"
+                    f"{sched['lag_p99']:.6f},{sched['lag_max']:.6f},{sched['late']}\n")
+    print(f"\nThroughput stats saved to {out}")
+
+
+if __name__ == "__main__":
+    harness.run(main)
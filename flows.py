@@ -0,0 +1,614 @@
+"""
+Node-RED flow generation and incremental deployment for simulations.
+
+build_simulation() turns a simulation spec into Sim-* tabs whose node IDs
+are derived from what each node is (tab, publisher name, role) rather than
+generated at random, so regenerating an unchanged simulation yields the
+same IDs.  Each tab carries a hash of its contents in its `info` field.
+
+deploy_tabs() compares those hashes with the Sim-* tabs already in
+Node-RED and pushes only the tabs that changed through the per-flow admin
+API (POST/PUT/DELETE /flow/:id).  Unchanged tabs, and every flow that is
+not a simulation, are never restarted.  The broker and dashboard config
+nodes are scoped to the tab that uses them, so a tab can be replaced on
+its own.
+
+Two topologies can be generated.  'classic' builds one function -> JSON ->
+mqtt out chain per publisher and a gauge plus text widget per subscriber.
+'compact' is for thousands of simulated sensors: one function node per
+batch of publishers in a topic group builds every payload for the batch
+on each tick and sends them through the group's single mqtt out node, and
+subscriptions feed one rolling-statistics table instead of a widget each.
+simulation_stats() gives the node count and expected message rates of a
+generated simulation so they can be shown before deploying.
+"""
+import hashlib
+import json
+from collections import OrderedDict
+
+import requests
+
+TAB_PREFIX = 'Sim-'
+HASH_PREFIX = 'sim-hash:'
+
+MODES = ('classic', 'compact')
+DEFAULT_BATCH_SIZE = 500       # compact mode: publishers per generator node
+DEFAULT_STATS_WINDOW = 10      # compact mode: seconds per statistics window
+
+
+def stable_id(*parts):
+    """16-hex-digit Node-RED ID derived from the parts that identify a node"""
+    return hashlib.sha1('\x1f'.join(str(p) for p in parts).encode()).hexdigest()[:16]
+
+
+def content_hash(nodes, configs):
+    blob = json.dumps([nodes, configs], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(blob.encode()).hexdigest()
+
+
+def make_tab(kind, nodes, configs):
+    """A per-flow API body, labelled Sim-<kind>-<id> and stamped with its content hash"""
+    tab_id = stable_id('tab', kind)
+    return {
+        'id': tab_id,
+        'label': f'{TAB_PREFIX}{kind}-{tab_id[:6]}',
+        'disabled': False,
+        'info': HASH_PREFIX + content_hash(nodes, configs),
+        'nodes': nodes,
+        'configs': configs,
+    }
+
+
+def unique_names(items):
+    """(item, key) pairs where key is the item's name, suffixed when a name repeats"""
+    seen = {}
+    for item in items:
+        n = seen.get(item['name'], 0)
+        seen[item['name']] = n + 1
+        yield item, item['name'] if n == 0 else f"{item['name']}#{n}"
+
+
+def broker_config(tab_id, broker_host, broker_port):
+    return {
+        "id":             stable_id(tab_id, 'broker'),
+        "type":           "mqtt-broker",
+        "z":              tab_id,
+        "name":           broker_host,
+        "broker":         broker_host,
+        "port":           broker_port,
+        "clientid":       "",
+        "autoConnect":    True,
+        "usetls":         False,
+        "protocolVersion": 4,
+        "keepalive":      60,
+        "cleansession":   True,
+        "sim_generated":  True
+    }
+
+
+def publisher_tab(spec, broker_host, broker_port):
+    tab_id = stable_id('tab', 'pub')
+    broker = broker_config(tab_id, broker_host, broker_port)
+    pubs = spec.get('publishers', [])
+    interval = spec.get('interval', 1)
+    nodes = []
+
+    # Inject node
+    inject_id = stable_id(tab_id, 'inject')
+    splitter_id = stable_id(tab_id, 'splitter')
+    nodes.append({
+        "id":       inject_id,
+        "type":     "inject",
+        "z":        tab_id,
+        "name":     "⏱ timestamp",
+        "props":    [{"p":"payload"}],
+        "repeat":   str(interval),
+        "once":     True,
+        "onceDelay":0.1,
+        "outputs":  1,
+        "wires":    [[splitter_id]]
+    })
+
+    # Splitter node
+    splitter_node = {
+        "id":       splitter_id,
+        "type":     "function",
+        "z":        tab_id,
+        "name":     "Splitter",
+        "func":     (
+            "var outputs = [];\n"
+            f"for(var i=0;i<{len(pubs)};i++){{ outputs.push({{payload:Date.now()}}); }}\n"
+            "return outputs;"
+        ),
+        "outputs":  len(pubs),
+        "noerr":    0,
+        "initialize":"",
+        "finalize": "",
+        "libs":     [],
+        "x":        200,
+        "y":        100,
+        "wires":    []
+    }
+    nodes.append(splitter_node)
+
+    # Publisher chains
+    y = 200
+    for p, key in unique_names(pubs):
+        fn_id = stable_id(tab_id, 'pub', key, 'function')
+        js_id = stable_id(tab_id, 'pub', key, 'json')
+        mout_id = stable_id(tab_id, 'pub', key, 'mqtt out')
+
+        func_code = (
+            f"msg.payload = Math.random()*({p['max']}-{p['min']})+{p['min']};\n"
+            "return msg;" if p.get('random') else
+            f"msg.payload = {p['min']}; return msg;"
+        )
+
+        # Function node
+        nodes.append({
+            "id":      fn_id,
+            "type":    "function",
+            "z":       tab_id,
+            "name":    p['name'],
+            "func":    func_code,
+            "outputs": 1,
+            "x":       320,
+            "y":       y,
+            "wires":   [[js_id]]
+        })
+
+        # JSON node
+        nodes.append({
+            "id":       js_id,
+            "type":     "json",
+            "z":        tab_id,
+            "name":     "to JSON",
+            "property": "payload",
+            "action":   "str",
+            "pretty":   False,
+            "x":        480,
+            "y":        y,
+            "wires":    [[mout_id]]
+        })
+
+        # MQTT Out node
+        nodes.append({
+            "id":       mout_id,
+            "type":     "mqtt out",
+            "z":        tab_id,
+            "name":     f"{p['name']} → {p['topic']}",
+            "topic":    p['topic'],
+            "qos":      str(p.get('qos',1)),
+            "retain":   False,
+            "broker":   broker['id'],
+            "x":        650,
+            "y":        y,
+            "wires":    []
+        })
+
+        splitter_node['wires'].append([fn_id])
+        y += 80
+
+    return make_tab('pub', nodes, [broker])
+
+
+def subscriber_tab(spec, broker_host, broker_port):
+    tab_id = stable_id('tab', 'sub')
+    broker = broker_config(tab_id, broker_host, broker_port)
+    ui_tab_id = stable_id(tab_id, 'ui_tab')
+    ui_grp_id = stable_id(tab_id, 'ui_group')
+    configs = [broker, {
+        "id":       ui_tab_id,
+        "type":     "ui_tab",
+        "z":        tab_id,
+        "name":     "Metrics",
+        "icon":     "dashboard",
+        "order":    1,
+        "disabled": False,
+        "hidden":   False
+    }, {
+        "id":      ui_grp_id,
+        "type":    "ui_group",
+        "z":       tab_id,
+        "name":    "Values",
+        "tab":     ui_tab_id,
+        "order":   1,
+        "disp":    True,
+        "width":   "24",
+        "collapse":False
+    }]
+
+    nodes = []
+    y = 80
+    for s, key in unique_names(spec.get('subscribers', [])):
+        in_id = stable_id(tab_id, 'sub', key, 'mqtt in')
+        func_id = stable_id(tab_id, 'sub', key, 'function')
+        gauge_id = stable_id(tab_id, 'sub', key, 'ui_gauge')
+        text_id = stable_id(tab_id, 'sub', key, 'ui_text')
+
+        # MQTT In node
+        nodes.append({
+            "id":      in_id,
+            "type":    "mqtt in",
+            "z":       tab_id,
+            "name":    f"{s['name']} ◀ {s['topic']}",
+            "topic":   s['topic'],
+            "qos":     str(s.get('qos',1)),
+            "datatype":"json",
+            "broker":  broker['id'],
+            "x":       300,
+            "y":       y,
+            "wires":   [[func_id]]
+        })
+
+        # Function node
+        nodes.append({
+            "id":      func_id,
+            "type":    "function",
+            "z":       tab_id,
+            "name":    f"{s['name']} Check",
+            "func":    "msg.payload = parseFloat(msg.payload).toFixed(2); return msg;",
+            "outputs": 1,
+            "x":       450,
+            "y":       y,
+            "wires":   [[gauge_id,text_id]]
+        })
+
+        # UI Gauge
+        nodes.append({
+            "id":      gauge_id,
+            "type":    "ui_gauge",
+            "z":       tab_id,
+            "name":    s['name'],
+            "group":   ui_grp_id,
+            "order":   1,
+            "width":   6,
+            "height":  5,
+            "gtype":   s.get('gtype','gage'),
+            "title":   s['name'],
+            "label":   s.get('unit',''),
+            "format":  "{{value}}",
+            "min":     0,
+            "max":     100,
+            "colors":  ["#00b500","#e6e600","#ca3838"],
+            "x":       620,
+            "y":       y,
+            "wires":   []
+        })
+
+        # UI Text
+        nodes.append({
+            "id":      text_id,
+            "type":    "ui_text",
+            "z":       tab_id,
+            "group":   ui_grp_id,
+            "order":   2,
+            "width":   0,
+            "height":  0,
+            "name":    f"{s['name']} Text",
+            "label":   s['name'],
+            "format":  "{{msg.payload}}",
+            "layout":  "row-spread",
+            "x":       800,
+            "y":       y,
+            "wires":   []
+        })
+
+        y += 80
+
+    return make_tab('sub', nodes, configs)
+
+
+def topic_group(topic):
+    """Publishers are batched by the first level of their topic"""
+    return topic.split('/', 1)[0]
+
+
+def compact_publisher_tab(spec, broker_host, broker_port):
+    tab_id = stable_id('tab', 'pub')
+    broker = broker_config(tab_id, broker_host, broker_port)
+    batch_size = max(int(spec.get('batch_size', DEFAULT_BATCH_SIZE)), 1)
+    interval = spec.get('interval', 1)
+
+    groups = OrderedDict()
+    for p in spec.get('publishers', []):
+        groups.setdefault((topic_group(p['topic']), str(p.get('qos', 1))), []).append(p)
+
+    inject_id = stable_id(tab_id, 'inject')
+    inject = {
+        "id":       inject_id,
+        "type":     "inject",
+        "z":        tab_id,
+        "name":     "⏱ tick",
+        "props":    [{"p":"payload"}],
+        "repeat":   str(interval),
+        "once":     True,
+        "onceDelay":0.1,
+        "outputs":  1,
+        "x":        120,
+        "y":        100,
+        "wires":    [[]]
+    }
+    nodes = [inject]
+
+    y = 100
+    for (group, qos), members in groups.items():
+        mout_id = stable_id(tab_id, 'group', group, qos, 'mqtt out')
+        for start in range(0, len(members), batch_size):
+            batch = members[start:start + batch_size]
+            fn_id = stable_id(tab_id, 'group', group, qos, 'batch', start // batch_size)
+            # [topic, min, max, random] per publisher; one message each per tick
+            table = json.dumps([[p['topic'], float(p['min']), float(p.get('max', p['min'])),
+                                 bool(p.get('random'))] for p in batch])
+            nodes.append({
+                "id":      fn_id,
+                "type":    "function",
+                "z":       tab_id,
+                "name":    f"{group or '/'} q{qos} × {len(batch)}",
+                "func":    (
+                    f"var pubs = {table};\n"
+                    "var out = new Array(pubs.length);\n"
+                    "for (var i = 0; i < pubs.length; i++) {\n"
+                    "    var p = pubs[i];\n"
+                    "    var v = p[3] ? Math.random()*(p[2]-p[1])+p[1] : p[1];\n"
+                    "    out[i] = {topic: p[0], payload: JSON.stringify(v)};\n"
+                    "}\n"
+                    "return [out];"
+                ),
+                "outputs": 1,
+                "x":       340,
+                "y":       y,
+                "wires":   [[mout_id]]
+            })
+            inject['wires'][0].append(fn_id)
+            y += 60
+        nodes.append({
+            "id":       mout_id,
+            "type":     "mqtt out",
+            "z":        tab_id,
+            "name":     f"{group or '/'} (QoS {qos})",
+            "topic":    "",
+            "qos":      qos,
+            "retain":   False,
+            "broker":   broker['id'],
+            "x":        600,
+            "y":        y - 60,
+            "wires":    []
+        })
+
+    return make_tab('pub', nodes, [broker])
+
+
+def subscription_topics(subs):
+    """Distinct subscribed topic filters, each at the highest QoS asked for"""
+    topics = OrderedDict()
+    for s in subs:
+        qos = int(s.get('qos', 1))
+        topics[s['topic']] = max(qos, topics.get(s['topic'], 0))
+    return topics
+
+
+def compact_subscriber_tab(spec, broker_host, broker_port):
+    tab_id = stable_id('tab', 'sub')
+    broker = broker_config(tab_id, broker_host, broker_port)
+    ui_tab_id = stable_id(tab_id, 'ui_tab')
+    ui_grp_id = stable_id(tab_id, 'ui_group')
+    window_ms = int(float(spec.get('stats_window', DEFAULT_STATS_WINDOW)) * 1000)
+    configs = [broker, {
+        "id":       ui_tab_id,
+        "type":     "ui_tab",
+        "z":        tab_id,
+        "name":     "Metrics",
+        "icon":     "dashboard",
+        "order":    1,
+        "disabled": False,
+        "hidden":   False
+    }, {
+        "id":      ui_grp_id,
+        "type":    "ui_group",
+        "z":       tab_id,
+        "name":    "Subscriptions",
+        "tab":     ui_tab_id,
+        "order":   1,
+        "disp":    True,
+        "width":   "24",
+        "collapse":False
+    }]
+
+    stats_id = stable_id(tab_id, 'stats')
+    table_id = stable_id(tab_id, 'stats', 'ui_template')
+    chart_id = stable_id(tab_id, 'stats', 'ui_chart')
+    nodes = []
+    y = 80
+    for topic, qos in subscription_topics(spec.get('subscribers', [])).items():
+        nodes.append({
+            "id":      stable_id(tab_id, 'sub', topic, 'mqtt in'),
+            "type":    "mqtt in",
+            "z":       tab_id,
+            "name":    f"◀ {topic}",
+            "topic":   topic,
+            "qos":     str(qos),
+            "datatype":"json",
+            "broker":  broker['id'],
+            "x":       200,
+            "y":       y,
+            "wires":   [[stats_id]]
+        })
+        y += 60
+
+    # Per-topic count, rate, mean/min/max over tumbling windows, published
+    # at most once a second, plus the total delivered rate for a chart
+    nodes.append({
+        "id":      stats_id,
+        "type":    "function",
+        "z":       tab_id,
+        "name":    "Rolling stats",
+        "func":    (
+            "var stats = context.get('stats') || {};\n"
+            "var now = Date.now();\n"
+            "var v = parseFloat(msg.payload);\n"
+            "var s = stats[msg.topic];\n"
+            "if (!s) { s = stats[msg.topic] = {n: 0, sum: 0, min: null, max: null, last: null, since: now}; }\n"
+            "if (!isNaN(v)) {\n"
+            "    s.n++; s.sum += v; s.last = v;\n"
+            "    s.min = s.min === null ? v : Math.min(s.min, v);\n"
+            "    s.max = s.max === null ? v : Math.max(s.max, v);\n"
+            "}\n"
+            "context.set('stats', stats);\n"
+            "if (now - (context.get('emitted') || 0) < 1000) { return null; }\n"
+            "context.set('emitted', now);\n"
+            "var rows = [], total = 0;\n"
+            "for (var t in stats) {\n"
+            "    var x = stats[t], secs = Math.max((now - x.since) / 1000, 1);\n"
+            "    rows.push({topic: t, count: x.n, rate: +(x.n / secs).toFixed(2),\n"
+            "               mean: x.n ? +(x.sum / x.n).toFixed(2) : null, min: x.min, max: x.max, last: x.last});\n"
+            "    total += x.n / secs;\n"
+            f"    if (now - x.since > {window_ms}) {{\n"
+            "        stats[t] = {n: 0, sum: 0, min: null, max: null, last: x.last, since: now};\n"
+            "    }\n"
+            "}\n"
+            "return [{payload: rows}, {topic: 'delivered msg/s', payload: +total.toFixed(2)}];"
+        ),
+        "outputs": 2,
+        "x":       450,
+        "y":       80,
+        "wires":   [[table_id], [chart_id]]
+    })
+    nodes.append({
+        "id":      table_id,
+        "type":    "ui_template",
+        "z":       tab_id,
+        "group":   ui_grp_id,
+        "name":    "Subscription stats",
+        "order":   1,
+        "width":   "24",
+        "height":  "10",
+        "format":  (
+            "<table style=\"width:100%\">\n"
+            "  <tr><th>Topic</th><th>Msgs</th><th>msg/s</th><th>Mean</th><th>Min</th><th>Max</th><th>Last</th></tr>\n"
+            "  <tr ng-repeat=\"r in msg.payload\">\n"
+            "    <td>{{r.topic}}</td><td>{{r.count}}</td><td>{{r.rate}}</td><td>{{r.mean}}</td>\n"
+            "    <td>{{r.min}}</td><td>{{r.max}}</td><td>{{r.last}}</td>\n"
+            "  </tr>\n"
+            "</table>"
+        ),
+        "storeOutMessages": True,
+        "fwdInMessages": False,
+        "templateScope": "local",
+        "x":       680,
+        "y":       60,
+        "wires":   [[]]
+    })
+    nodes.append({
+        "id":      chart_id,
+        "type":    "ui_chart",
+        "z":       tab_id,
+        "group":   ui_grp_id,
+        "name":    "Delivered rate",
+        "order":   2,
+        "width":   "24",
+        "height":  "6",
+        "label":   "Delivered msg/s",
+        "chartType": "line",
+        "removeOlder": 10,
+        "removeOlderUnit": "60",
+        "x":       680,
+        "y":       120,
+        "wires":   [[]]
+    })
+
+    return make_tab('sub', nodes, configs)
+
+
+def build_simulation(spec):
+    """The Sim-* tabs for a simulation spec, as per-flow API bodies"""
+    broker_host = spec.get('broker_name', 'localhost')
+    broker_port = str(spec.get('broker_port', 1883))
+    mode = spec.get('mode', 'classic')
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+    if mode == 'compact':
+        return [compact_publisher_tab(spec, broker_host, broker_port),
+                compact_subscriber_tab(spec, broker_host, broker_port)]
+    return [publisher_tab(spec, broker_host, broker_port),
+            subscriber_tab(spec, broker_host, broker_port)]
+
+
+def topic_matches(topic_filter, topic):
+    """MQTT topic filter matching, with + and # wildcards"""
+    filt, levels = topic_filter.split('/'), topic.split('/')
+    for i, f in enumerate(filt):
+        if f == '#':
+            return True
+        if i >= len(levels) or (f != '+' and f != levels[i]):
+            return False
+    return len(filt) == len(levels)
+
+
+def simulation_stats(spec, tabs):
+    """
+    Size of a generated simulation: Node-RED nodes (tabs and config nodes
+    included) and the expected publish and delivery rates in msg/s.  The
+    delivery rate counts one delivery per subscription node per matching
+    publish, so identical subscribers cost one delivery in compact mode.
+    """
+    interval = float(spec.get('interval', 1) or 1)
+    pubs = spec.get('publishers', [])
+    subs = spec.get('subscribers', [])
+    filters = (list(subscription_topics(subs)) if spec.get('mode') == 'compact'
+               else [s['topic'] for s in subs])
+    deliveries = sum(1 for f in filters for p in pubs if topic_matches(f, p['topic']))
+    return {
+        'mode': spec.get('mode', 'classic'),
+        'nodes': sum(1 + len(t['nodes']) + len(t['configs']) for t in tabs),
+        'publish_rate': round(len(pubs) / interval, 2),
+        'delivery_rate': round(deliveries / interval, 2),
+    }
+
+
+def plan_deploy(tabs, deployed):
+    """
+    Compare generated tabs with the deployed flow list.  Returns
+    (create, update, delete, unchanged): tabs to POST, tabs to PUT, IDs of
+    Sim-* tabs no longer generated, and IDs left alone.
+    """
+    existing = {
+        n['id']: n.get('info', '') for n in deployed
+        if n.get('type') == 'tab' and n.get('label', '').startswith(TAB_PREFIX)
+    }
+    create, update, unchanged = [], [], []
+    for tab in tabs:
+        if tab['id'] not in existing:
+            create.append(tab)
+        elif existing[tab['id']] != tab['info']:
+            update.append(tab)
+        else:
+            unchanged.append(tab['id'])
+    wanted = {tab['id'] for tab in tabs}
+    delete = [tab_id for tab_id in existing if tab_id not in wanted]
+    return create, update, delete, unchanged
+
+
+def deploy_tabs(base_url, tabs, session=requests):
+    """
+    Push only the Sim-* tabs that differ from what Node-RED is running.
+    Returns a summary of what was done; raises requests.HTTPError if the
+    admin API rejects a change.
+    """
+    resp = session.get(f'{base_url}/flows')
+    resp.raise_for_status()
+    create, update, delete, unchanged = plan_deploy(tabs, resp.json())
+
+    for tab in create:
+        session.post(f'{base_url}/flow', json=tab).raise_for_status()
+    for tab in update:
+        session.put(f"{base_url}/flow/{tab['id']}", json=tab).raise_for_status()
+    for tab_id in delete:
+        session.delete(f'{base_url}/flow/{tab_id}').raise_for_status()
+
+    return {
+        'created': [t['id'] for t in create],
+        'updated': [t['id'] for t in update],
+        'deleted': delete,
+        'unchanged': unchanged,
+    }
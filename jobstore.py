@@ -0,0 +1,218 @@
+"""
+Persistent registry of evaluation jobs and the result files they produced.
+
+Every job is recorded in an SQLite database with its parameters, the
+status and timings of each step, and the paths of its artifacts (ping
+log, summaries, resource recording, ...).  The database runs in WAL mode
+and each thread uses its own connection, so background job threads can
+write while request threads read.  Runs stay queryable after a restart,
+and finding a broker's latest result file is an index lookup on
+(broker, kind, created) instead of a directory scan.
+
+Parameters are stored as key/value rows indexed on (key, value), so jobs
+and artifacts can be filtered by any of them, e.g. payload_size='256'.
+Artifact paths are stored as given (the app stores them relative to its
+root, as used by /download).
+"""
+import json
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id       TEXT PRIMARY KEY,
+    kind     TEXT NOT NULL,
+    broker   TEXT,
+    port     TEXT,
+    params   TEXT NOT NULL,
+    status   TEXT NOT NULL,
+    created  REAL NOT NULL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_broker ON jobs (broker, created);
+CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created);
+
+CREATE TABLE IF NOT EXISTS job_params (
+    job_id TEXT NOT NULL REFERENCES jobs (id),
+    key    TEXT NOT NULL,
+    value  TEXT,
+    PRIMARY KEY (job_id, key)
+);
+CREATE INDEX IF NOT EXISTS job_params_value ON job_params (key, value);
+
+CREATE TABLE IF NOT EXISTS steps (
+    job_id   TEXT NOT NULL REFERENCES jobs (id),
+    step     TEXT NOT NULL,
+    script   TEXT,
+    status   TEXT NOT NULL,
+    started  REAL,
+    finished REAL,
+    PRIMARY KEY (job_id, step)
+);
+
+CREATE TABLE IF NOT EXISTS artifacts (
+    job_id  TEXT NOT NULL REFERENCES jobs (id),
+    kind    TEXT NOT NULL,
+    broker  TEXT,
+    path    TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (job_id, kind, path)
+);
+CREATE INDEX IF NOT EXISTS artifacts_broker ON artifacts (broker, kind, created);
+CREATE INDEX IF NOT EXISTS artifacts_kind ON artifacts (kind, created);
+"""
+
+FINAL_STATES = ('done', 'error', 'aborted')
+
+
+class JobStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def create_job(self, job_id, kind, broker, port, params, status='running'):
+        """Record a new job; scalar parameters are also indexed for filtering"""
+        db = self._conn()
+        with db:
+            db.execute(
+                'INSERT INTO jobs (id, kind, broker, port, params, status, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, broker, port, json.dumps(params), status, time.time())
+            )
+            db.executemany(
+                'INSERT INTO job_params (job_id, key, value) VALUES (?, ?, ?)',
+                [(job_id, k, str(v)) for k, v in params.items()
+                 if isinstance(v, (str, int, float, bool))]
+            )
+
+    def update_step(self, job_id, step, status, script=None):
+        """Set a step's status, stamping its start and end times as it starts and finishes"""
+        now = time.time()
+        db = self._conn()
+        with db:
+            db.execute(
+                'INSERT INTO steps (job_id, step, script, status, started, finished) '
+                'VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (job_id, step) DO UPDATE SET '
+                '  status = excluded.status, '
+                '  script = COALESCE(excluded.script, script), '
+                '  started = COALESCE(started, excluded.started), '
+                '  finished = excluded.finished',
+                (job_id, step, script, status,
+                 now if status == 'running' else None,
+                 now if status in FINAL_STATES else None)
+            )
+
+    def finish_job(self, job_id, status):
+        db = self._conn()
+        with db:
+            db.execute('UPDATE jobs SET status = ?, finished = ? WHERE id = ?',
+                       (status, time.time(), job_id))
+
+    def add_artifact(self, job_id, kind, path, broker=None):
+        """Register a file produced by a job; broker defaults to the job's own"""
+        db = self._conn()
+        with db:
+            db.execute(
+                'INSERT OR REPLACE INTO artifacts (job_id, kind, broker, path, created) '
+                'SELECT ?, ?, COALESCE(?, broker), ?, ? FROM jobs WHERE id = ?',
+                (job_id, kind, broker, path, time.time(), job_id)
+            )
+
+    def exists(self, job_id):
+        return self._conn().execute('SELECT 1 FROM jobs WHERE id = ?', (job_id,)).fetchone() is not None
+
+    def job(self, job_id):
+        """A job with its parameters, steps and artifacts, or None"""
+        db = self._conn()
+        row = db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['steps'] = {
+            r['step']: {'script': r['script'], 'status': r['status'],
+                        'started': r['started'], 'finished': r['finished']}
+            for r in db.execute('SELECT * FROM steps WHERE job_id = ? ORDER BY rowid', (job_id,))
+        }
+        job['artifacts'] = [
+            dict(r) for r in db.execute(
+                'SELECT kind, broker, path, created FROM artifacts WHERE job_id = ? ORDER BY created',
+                (job_id,))
+        ]
+        return job
+
+    def status(self, job_id):
+        """
+        A finished job's state shaped like the in-memory job status: step
+        names containing dots ('cells.c001.throughput') are nested again.
+        """
+        job = self.job(job_id)
+        if job is None:
+            return None
+        state = {'status': job['status'], 'finished': job['finished'] is not None}
+        for step, info in job['steps'].items():
+            *parents, leaf = step.split('.')
+            node = state
+            for p in parents:
+                node = node.setdefault(p, {})
+            node[leaf] = info['status']
+        return state
+
+    def _param_filters(self, params):
+        clauses, args = [], []
+        for k, v in params.items():
+            clauses.append('EXISTS (SELECT 1 FROM job_params p WHERE p.job_id = j.id '
+                           'AND p.key = ? AND p.value = ?)')
+            args += [k, str(v)]
+        return clauses, args
+
+    def jobs(self, broker=None, kind=None, limit=50, **params):
+        """Most recent jobs first, optionally filtered by broker, kind and parameter values"""
+        clauses, args = self._param_filters(params)
+        if broker is not None:
+            clauses.append('j.broker = ?')
+            args.append(broker)
+        if kind is not None:
+            clauses.append('j.kind = ?')
+            args.append(kind)
+        where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+        rows = self._conn().execute(
+            f'SELECT j.* FROM jobs j {where} ORDER BY j.created DESC LIMIT ?', (*args, limit)
+        )
+        return [dict(r, params=json.loads(r['params'])) for r in rows]
+
+    def artifacts(self, kind):
+        """(broker, path) of every `kind` artifact, newest first"""
+        rows = self._conn().execute(
+            'SELECT broker, path FROM artifacts WHERE kind = ? ORDER BY created DESC', (kind,))
+        return [(r['broker'], r['path']) for r in rows]
+
+    def artifact(self, broker, kind, job_id=None, **params):
+        """
+        Path of the newest `kind` artifact for a broker, from one job if
+        job_id is given, else from the most recent job matching params.
+        """
+        clauses, args = self._param_filters(params)
+        clauses = ['a.broker = ?', 'a.kind = ?', *clauses]
+        args = [broker, kind, *args]
+        if job_id is not None:
+            clauses.append('a.job_id = ?')
+            args.append(job_id)
+        row = self._conn().execute(
+            'SELECT a.path FROM artifacts a JOIN jobs j ON j.id = a.job_id '
+            f'WHERE {" AND ".join(clauses)} ORDER BY a.created DESC LIMIT 1', args
+        ).fetchone()
+        return row['path'] if row else None
@@ -0,0 +1,378 @@
+"""
+Container resource samplers and the background monitoring service.
+
+CgroupSampler reads a container's cgroup v2 files (and its network
+namespace counters through /proc) directly, which is cheap enough to poll
+at 10-100 Hz.  DockerStatsSampler polls the Docker stats API with one-shot
+requests and is the fallback when the cgroup tree is not visible, e.g.
+Docker Desktop or a rootless daemon.  Both return the same sample dict,
+keyed like the resource CSV columns.
+
+MonitoringService samples any number of containers, each at its own
+rate, with one thread for all cgroup-backed series and another for the
+slow Docker-backed ones; concurrent jobs share one Docker client.
+"""
+import math
+import os
+import threading
+import time
+
+from recorder import ResourceRecorder
+
+SAMPLE_FIELDS = ['cpu_percent', 'mem_usage', 'mem_limit', 'net_rx', 'net_tx',
+                 'block_read', 'block_write', 'open_fds']
+
+# Where dockerd puts a container's cgroup under the systemd and cgroupfs drivers
+CGROUP_LAYOUTS = ('system.slice/docker-{id}.scope', 'docker/{id}')
+
+
+def count_container_fds(pids, proc_root='/proc'):
+    """Count open file descriptors across pids (needs host /proc access)"""
+    total = 0
+    for pid in pids:
+        try:
+            total += len(os.listdir(f'{proc_root}/{pid}/fd'))
+        except OSError:
+            continue
+    return total
+
+
+def process_tree(pid, proc_root='/proc'):
+    """pid plus all of its descendants, via /proc/<pid>/task/*/children"""
+    pending, seen = [pid], []
+    while pending:
+        p = pending.pop()
+        if p in seen:
+            continue
+        seen.append(p)
+        try:
+            for task in os.listdir(f'{proc_root}/{p}/task'):
+                with open(f'{proc_root}/{p}/task/{task}/children') as f:
+                    pending.extend(int(c) for c in f.read().split())
+        except OSError:
+            continue
+    return seen
+
+
+def read_net_dev(pid, proc_root='/proc'):
+    """Sum rx/tx bytes over a process's network namespace, excluding loopback"""
+    rx = tx = 0
+    with open(f'{proc_root}/{pid}/net/dev') as f:
+        for line in f.readlines()[2:]:
+            iface, _, data = line.partition(':')
+            if iface.strip() == 'lo':
+                continue
+            fields = data.split()
+            rx += int(fields[0])
+            tx += int(fields[8])
+    return rx, tx
+
+
+class CgroupSampler:
+    """Sample a container straight from its cgroup v2 directory."""
+
+    backend = 'cgroup'
+
+    def __init__(self, container_id, cgroup_root='/sys/fs/cgroup', proc_root='/proc', cpu_count=None):
+        self.proc_root = proc_root
+        self.cpu_count = cpu_count or os.cpu_count() or 1
+        for layout in CGROUP_LAYOUTS:
+            path = os.path.join(cgroup_root, layout.format(id=container_id))
+            if os.path.exists(os.path.join(path, 'cpu.stat')):
+                self.path = path
+                break
+        else:
+            raise FileNotFoundError(f'no cgroup v2 directory for container {container_id[:12]}')
+        self._last_cpu = None
+        self._mem_total = None
+
+    def _read(self, name):
+        with open(os.path.join(self.path, name)) as f:
+            return f.read()
+
+    def _pids(self):
+        return [int(p) for p in self._read('cgroup.procs').split()]
+
+    def _host_memory(self):
+        if self._mem_total is None:
+            self._mem_total = 0
+            try:
+                with open(f'{self.proc_root}/meminfo') as f:
+                    for line in f:
+                        if line.startswith('MemTotal:'):
+                            self._mem_total = int(line.split()[1]) * 1024
+                            break
+            except OSError:
+                pass
+        return self._mem_total
+
+    def sample(self):
+        now = time.monotonic()
+
+        # CPU: usage_usec delta over wall time across all CPUs, matching the
+        # Docker stats formula (cpu_delta / system_delta) used before.
+        usage = 0
+        for line in self._read('cpu.stat').splitlines():
+            key, _, value = line.partition(' ')
+            if key == 'usage_usec':
+                usage = int(value)
+                break
+        cpu_percent = 0.0
+        if self._last_cpu is not None:
+            last_usage, last_time = self._last_cpu
+            wall = (now - last_time) * 1e6 * self.cpu_count
+            if wall > 0:
+                cpu_percent = (usage - last_usage) / wall * 100
+        self._last_cpu = (usage, now)
+
+        mem_usage = int(self._read('memory.current'))
+        mem_max = self._read('memory.max').strip()
+        mem_limit = self._host_memory() if mem_max == 'max' else int(mem_max)
+
+        block_read = block_write = 0
+        try:
+            for line in self._read('io.stat').splitlines():
+                for field in line.split()[1:]:
+                    key, _, value = field.partition('=')
+                    if key == 'rbytes':
+                        block_read += int(value)
+                    elif key == 'wbytes':
+                        block_write += int(value)
+        except FileNotFoundError:
+            pass
+
+        pids = self._pids()
+        net_rx = net_tx = 0
+        if pids:
+            try:
+                net_rx, net_tx = read_net_dev(pids[0], self.proc_root)
+            except OSError:
+                pass
+
+        return {
+            'cpu_percent': cpu_percent,
+            'mem_usage': mem_usage,
+            'mem_limit': mem_limit,
+            'net_rx': net_rx,
+            'net_tx': net_tx,
+            'block_read': block_read,
+            'block_write': block_write,
+            'open_fds': count_container_fds(pids, self.proc_root) if pids else None,
+        }
+
+
+class DockerStatsSampler:
+    """
+    Sample a container through the Docker stats API.  Each sample is a
+    one-shot request (no streaming connection held open per container), so
+    precpu_stats is empty and the CPU delta is taken against the previous
+    sample instead.
+    """
+
+    backend = 'docker'
+
+    def __init__(self, container):
+        self.container = container
+        self.pid = container.attrs.get('State', {}).get('Pid')
+        self._last_cpu = None
+
+    def sample(self):
+        stats = self.container.stats(stream=False, one_shot=True)
+
+        # Calculate CPU percentage with error handling
+        cpu_stats = stats.get('cpu_stats', {})
+        cpu_total = cpu_stats.get('cpu_usage', {}).get('total_usage', 0)
+        system_total = cpu_stats.get('system_cpu_usage', 0)
+
+        cpu_percent = 0
+        if self._last_cpu is not None:
+            cpu_delta = cpu_total - self._last_cpu[0]
+            system_delta = system_total - self._last_cpu[1]
+            cpu_percent = (cpu_delta / system_delta) * 100 if system_delta != 0 else 0
+        self._last_cpu = (cpu_total, system_total)
+
+        # Memory metrics with error handling
+        memory_stats = stats.get('memory_stats', {})
+
+        # Network metrics with error handling
+        networks = stats.get('networks', {})
+
+        # Block I/O metrics with error handling
+        blkio_stats = stats.get('blkio_stats', {}).get('io_service_bytes_recursive') or []
+
+        return {
+            'cpu_percent': cpu_percent,
+            'mem_usage': memory_stats.get('usage', 0),
+            'mem_limit': memory_stats.get('limit', 0),
+            'net_rx': sum(net.get('rx_bytes', 0) for net in networks.values()),
+            'net_tx': sum(net.get('tx_bytes', 0) for net in networks.values()),
+            'block_read': sum(blk.get('value', 0) for blk in blkio_stats if blk.get('op') == 'Read'),
+            'block_write': sum(blk.get('value', 0) for blk in blkio_stats if blk.get('op') == 'Write'),
+            # Open file descriptors (None when host /proc is not visible)
+            'open_fds': count_container_fds(process_tree(self.pid)) if self.pid else None,
+        }
+
+
+def make_sampler(container_id, backend='auto', cgroup_root='/sys/fs/cgroup', proc_root='/proc',
+                 docker_client=None):
+    """
+    Build a sampler for container_id.  'auto' prefers the cgroup reader and
+    falls back to Docker stats when the cgroup directory is not found.
+    """
+    if backend in ('auto', 'cgroup'):
+        try:
+            return CgroupSampler(container_id, cgroup_root, proc_root)
+        except FileNotFoundError:
+            if backend == 'cgroup':
+                raise
+    if docker_client is None:
+        import docker
+        docker_client = docker.from_env()
+    return DockerStatsSampler(docker_client.containers.get(container_id))
+
+
+class _Series:
+    """
+    One recorded container: its sampler, recorder and sampling schedule.
+    The schedule is a slot number on the service's grid of 1 / hz steps,
+    so series with the same rate are due at the same instants.
+    """
+
+    __slots__ = ('container_id', 'sampler', 'recorder', 'hz', 'slot')
+
+    def __init__(self, container_id, sampler, recorder, sample_hz, elapsed):
+        self.container_id = container_id
+        self.sampler = sampler
+        self.recorder = recorder
+        self.hz = float(sample_hz) if sample_hz > 0 else 1.0
+        self.slot = math.ceil(elapsed * self.hz)
+
+    def due(self):
+        """Seconds after the service started at which the next sample is due"""
+        # slot / hz rather than slot * interval: equal instants of series at
+        # different rates come out bit-for-bit equal
+        return self.slot / self.hz
+
+    def catch_up(self, elapsed):
+        """Skip to the first grid slot at or after `elapsed`"""
+        self.slot = max(self.slot, math.ceil(elapsed * self.hz))
+
+
+class MonitoringService:
+    """
+    Sample a changing set of containers, each at its own rate.
+
+    add() registers a series (a container plus the binary file it is
+    recorded to) and remove() closes it.  Each series is sampled at its own
+    1 / sample_hz on a grid shared by the whole service (its start time
+    plus whole intervals), so slow reads do not stretch its interval, a
+    fast series does not speed up a slow one, and series with the same
+    rate are sampled at, and stamped with, the same instants.  Series are
+    served by one thread per backend: a Docker stats request can take a
+    second or more, so Docker-backed series get their own lane and never
+    hold up the cgroup reads.  Samples are taken outside the service lock.
+    """
+
+    def __init__(self, cgroup_root='/sys/fs/cgroup', proc_root='/proc'):
+        self.cgroup_root = cgroup_root
+        self.proc_root = proc_root
+        self._series = {}  # key -> _Series
+        self._latest = {}  # key -> (timestamp, sample) most recently recorded
+        self._lock = threading.Lock()
+        self._wake = {}    # backend -> Event set when one of its series is added
+        self._threads = {}  # backend -> sampling thread
+        self._docker = None
+        # The sampling grid: slot k of a series is due k / sample_hz after these
+        self._epoch = time.monotonic()
+        self._epoch_wall = time.time()
+
+    def _docker_client(self):
+        if self._docker is None:
+            import docker
+            self._docker = docker.from_env()
+        return self._docker
+
+    def add(self, key, container_id, path, backend='auto', sample_hz=1.0):
+        """Start recording container_id to path under `key`; raises if it cannot be sampled."""
+        sampler = None
+        if backend in ('auto', 'cgroup'):
+            try:
+                sampler = make_sampler(container_id, 'cgroup', self.cgroup_root, self.proc_root)
+            except FileNotFoundError:
+                if backend == 'cgroup':
+                    raise
+        if sampler is None:
+            sampler = make_sampler(container_id, 'docker', docker_client=self._docker_client())
+        print(f"Monitoring {container_id[:12]} via {sampler.backend} sampler")
+        recorder = ResourceRecorder(path)
+        lane = sampler.backend
+        with self._lock:
+            self._series[key] = _Series(container_id, sampler, recorder, sample_hz,
+                                        time.monotonic() - self._epoch)
+            wake = self._wake.setdefault(lane, threading.Event())
+            thread = self._threads.get(lane)
+            if thread is None or not thread.is_alive():
+                self._threads[lane] = threading.Thread(target=self._run, args=(lane,), daemon=True)
+                self._threads[lane].start()
+        wake.set()
+
+    def remove(self, key):
+        """Stop recording `key` and flush its file."""
+        with self._lock:
+            series = self._series.pop(key, None)
+            self._latest.pop(key, None)
+            if series is not None:
+                series.recorder.close()
+
+    def keys(self):
+        with self._lock:
+            return list(self._series)
+
+    def latest(self, key):
+        """(timestamp, sample) most recently recorded for `key`, or None"""
+        return self._latest.get(key)
+
+    def _tick(self, lane):
+        """
+        Sample the lane's series that are due; returns seconds until the
+        next one is, or None when the lane has no series.
+        """
+        with self._lock:
+            lane_series = [(key, s) for key, s in self._series.items() if s.sampler.backend == lane]
+        if not lane_series:
+            return None
+        for key, series in lane_series:
+            elapsed = time.monotonic() - self._epoch
+            if series.due() > elapsed:
+                continue
+            # A series that fell a whole interval behind skips the slots it missed
+            series.catch_up(elapsed - 1.0 / series.hz)
+            now = self._epoch_wall + series.due()
+            series.slot += 1
+            try:
+                sample = series.sampler.sample()
+            except (KeyError, ValueError, ZeroDivisionError, OSError) as e:
+                print(f"Error sampling {series.container_id[:12]}: {str(e)}")
+                continue
+            except Exception as e:
+                print(f"Critical error sampling {series.container_id[:12]}, dropping {key}: {str(e)}")
+                with self._lock:
+                    if self._series.get(key) is series:
+                        del self._series[key]
+                        series.recorder.close()
+                continue
+            with self._lock:
+                # Skip the sample if the series was removed while it was taken
+                if self._series.get(key) is series:
+                    series.recorder.append(now, sample)
+                    self._latest[key] = (now, sample)
+        elapsed = time.monotonic() - self._epoch
+        return max(min(s.due() for _, s in lane_series) - elapsed, 0)
+
+    def _run(self, lane):
+        wake = self._wake[lane]
+        while True:
+            wake.clear()
+            delay = self._tick(lane)
+            # Sleep until the next series is due, or a new series is added
+            wake.wait(delay)
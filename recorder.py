@@ -0,0 +1,142 @@
+"""
+Buffered binary recorder for resource samples.
+
+Samples are packed into fixed-width little-endian records (float64 epoch
+and CPU percent, int64 counters) in an in-memory buffer and written to disk
+in batches, instead of formatting and flushing one CSV row per sample.
+The file is a short self-describing header followed by back-to-back
+records, so a reader can pick up from any record boundary while the file
+is still being written.  CSV is produced on demand for downloads, and a
+finished recording can be rewritten as a Parquet series (to_parquet).
+"""
+import json
+import struct
+import time
+from datetime import datetime
+
+MAGIC = b'IOTRES1\n'
+
+# (column, struct code); open_fds is stored as -1 when unknown
+FIELDS = [
+    ('timestamp', 'd'),
+    ('cpu_percent', 'd'),
+    ('mem_usage', 'q'),
+    ('mem_limit', 'q'),
+    ('net_rx', 'q'),
+    ('net_tx', 'q'),
+    ('block_read', 'q'),
+    ('block_write', 'q'),
+    ('open_fds', 'q'),
+]
+COLUMNS = [name for name, _ in FIELDS]
+RECORD = struct.Struct('<' + ''.join(code for _, code in FIELDS))
+
+
+def _header():
+    meta = json.dumps({'fields': FIELDS, 'format': RECORD.format}).encode()
+    return MAGIC + struct.pack('<H', len(meta)) + meta
+
+
+def data_offset(f):
+    """Validate the header of an open recorder file and return where records start."""
+    f.seek(0)
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError('not a resource recorder file')
+    (meta_len,) = struct.unpack('<H', f.read(2))
+    return len(MAGIC) + 2 + meta_len
+
+
+class ResourceRecorder:
+    """Append samples to a binary file, flushing every flush_every samples or flush_interval seconds."""
+
+    def __init__(self, path, flush_every=256, flush_interval=1.0):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._file = open(path, 'wb')
+        self._file.write(_header())
+        self._file.flush()
+        self._buffer = bytearray()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def append(self, timestamp, sample):
+        open_fds = sample.get('open_fds')
+        self._buffer += RECORD.pack(
+            timestamp,
+            float(sample['cpu_percent']),
+            int(sample['mem_usage']),
+            int(sample['mem_limit']),
+            int(sample['net_rx']),
+            int(sample['net_tx']),
+            int(sample['block_read']),
+            int(sample['block_write']),
+            -1 if open_fds is None else int(open_fds),
+        )
+        self._pending += 1
+        if (self._pending >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._file.flush()
+            self._buffer.clear()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_records(path, offset=None):
+    """
+    Read whole records from `offset` (default: the first record) to the end
+    of the file.  Returns (records, next_offset); a trailing partial record
+    from an in-progress flush is left for the next call.
+    """
+    with open(path, 'rb') as f:
+        start = data_offset(f) if offset is None else offset
+        f.seek(start)
+        data = f.read()
+    usable = len(data) - len(data) % RECORD.size
+    records = [
+        r[:-1] + (None if r[-1] < 0 else r[-1],)
+        for r in RECORD.iter_unpack(memoryview(data)[:usable])
+    ]
+    return records, start + usable
+
+
+def iter_csv(path):
+    """Yield the recording as CSV text lines (header first), timestamps in ISO format."""
+    yield ','.join(COLUMNS) + '\n'
+    records, _ = read_records(path)
+    for r in records:
+        ts = datetime.fromtimestamp(r[0]).isoformat()
+        fds = '' if r[-1] is None else r[-1]
+        yield f"{ts},{round(r[1], 2)},{r[2]},{r[3]},{r[4]},{r[5]},{r[6]},{r[7]},{fds}\n"
+
+
+# Column types and CSV formats of a recording rewritten as a Parquet series
+PARQUET_FIELDS = [
+    (name, 'float64' if code == 'd' else 'int64',
+     'iso' if name == 'timestamp' else '.2f' if code == 'd' else 'd')
+    for name, code in FIELDS
+]
+
+
+def to_parquet(path, out_path, broker=None, row_group_size=65536):
+    """Rewrite a finished recording as a Parquet series with large row groups."""
+    from series_store import SeriesWriter
+    records, _ = read_records(path)
+    with SeriesWriter(out_path, PARQUET_FIELDS, broker=broker, flush_every=row_group_size) as writer:
+        writer.extend(records)
+    return out_path
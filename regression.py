@@ -0,0 +1,115 @@
+"""
+Regression checks between a broker's latest run and its earlier runs.
+
+Metrics with per-sample series (ping RTTs, client connection times,
+resource samples) compare the latest run's samples with the pooled
+samples of up to `baseline` earlier runs of the same configuration, using
+a two-sided Mann-Whitney U test (normal approximation with tie
+correction) or a two-sample Kolmogorov-Smirnov test.  Both are rank
+based, so the long right tail of latency data does not dominate the way
+it would in a t-test.
+
+Metrics with one number per run (throughput per QoS, per-connection
+memory, older summary files) have no sample distribution to test; the
+latest value is compared with the earlier values through a robust z-score
+(distance from their median in units of 1.4826 x MAD).
+
+Large samples make even negligible shifts significant, so a result is
+only a regression or improvement when it is significant AND the median
+moved by at least min_change.
+"""
+import math
+
+import numpy as np
+
+TESTS = ('mannwhitney', 'ks')
+
+# Cap on samples per side; larger series are randomly subsampled
+MAX_SAMPLES = 100000
+
+
+def rank_ties(values):
+    """Average ranks (1-based) of values, and the sum of t^3 - t over tie groups"""
+    order = np.argsort(values, kind='mergesort')
+    _, first, counts = np.unique(values[order], return_index=True, return_counts=True)
+    ranks = np.empty(len(values))
+    ranks[order] = np.repeat(first + (counts + 1) / 2, counts)
+    return ranks, float((counts.astype(float) ** 3 - counts).sum())
+
+
+def mann_whitney(x, y):
+    """(U statistic of x, two-sided p-value)"""
+    n1, n2 = len(x), len(y)
+    n = n1 + n2
+    ranks, ties = rank_ties(np.concatenate([x, y]))
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2
+    mu = n1 * n2 / 2
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))))
+    if sigma == 0:
+        return float(u), 1.0
+    z = (abs(u - mu) - 0.5) / sigma
+    return float(u), min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2)))
+
+
+def kolmogorov_sf(lam):
+    """P(K > lam) for the Kolmogorov distribution"""
+    if lam < 0.2:
+        return 1.0
+    k = np.arange(1, 101)
+    return float(min(1.0, max(0.0, 2 * np.sum((-1.0) ** (k - 1) * np.exp(-2 * k ** 2 * lam ** 2)))))
+
+
+def ks_2samp(x, y):
+    """(D statistic, asymptotic two-sided p-value)"""
+    x, y = np.sort(x), np.sort(y)
+    both = np.concatenate([x, y])
+    d = float(np.max(np.abs(np.searchsorted(x, both, side='right') / len(x)
+                            - np.searchsorted(y, both, side='right') / len(y))))
+    en = math.sqrt(len(x) * len(y) / (len(x) + len(y)))
+    return d, kolmogorov_sf((en + 0.12 + 0.11 / en) * d)
+
+
+def _verdict(latest, baseline, significant, higher_is_worse, min_change):
+    """(relative change of latest over baseline or None if baseline is 0, verdict)"""
+    change = (latest - baseline) / abs(baseline) if baseline else None
+    if not significant or latest == baseline or (change is not None and abs(change) < min_change):
+        return change, 'no change'
+    worse = latest > baseline if higher_is_worse else latest < baseline
+    return change, 'regression' if worse else 'improvement'
+
+
+def compare_samples(latest, baseline, higher_is_worse=True, test='mannwhitney', alpha=0.01,
+                    min_change=0.05, seed=0):
+    """Test the latest run's samples against the pooled baseline samples"""
+    latest = np.asarray(latest, dtype=float)
+    baseline = np.asarray(baseline, dtype=float)
+    latest, baseline = latest[~np.isnan(latest)], baseline[~np.isnan(baseline)]
+    result = {'method': test, 'n_latest': int(len(latest)), 'n_baseline': int(len(baseline))}
+    if len(latest) < 2 or len(baseline) < 2:
+        return dict(result, verdict='insufficient data')
+    rng = np.random.default_rng(seed)
+    if len(latest) > MAX_SAMPLES:
+        latest = rng.choice(latest, MAX_SAMPLES, replace=False)
+    if len(baseline) > MAX_SAMPLES:
+        baseline = rng.choice(baseline, MAX_SAMPLES, replace=False)
+    statistic, p = (ks_2samp if test == 'ks' else mann_whitney)(latest, baseline)
+    latest_median, baseline_median = float(np.median(latest)), float(np.median(baseline))
+    change, verdict = _verdict(latest_median, baseline_median, p < alpha, higher_is_worse, min_change)
+    return dict(result, statistic=statistic, p_value=p,
+                latest=latest_median, baseline=baseline_median, change=change, verdict=verdict)
+
+
+def compare_values(latest, baseline, higher_is_worse=True, z_threshold=3.0, min_change=0.05):
+    """Compare one per-run value against the values of the baseline runs"""
+    baseline = np.asarray(baseline, dtype=float)
+    result = {'method': 'robust_z', 'n_latest': 1, 'n_baseline': int(len(baseline))}
+    if len(baseline) < 3:
+        return dict(result, verdict='insufficient data')
+    median = float(np.median(baseline))
+    mad = 1.4826 * float(np.median(np.abs(baseline - median)))
+    # Identical baseline values: any difference counts, and z is left undefined
+    z = (latest - median) / mad if mad else None
+    significant = abs(z) > z_threshold if mad else latest != median
+    change, verdict = _verdict(float(latest), median, significant, higher_is_worse, min_change)
+    return dict(result, statistic=z, latest=float(latest), baseline=median, change=change,
+                verdict=verdict)
@@ -0,0 +1,199 @@
+"""
+In-process cache for parsed result files, used by the results pages.
+
+Entries are keyed on (path, parser) and are valid while the file's mtime
+and size are unchanged; the least recently used entries are evicted once
+there are more than max_entries.  Files that only ever grow (the live
+resource recording, the pinger's per-ping CSV) are loaded through
+load_appended(), which keeps the byte offset it stopped at and parses just
+the new tail on the next call instead of the whole file.  aggregate()
+caches a value derived from a whole set of files, such as the
+cross-broker comparison.
+
+Files are parsed outside the cache lock, so one slow parse does not hold
+up requests for other files; concurrent requests for the same file wait
+for a single parse.  A file that fails to parse reads as the caller's
+default until it changes, and error(path) says why.
+
+Cached values are shared between requests: callers must not mutate them.
+"""
+import glob
+import os
+import threading
+from collections import OrderedDict
+
+
+class ResultsCache:
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (stamp, value, offset)
+        self._loading = {}  # key -> Event set once its claimed parse is done
+        self._errors = {}   # path -> why its last parse failed
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _claim(self, key, stamp):
+        """
+        (entry, claimed): the cached entry for key, and whether the caller
+        must rebuild it because it is missing or not from `stamp`.  A
+        caller that claimed a key must _release() it; others wait for that
+        rather than parse the same file again.
+        """
+        while True:
+            with self._lock:
+                entry = self._get(key)
+                if entry is not None and entry[0] == stamp:
+                    return entry, False
+                pending = self._loading.get(key)
+                if pending is None:
+                    self._loading[key] = threading.Event()
+                    return entry, True
+            pending.wait()
+
+    def _release(self, key, entry=None):
+        with self._lock:
+            if entry is not None:
+                self._put(key, entry)
+            self._loading.pop(key).set()
+
+    def _parse(self, path, parse, *args):
+        """(ok, parse(path, *args)); a failure is logged and kept for error()"""
+        try:
+            value = parse(path, *args)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"Error reading {path}: {error}")
+            with self._lock:
+                self._errors[path] = error
+            return False, None
+        with self._lock:
+            self._errors.pop(path, None)
+        return True, value
+
+    def error(self, path):
+        """Why `path` could not be parsed the last time it was read, or None"""
+        with self._lock:
+            return self._errors.get(path)
+
+    def load(self, path, parse, default=None):
+        """parse(path), re-run only when the file's mtime or size changes; path may be None"""
+        if path is None:
+            return default
+        try:
+            st = os.stat(path)
+        except OSError:
+            return default
+        key = (path, parse)
+        stamp = (st.st_mtime_ns, st.st_size)
+        entry, claimed = self._claim(key, stamp)
+        if not claimed:
+            return entry[1]
+        try:
+            ok, value = self._parse(path, parse)
+            # A file that failed is not parsed again until it changes
+            entry = (stamp, value if ok else default, None)
+        finally:
+            self._release(key, entry)
+        return entry[1]
+
+    def load_appended(self, path, read_from, default=None):
+        """
+        Items from an append-only file.  read_from(path, offset) returns
+        (new_items, next_offset), with offset None meaning the start of the
+        file; items already parsed are kept and only the tail is read.  A
+        file that shrank or was replaced is parsed again from the start.
+        """
+        if path is None:
+            return default
+        try:
+            st = os.stat(path)
+        except OSError:
+            return default
+        key = (path, read_from)
+        stamp = (st.st_ino, st.st_size)
+        entry, claimed = self._claim(key, stamp)
+        if not claimed:
+            return entry[1]
+        if entry is not None and entry[0][0] == st.st_ino and entry[0][1] <= st.st_size:
+            items, offset = entry[1], entry[2]
+        else:
+            items, offset = [], None
+        stored = None
+        try:
+            ok, read = self._parse(path, read_from, offset)
+            if not ok:
+                return items or default
+            new_items, offset = read
+            items = items + new_items if new_items else items
+            stored = (stamp, items, offset)
+        finally:
+            self._release(key, stored)
+        return items
+
+    def aggregate(self, name, paths, build):
+        """
+        build(paths) for a result computed from many files, cached under
+        `name` and re-run only when
+        a file is added or removed or any file's mtime or size changes.
+        build runs outside the lock, so it may load files through this cache.
+        """
+        stamp = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stamp.append((path, st.st_mtime_ns, st.st_size))
+        stamp = tuple(sorted(stamp))
+        key = ('aggregate', name)
+        with self._lock:
+            entry = self._get(key)
+            if entry is not None and entry[0] == stamp:
+                return entry[1]
+        value = build([path for path, _, _ in stamp])
+        with self._lock:
+            self._put(key, (stamp, value, None))
+        return value
+
+    def latest(self, pattern):
+        """Last path matching a glob pattern in sort order, cached on the directory's mtime"""
+        directory = os.path.dirname(pattern)
+        try:
+            stamp = os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+        key = (pattern, 'latest')
+        with self._lock:
+            entry = self._get(key)
+            if entry is not None and entry[0] == stamp:
+                return entry[1]
+            files = glob.glob(pattern)
+            value = max(files) if files else None
+            self._put(key, (stamp, value, None))
+            return value
+
+
+def read_csv_lines(path, offset=None):
+    """
+    Complete lines from `offset` (default: the start) as lists of fields,
+    plus the offset just past the last complete line.  A line still being
+    written is left for the next call.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset or 0)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    text = data[:end].decode('utf-8', errors='replace')
+    rows = [line.rstrip('\r').split(',') for line in text.split('\n')[:-1]]
+    return rows, (offset or 0) + end
@@ -0,0 +1,209 @@
+"""
+Columnar storage for per-sample benchmark series: ping RTTs, client
+connection times and container resource samples.
+
+With pyarrow installed, series are Parquet files with typed columns.
+SeriesWriter buffers rows and writes each batch as one row group, instead
+of opening and appending to a CSV file per sample, and adds the broker as
+a dictionary-encoded column.  read_series() pushes time-range and broker
+predicates down to the row-group statistics, so only the row groups that
+can match are decoded, and hands back NumPy views of the Arrow buffers
+where the column allows it.  Without pyarrow the same writer produces
+buffered CSV in the layout the scripts used before.
+
+Summary values that belonged to a file (the max-clients Metric,Value
+block) go into the Parquet footer metadata, together with the CSV header
+and number formats, so to_csv() can rebuild the CSV layout for /download.
+"""
+import json
+import os
+import time
+from datetime import datetime
+
+PARQUET = '.parquet'
+CSV = '.csv'
+
+# (column, Arrow type, CSV format) for each series; 'iso' formats an epoch as ISO 8601
+PING_FIELDS = [('timestamp', 'float64', '.6f'), ('delay', 'float64', '.6f')]
+CLIENT_FIELDS = [('client', 'int64', 'd'), ('connection_time', 'float64', '.4f'),
+                 ('start_offset', 'float64', '.4f'), ('status', 'string', 's')]
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def series_path(base):
+    """base + '.parquet' when pyarrow is installed, else base + '.csv'"""
+    return base + (PARQUET if parquet_available() else CSV)
+
+
+def is_parquet(path):
+    return bool(path) and path.endswith(PARQUET)
+
+
+def _format(value, fmt):
+    if value is None:
+        return ''
+    if fmt == 'iso':
+        return datetime.fromtimestamp(value).isoformat()
+    return format(value, fmt)
+
+
+class SeriesWriter:
+    """
+    Append rows to a series file, writing them out every flush_every rows
+    or flush_interval seconds: one Parquet row group per flush for a
+    .parquet path, buffered lines for a .csv path.  `fields` is a list of
+    (column, Arrow type, CSV format); rows are tuples in that order.
+    """
+
+    def __init__(self, path, fields, broker=None, csv_header=None,
+                 flush_every=1024, flush_interval=30.0):
+        self.path = path
+        self.fields = fields
+        self.broker = broker
+        self.csv_header = csv_header or ','.join(name for name, _, _ in fields)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._rows = []
+        self._last_flush = time.monotonic()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if is_parquet(path):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            self._schema = pa.schema(
+                [(name, pa.type_for_alias(kind)) for name, kind, _ in fields] +
+                [('broker', pa.dictionary(pa.int32(), pa.string()))]
+            )
+            self._writer = pq.ParquetWriter(path, self._schema)
+            self._file = None
+        else:
+            self._writer = None
+            self._file = open(path, 'w')
+            self._file.write(self.csv_header + '\n')
+            self._file.flush()
+
+    def append(self, *row):
+        self._rows.append(row)
+        if (len(self._rows) >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(*row)
+
+    def flush(self):
+        if self._rows and self._writer is not None:
+            import pyarrow as pa
+            columns = list(zip(*self._rows))
+            arrays = [pa.array(col, type=self._schema.field(i).type)
+                      for i, col in enumerate(columns)]
+            arrays.append(pa.array([self.broker] * len(self._rows)).dictionary_encode()
+                          .cast(self._schema.field('broker').type))
+            self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema),
+                                     row_group_size=len(self._rows))
+        elif self._rows:
+            self._file.write(''.join(
+                ','.join(_format(v, fmt) for v, (_, _, fmt) in zip(row, self.fields)) + '\n'
+                for row in self._rows
+            ))
+            self._file.flush()
+        self._rows.clear()
+        self._last_flush = time.monotonic()
+
+    def close(self, metrics=None):
+        """
+        Flush and close.  metrics, a list of (name, value), is stored in the
+        Parquet footer or written as a trailing Metric,Value block in CSV.
+        """
+        self.flush()
+        if self._writer is not None:
+            self._writer.add_key_value_metadata({
+                'fields': json.dumps(self.fields),
+                'csv_header': self.csv_header,
+                'metrics': json.dumps(metrics or []),
+            })
+            self._writer.close()
+        else:
+            if metrics:
+                self._file.write('\nMetric,Value\n')
+                self._file.write(''.join(f'{k},{v}\n' for k, v in metrics))
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def to_numpy(column):
+    """
+    A ChunkedArray as a NumPy array: a view of the Arrow buffer when it is
+    a single null-free chunk of a primitive type, otherwise a copy (nulls
+    in float columns become NaN).
+    """
+    import pyarrow as pa
+    if (column.num_chunks == 1 and column.null_count == 0
+            and pa.types.is_primitive(column.type)):
+        return column.chunk(0).to_numpy(zero_copy_only=True)
+    return column.to_numpy()
+
+
+def read_series(path, columns=None, start=None, end=None, broker=None, time_column='timestamp'):
+    """
+    {column: NumPy array} from a Parquet series file, or a directory of
+    them.  start/end bound time_column and broker keeps one broker's rows;
+    both are applied as predicates on the row-group statistics, so row
+    groups outside the window are skipped rather than decoded.
+    """
+    import pyarrow.parquet as pq
+    filters = []
+    if start is not None:
+        filters.append((time_column, '>=', start))
+    if end is not None:
+        filters.append((time_column, '<=', end))
+    if broker is not None:
+        filters.append(('broker', '=', broker))
+    table = pq.read_table(path, columns=columns, filters=filters or None, memory_map=True)
+    return {name: to_numpy(table.column(name)) for name in table.column_names}
+
+
+def read_metadata(path):
+    """The fields, CSV header and metrics stored in a series file's footer"""
+    import pyarrow.parquet as pq
+    meta = pq.read_metadata(path).metadata or {}
+    return {
+        'fields': json.loads(meta.get(b'fields', b'[]')),
+        'csv_header': meta.get(b'csv_header', b'').decode(),
+        'metrics': json.loads(meta.get(b'metrics', b'[]')),
+    }
+
+
+def read_metrics(path):
+    """{metric: value} stored with a series"""
+    return {k: str(v) for k, v in read_metadata(path)['metrics']}
+
+
+def to_csv(path):
+    """Yield a Parquet series as CSV text lines, in the layout the CSV writer produces."""
+    import pyarrow.parquet as pq
+    meta = read_metadata(path)
+    fields = meta['fields']
+    yield meta['csv_header'] + '\n'
+    parquet = pq.ParquetFile(path)
+    for batch in parquet.iter_batches(batch_size=65536, columns=[name for name, _, _ in fields]):
+        columns = [batch.column(i).to_pylist() for i in range(batch.num_columns)]
+        yield ''.join(
+            ','.join(_format(v, fmt) for v, (_, _, fmt) in zip(row, fields)) + '\n'
+            for row in zip(*columns)
+        )
+    if meta['metrics']:
+        yield '\nMetric,Value\n'
+        yield ''.join(f'{k},{v}\n' for k, v in meta['metrics'])
@@ -0,0 +1,131 @@
+"""
+Pre-warmed worker processes for evaluation steps.
+
+Starting `python script.py` for every step pays for the interpreter and
+the scripts' imports (asyncio, numpy, paho, pyarrow) each time, and
+leaves the app to pick live metrics out of the step's stdout.  StepPool
+keeps `size` idle evaluation_scripts/step_worker.py processes that have
+already done their imports.  start() hands a step to one of them and
+returns a Step: records() yields what the step reports as it happens,
+with an optional timeout, and terminate() cancels it.
+
+A worker runs one step and exits, and its replacement is started in the
+background straight away.  Idle workers exit with the app, when their
+stdin closes.
+"""
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+# Seconds between SIGTERM and SIGKILL when a step is cancelled
+TERMINATE_GRACE = 5.0
+
+
+class Step:
+    """One evaluation step running in a worker process."""
+
+    def __init__(self, proc):
+        self.proc = proc
+        self._queue = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.proc.stdout:
+            try:
+                self._queue.put(json.loads(line))
+            except ValueError:
+                self._queue.put(['line', line.rstrip('\n')])
+        self._queue.put(None)
+
+    def records(self, timeout=None):
+        """
+        Yield (kind, value) records until the step ends with ('exit',
+        status).  A step still running after `timeout` seconds is
+        terminated and ends with ('timeout', timeout) instead.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                record = self._queue.get(
+                    timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                self.terminate()
+                yield 'timeout', timeout
+                return
+            if record is None:
+                # Killed before it could report, e.g. by SIGKILL
+                yield 'exit', self.proc.wait()
+                return
+            kind, value = record
+            yield kind, value
+            if kind == 'exit':
+                self.proc.wait()
+                return
+
+    def terminate(self):
+        """Cancel the step: SIGTERM now, SIGKILL if it is still running TERMINATE_GRACE s later"""
+        if self.proc.poll() is None:
+            self.proc.terminate()
+            timer = threading.Timer(TERMINATE_GRACE, self._kill)
+            timer.daemon = True
+            timer.start()
+
+    def _kill(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+
+
+class StepPool:
+    """Idle, pre-imported step workers, started on first use."""
+
+    def __init__(self, scripts_dir, size=2):
+        self.worker = os.path.join(scripts_dir, 'step_worker.py')
+        self.size = size
+        self._idle = deque()
+        self._starting = 0
+        self._lock = threading.Lock()
+
+    def _spawn(self):
+        env = os.environ.copy()
+        env['PYTHONIOENCODING'] = 'utf-8'
+        env['PYTHONUTF8'] = '1'
+        return subprocess.Popen([sys.executable, '-u', self.worker], env=env,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                text=True, encoding='utf-8')
+
+    def _refill(self):
+        while True:
+            with self._lock:
+                if len(self._idle) + self._starting >= self.size:
+                    return
+                self._starting += 1
+            proc = self._spawn()
+            with self._lock:
+                self._starting -= 1
+                self._idle.append(proc)
+
+    def start(self, script, args):
+        """Run evaluation script `script` with command-line args in a warm worker; returns its Step"""
+        with self._lock:
+            idle = [proc for proc in self._idle if proc.poll() is None]
+            self._idle.clear()
+            proc = idle.pop(0) if idle else None
+            self._idle.extend(idle)
+        threading.Thread(target=self._refill, daemon=True).start()
+        for attempt in range(2):
+            if proc is None:
+                proc = self._spawn()  # none warm yet
+            try:
+                proc.stdin.write(json.dumps([script, *args]) + '\n')
+                proc.stdin.close()
+                return Step(proc)
+            except OSError:
+                # The worker died while idle
+                proc = None
+        raise RuntimeError(f"could not start a worker for {script}")
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The app's modules live at the repository root and the evaluation
+# scripts import each other from evaluation_scripts/; neither is a package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'evaluation_scripts'))
+sys.path.insert(0, ROOT)
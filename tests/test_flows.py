@@ -0,0 +1,168 @@
+import copy
+
+import pytest
+
+from flows import build_simulation, deploy_tabs, plan_deploy
+
+BASE = 'http://nodered:1880'
+
+SPEC = {
+    'broker_name': 'mosquitto',
+    'broker_port': 1883,
+    'interval': 1,
+    'publishers': [
+        {'name': 'Temp', 'topic': 'sensors/temp', 'min': 10, 'max': 30, 'random': True},
+        {'name': 'Hum', 'topic': 'sensors/hum', 'min': 40, 'max': 60, 'random': True},
+    ],
+    'subscribers': [
+        {'name': 'Temp', 'topic': 'sensors/temp', 'unit': '°C'},
+    ],
+}
+
+# A hand-made flow that is not ours and must never be touched
+OTHER = [
+    {'id': 'user-tab', 'type': 'tab', 'label': 'Flow 1', 'info': ''},
+    {'id': 'user-inject', 'type': 'inject', 'z': 'user-tab', 'wires': [[]]},
+]
+
+
+class Response:
+    def __init__(self, status=200, body=None):
+        self.status_code = status
+        self.body = body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f'HTTP {self.status_code}')
+
+    def json(self):
+        return self.body
+
+
+class StubAdminAPI:
+    """
+    A requests-like session over an in-memory Node-RED admin API: GET
+    /flows lists every tab and node, POST /flow, PUT /flow/<id> and DELETE
+    /flow/<id> change one tab.  Every call is recorded.
+    """
+
+    def __init__(self, flows):
+        self.flows = copy.deepcopy(flows)
+        self.calls = []
+
+    def _tab(self, body):
+        tab = {k: v for k, v in body.items() if k not in ('nodes', 'configs')}
+        return [dict(tab, type='tab')] + [
+            dict(n, z=body['id']) for n in body.get('nodes', []) + body.get('configs', [])]
+
+    def _remove(self, tab_id):
+        before = len(self.flows)
+        self.flows = [n for n in self.flows if n['id'] != tab_id and n.get('z') != tab_id]
+        return len(self.flows) != before
+
+    def get(self, url):
+        self.calls.append(('GET', url))
+        assert url == f'{BASE}/flows'
+        return Response(body=copy.deepcopy(self.flows))
+
+    def post(self, url, json):
+        self.calls.append(('POST', url))
+        assert url == f'{BASE}/flow'
+        if any(n['id'] == json['id'] for n in self.flows):
+            return Response(400)
+        self.flows += self._tab(json)
+        return Response(body={'id': json['id']})
+
+    def put(self, url, json):
+        self.calls.append(('PUT', url))
+        if not self._remove(url.rsplit('/', 1)[1]):
+            return Response(404)
+        self.flows += self._tab(json)
+        return Response(body={'id': json['id']})
+
+    def delete(self, url):
+        self.calls.append(('DELETE', url))
+        return Response(204 if self._remove(url.rsplit('/', 1)[1]) else 404)
+
+    def changes(self):
+        return [call for call in self.calls if call[0] != 'GET']
+
+
+def deployed(spec, extra=()):
+    """A flow list with spec's tabs running, plus `extra` nodes"""
+    api = StubAdminAPI(list(extra))
+    deploy_tabs(BASE, build_simulation(spec), session=api)
+    return api.flows
+
+
+def touched(api, ids):
+    return [call for call in api.changes() if call[1].rsplit('/', 1)[1] in ids]
+
+
+def test_fresh_deploy_posts_every_tab():
+    api = StubAdminAPI(OTHER)
+    tabs = build_simulation(SPEC)
+
+    summary = deploy_tabs(BASE, tabs, session=api)
+
+    assert summary['created'] == [t['id'] for t in tabs]
+    assert api.changes() == [('POST', f'{BASE}/flow')] * 2
+    assert plan_deploy(tabs, api.flows)[3] == [t['id'] for t in tabs]
+
+
+def test_unchanged_spec_writes_nothing():
+    api = StubAdminAPI(deployed(SPEC, OTHER))
+    tabs = build_simulation(SPEC)
+
+    summary = deploy_tabs(BASE, tabs, session=api)
+
+    assert api.changes() == []
+    assert summary == {'created': [], 'updated': [], 'deleted': [],
+                       'unchanged': [t['id'] for t in tabs]}
+
+
+@pytest.mark.parametrize('change', [
+    lambda spec: spec['publishers'][0].update(topic='sensors/temperature'),
+    lambda spec: spec['publishers'][1].update(max=80),
+    lambda spec: spec.update(interval=5),
+])
+def test_changed_publisher_puts_only_its_tab(change):
+    spec = copy.deepcopy(SPEC)
+    change(spec)
+    api = StubAdminAPI(deployed(SPEC, OTHER))
+    pub, sub = build_simulation(spec)
+
+    summary = deploy_tabs(BASE, [pub, sub], session=api)
+
+    assert api.changes() == [('PUT', f"{BASE}/flow/{pub['id']}")]
+    assert summary['updated'] == [pub['id']]
+    assert summary['unchanged'] == [sub['id']]
+    assert plan_deploy([pub, sub], api.flows)[3] == [pub['id'], sub['id']]
+
+
+def test_stale_sim_tabs_are_deleted():
+    stale = [
+        {'id': 'old-sim-tab', 'type': 'tab', 'label': 'Sim-pub-0ld000', 'info': 'sim-hash:x'},
+        {'id': 'old-sim-node', 'type': 'inject', 'z': 'old-sim-tab', 'wires': [[]]},
+    ]
+    api = StubAdminAPI(deployed(SPEC, OTHER) + stale)
+
+    summary = deploy_tabs(BASE, build_simulation(SPEC), session=api)
+
+    assert api.changes() == [('DELETE', f'{BASE}/flow/old-sim-tab')]
+    assert summary['deleted'] == ['old-sim-tab']
+    assert not any(n['id'].startswith('old-sim') for n in api.flows)
+
+
+def test_other_flows_are_never_touched():
+    spec = copy.deepcopy(SPEC)
+    spec['publishers'].pop()
+    stale = [{'id': 'old-sim-tab', 'type': 'tab', 'label': 'Sim-sub-0ld000'}]
+    api = StubAdminAPI(OTHER + stale)
+
+    for tabs in (build_simulation(SPEC), build_simulation(spec), []):
+        deploy_tabs(BASE, tabs, session=api)
+
+    assert touched(api, {n['id'] for n in OTHER}) == []
+    assert [n for n in api.flows if n['id'] in ('user-tab', 'user-inject')] == OTHER
+    assert not any(n.get('label', '').startswith('Sim-') for n in api.flows)
@@ -0,0 +1,137 @@
+import os
+import time
+
+import pytest
+
+import monitoring
+from monitoring import CgroupSampler, MonitoringService
+
+CONTAINER = 'abc123' * 4
+PID = 4242
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """A fake cgroup v2 directory for CONTAINER and a fake /proc for its one process"""
+    cgroup_root, proc_root = tmp_path / 'cgroup', tmp_path / 'proc'
+    cg = cgroup_root / f'system.slice/docker-{CONTAINER}.scope'
+    write(cg / 'cpu.stat', 'usage_usec 1000000\nuser_usec 600000\nsystem_usec 400000\n')
+    write(cg / 'memory.current', '52428800\n')
+    write(cg / 'memory.max', '104857600\n')
+    write(cg / 'io.stat', '8:0 rbytes=4096 wbytes=8192 rios=1 wios=2\n'
+                          '8:16 rbytes=1024 wbytes=0 rios=1 wios=0\n')
+    write(cg / 'cgroup.procs', f'{PID}\n')
+    write(proc_root / str(PID) / 'net/dev',
+          'Inter-|   Receive\n'
+          ' face |bytes    packets errs drop fifo frame compressed multicast|bytes\n'
+          '    lo:  999 1 0 0 0 0 0 0  999 1 0 0 0 0 0 0\n'
+          '  eth0: 1500 10 0 0 0 0 0 0 2500 20 0 0 0 0 0 0\n')
+    for fd in range(3):
+        write(proc_root / str(PID) / 'fd' / str(fd), '')
+    write(proc_root / 'meminfo', 'MemTotal:       16384000 kB\n')
+    return cgroup_root, proc_root, cg
+
+
+def sampler(tree):
+    cgroup_root, proc_root, _ = tree
+    return CgroupSampler(CONTAINER, str(cgroup_root), str(proc_root), cpu_count=2)
+
+
+def test_sample_parses_every_file(tree):
+    s = sampler(tree).sample()
+    assert s['cpu_percent'] == 0.0  # no previous sample to take a delta against
+    assert s['mem_usage'] == 52428800
+    assert s['mem_limit'] == 104857600
+    assert (s['block_read'], s['block_write']) == (5120, 8192)
+    assert (s['net_rx'], s['net_tx']) == (1500, 2500)  # loopback excluded
+    assert s['open_fds'] == 3
+
+
+def test_cpu_percent_is_the_delta_between_samples(tree, monkeypatch):
+    clock = iter([100.0, 101.0])
+    monkeypatch.setattr(monitoring.time, 'monotonic', lambda: next(clock))
+    smp = sampler(tree)
+    smp.sample()
+    write(tree[2] / 'cpu.stat', 'usage_usec 1500000\n')
+    # 0.5 s of CPU over 1 s of wall time on 2 CPUs
+    assert smp.sample()['cpu_percent'] == pytest.approx(25.0)
+
+
+def test_unlimited_memory_falls_back_to_host_total(tree):
+    write(tree[2] / 'memory.max', 'max\n')
+    assert sampler(tree).sample()['mem_limit'] == 16384000 * 1024
+
+
+def test_missing_optional_files_read_as_zero(tree):
+    _, proc_root, cg = tree
+    os.remove(cg / 'io.stat')
+    os.remove(proc_root / str(PID) / 'net/dev')
+    s = sampler(tree).sample()
+    assert (s['block_read'], s['block_write'], s['net_rx'], s['net_tx']) == (0, 0, 0, 0)
+
+
+def test_missing_required_file_raises(tree):
+    os.remove(tree[2] / 'memory.current')
+    with pytest.raises(FileNotFoundError):
+        sampler(tree).sample()
+
+
+def test_unknown_container_raises(tree):
+    cgroup_root, proc_root, _ = tree
+    with pytest.raises(FileNotFoundError):
+        CgroupSampler('f' * 24, str(cgroup_root), str(proc_root))
+
+
+class FakeSampler:
+    def __init__(self, backend, delay=0.0):
+        self.backend = backend
+        self.delay = delay
+
+    def sample(self):
+        time.sleep(self.delay)
+        return dict.fromkeys(monitoring.SAMPLE_FIELDS, 0)
+
+
+class FakeRecorder:
+    def __init__(self, path):
+        self.path = path
+        self.stamps = []
+
+    def append(self, timestamp, sample):
+        self.stamps.append(timestamp)
+
+    def close(self):
+        pass
+
+
+def test_series_at_one_rate_share_timestamps(monkeypatch):
+    samplers = {'a': FakeSampler('cgroup'), 'b': FakeSampler('cgroup'),
+                'slow': FakeSampler('cgroup'), 'docker': FakeSampler('docker', delay=0.05)}
+    recorders = {}
+    monkeypatch.setattr(monitoring, 'make_sampler', lambda cid, backend, *a, **kw: samplers[cid])
+    monkeypatch.setattr(monitoring, 'ResourceRecorder',
+                        lambda path: recorders.setdefault(path, FakeRecorder(path)))
+    service = MonitoringService()
+    service._docker = object()  # never used by the fake samplers
+
+    service.add('a', 'a', 'a', 'cgroup', sample_hz=20)
+    time.sleep(0.13)  # off the 20 Hz grid
+    service.add('b', 'b', 'b', 'cgroup', sample_hz=20)
+    service.add('slow', 'slow', 'slow', 'cgroup', sample_hz=5)
+    service.add('docker', 'docker', 'docker', 'docker', sample_hz=5)
+    time.sleep(0.6)
+    for key in list(service.keys()):
+        service.remove(key)
+
+    a, b, slow, docker = (recorders[k].stamps for k in ('a', 'b', 'slow', 'docker'))
+    assert len(b) >= 8 and len(slow) >= 2
+    assert set(b) <= set(a)
+    # Slower series land on the same instants, whichever thread samples them
+    assert slow[:2] == docker[:2]
+    assert set(slow) <= set(a)
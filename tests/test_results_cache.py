@@ -0,0 +1,98 @@
+import threading
+
+from results_cache import ResultsCache, read_csv_lines
+
+
+def write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def test_slow_parse_does_not_block_other_files(tmp_path):
+    slow, fast = tmp_path / 'slow.csv', tmp_path / 'fast.csv'
+    write(slow, 'a\n')
+    write(fast, 'b\n')
+    started, finish = threading.Event(), threading.Event()
+
+    def parse_slowly(path):
+        started.set()
+        finish.wait(5)
+        return 'slow'
+
+    cache = ResultsCache()
+    worker = threading.Thread(target=cache.load, args=(str(slow), parse_slowly))
+    worker.start()
+    assert started.wait(5)
+    try:
+        assert cache.load(str(fast), lambda path: 'fast') == 'fast'
+    finally:
+        finish.set()
+        worker.join()
+    assert cache.load(str(slow), parse_slowly) == 'slow'
+
+
+def test_concurrent_loads_of_one_file_parse_it_once(tmp_path):
+    path = tmp_path / 'run.csv'
+    write(path, 'a\n')
+    calls, release = [], threading.Event()
+
+    def parse(p):
+        calls.append(p)
+        release.wait(5)
+        return len(calls)
+
+    cache = ResultsCache()
+    values = []
+    threads = [threading.Thread(target=lambda: values.append(cache.load(str(path), parse)))
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    release.set()
+    for t in threads:
+        t.join()
+    assert calls == [str(path)]
+    assert values == [1] * 4
+
+
+def test_corrupt_file_reads_as_default_with_an_error(tmp_path):
+    path = tmp_path / 'run.csv'
+    write(path, 'not a number\n')
+    calls = []
+
+    def parse(p):
+        calls.append(p)
+        with open(p) as f:
+            return float(f.read())
+
+    cache = ResultsCache()
+    assert cache.load(str(path), parse, default=0.0) == 0.0
+    assert cache.load(str(path), parse, default=0.0) == 0.0
+    assert len(calls) == 1  # not parsed again until the file changes
+    assert cache.error(str(path)).startswith('ValueError')
+
+    write(path, '2.5')
+    assert cache.load(str(path), parse, default=0.0) == 2.5
+    assert cache.error(str(path)) is None
+
+
+def test_appended_file_keeps_rows_read_before_an_error(tmp_path):
+    path = tmp_path / 'ping.csv'
+    write(path, 'a,1\n')
+    broken = []
+
+    def read_from(p, offset):
+        if broken:
+            raise OSError('disk error')
+        return read_csv_lines(p, offset)
+
+    cache = ResultsCache()
+    assert cache.load_appended(str(path), read_from, []) == [['a', '1']]
+
+    with open(path, 'a') as f:
+        f.write('b,2\n')
+    broken.append(True)
+    assert cache.load_appended(str(path), read_from, []) == [['a', '1']]
+    assert cache.error(str(path)) == 'OSError: disk error'
+
+    broken.clear()
+    assert cache.load_appended(str(path), read_from, []) == [['a', '1'], ['b', '2']]
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from mqtt_async import PUBLISH, MQTTClient, parse_publish, read_packet
+from throughput_test import HEADER, publisher
+
+PAYLOAD_SIZE = 256
+
+
+class HoldingWriter:
+    """
+    A StreamWriter whose transport never sends: like a backed-up selector
+    transport on Python 3.12+, it keeps the objects it is given rather
+    than copies, so a caller that changes them later corrupts the stream.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    async def drain(self):
+        pass
+
+    def stream(self):
+        return b''.join(self.chunks)
+
+
+async def published(writer):
+    reader = asyncio.StreamReader()
+    reader.feed_data(writer.stream())
+    reader.feed_eof()
+    payloads = []
+    while not reader.at_eof():
+        ptype, flags, body = await read_packet(reader)
+        assert ptype == PUBLISH
+        payloads.append(parse_publish(flags, body)[3])
+    return payloads
+
+
+@pytest.mark.parametrize('pub_id', [0, 7])
+def test_queued_publishes_keep_their_own_header(pub_id):
+    client = MQTTClient('pub')
+    client._writer = HoldingWriter()
+
+    async def run():
+        sent, failed = await publisher(client, pub_id, 'bench', 0, None, 0.05, PAYLOAD_SIZE, 1)
+        return sent, failed, await published(client._writer)
+
+    sent, failed, payloads = asyncio.run(run())
+
+    assert sent > 1 and failed == 0
+    assert [HEADER.unpack_from(p)[:2] for p in payloads] == [(pub_id, seq) for seq in range(sent)]
+    assert all(len(p) == PAYLOAD_SIZE for p in payloads)